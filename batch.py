@@ -0,0 +1,194 @@
+"""Process a directory (or manifest) of match videos across a process pool
+
+    python batch.py input_videos/ --output batch_output/
+    python batch.py fixtures.txt --output batch_output/ --memory-budget-mb 3000
+
+A manifest is a text file with one video path per line (# for comments)
+or a JSON list of paths. Each video gets its own output directory with the
+annotated video, a player statistics CSV, its tracks and performance
+metrics. Videos whose outputs are already complete are skipped, so an
+interrupted overnight run can simply be restarted.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi')
+
+def find_videos(source):
+    """Video paths from a directory or a manifest file"""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(path) for path in source.iterdir() if path.suffix.lower() in VIDEO_EXTENSIONS)
+    text = source.read_text()
+    if source.suffix.lower() == '.json':
+        paths = json.loads(text)
+    else:
+        paths = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+    # Manifest entries are relative to the manifest
+    return [str(source.parent / path) if not os.path.isabs(path) else path for path in paths]
+
+def video_output_dir(output_dir, video_path):
+    return os.path.join(output_dir, Path(video_path).stem)
+
+def check_unique_stems(videos):
+    """Raise if two videos would share an output directory (e.g. a/match.mp4 and b/match.mp4)"""
+    by_stem = {}
+    for video in videos:
+        by_stem.setdefault(Path(video).stem, []).append(video)
+    duplicates = {stem: paths for stem, paths in by_stem.items() if len(paths) > 1}
+    if duplicates:
+        raise ValueError("Videos with the same file name would share an output directory: "
+                         + '; '.join(', '.join(paths) for paths in duplicates.values()))
+
+def source_fingerprint(video_path):
+    stat = os.stat(video_path)
+    return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+def is_complete(output_dir, video_path):
+    """True when a previous run finished this exact video"""
+    done_path = os.path.join(video_output_dir(output_dir, video_path), 'done.json')
+    try:
+        with open(done_path) as f:
+            return json.load(f)['source'] == source_fingerprint(video_path)
+    except (OSError, ValueError, KeyError):
+        return False
+
+def default_num_workers(memory_budget_mb, requested=None):
+    """Worker count limited by CPUs and by how many memory budgets fit in RAM"""
+    num_workers = requested or os.cpu_count() or 1
+    try:
+        total_mb = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 2
+        num_workers = min(num_workers, max(1, int(total_mb // memory_budget_mb)))
+    except (ValueError, OSError, AttributeError):
+        pass
+    return num_workers
+
+def _init_worker(memory_budget_mb, enforce):
+    if enforce:
+        import resource
+        limit = int(memory_budget_mb * 1024 ** 2)
+        # Address space limit: the worker gets a MemoryError instead of the OOM killer taking the machine
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def process_one(video_path, output_dir, num_threads, memory_budget_mb):
+    """Process one video in a worker and return its summary row"""
+    from main import process_match
+    from performance_tracker import PerformanceTracker, peak_rss_mb
+
+    out_dir = video_output_dir(output_dir, video_path)
+    os.makedirs(out_dir, exist_ok=True)
+    perf_tracker = PerformanceTracker(csv_file=os.path.join(out_dir, 'performance_metrics.csv'),
+                                      json_file=os.path.join(out_dir, 'performance_metrics.json'))
+    summary = {'video': video_path, 'status': 'ok', 'error': None}
+    try:
+        process_match(video_path, os.path.join(out_dir, 'output_video.mp4'), perf_tracker,
+                      tracks_path=os.path.join(out_dir, 'tracks'),
+                      stats_csv_path=os.path.join(out_dir, 'player_statistics.csv'),
+                      num_threads=num_threads, flow_workers=1)
+    except Exception as e:
+        summary.update(status='failed', error=f"{type(e).__name__}: {e}")
+        traceback.print_exc()
+    finally:
+        perf_tracker.record_metrics()
+
+    report = perf_tracker.report()
+    summary.update(total_time=report['total_time'], peak_rss_mb=peak_rss_mb(), **report['sections'])
+    summary['over_memory_budget'] = bool(summary['peak_rss_mb'] and summary['peak_rss_mb'] > memory_budget_mb)
+    if summary['status'] == 'ok':
+        # Written last: only a finished video counts as complete
+        with open(os.path.join(out_dir, 'done.json'), 'w') as f:
+            json.dump({'source': source_fingerprint(video_path), 'summary': summary}, f, indent=2)
+    return summary
+
+def run_batch(videos, output_dir, num_workers=None, memory_budget_mb=4096, enforce_memory=False, force=False):
+    """Process videos on a process pool and write the aggregate report"""
+    check_unique_stems(videos)
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [video for video in videos if force or not is_complete(output_dir, video)]
+    skipped = len(videos) - len(pending)
+    num_workers = min(default_num_workers(memory_budget_mb, num_workers), max(len(pending), 1))
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    print(f"{len(pending)} videos to process ({skipped} already complete) "
+          f"on {num_workers} workers x {num_threads} threads, {memory_budget_mb} MB each")
+
+    pool_options = {}
+    if sys.version_info >= (3, 11):
+        # A fresh process per video returns its memory to the system
+        pool_options = {'max_tasks_per_child': 1, 'mp_context': multiprocessing.get_context('spawn')}
+
+    start_time = time.time()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                             initargs=(memory_budget_mb, enforce_memory), **pool_options) as pool:
+        futures = {pool.submit(process_one, video, output_dir, num_threads, memory_budget_mb): video
+                   for video in pending}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed for memory)
+                summary = {'video': futures[future], 'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+            summaries.append(summary)
+            print(f"[{len(summaries)}/{len(pending)}] {summary['video']}: {summary['status']}"
+                  + (f" ({summary['error']})" if summary['error'] else ''))
+
+    # Keep completed videos from earlier runs in the report
+    for video in videos:
+        if video not in pending:
+            with open(os.path.join(video_output_dir(output_dir, video), 'done.json')) as f:
+                summaries.append(dict(json.load(f)['summary'], status='skipped'))
+    summaries.sort(key=lambda summary: videos.index(summary['video']))
+    write_report(output_dir, summaries, {
+        'videos': len(videos), 'skipped': skipped, 'workers': num_workers, 'threads_per_worker': num_threads,
+        'memory_budget_mb': memory_budget_mb, 'total_time': round(time.time() - start_time, 2),
+    })
+    return summaries
+
+def write_report(output_dir, summaries, batch_info):
+    """Aggregate batch_report.json and batch_report.csv (one row per processed video)"""
+    with open(os.path.join(output_dir, 'batch_report.json'), 'w') as f:
+        json.dump({'batch': batch_info, 'videos': summaries}, f, indent=2)
+
+    fieldnames = list(dict.fromkeys(key for summary in summaries for key in summary))
+    with open(os.path.join(output_dir, 'batch_report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summaries)
+    ok = sum(summary['status'] == 'ok' for summary in summaries)
+    failed = sum(summary['status'] == 'failed' for summary in summaries)
+    print(f"Batch finished in {batch_info['total_time']}s: {ok} ok, {failed} failed, "
+          f"{batch_info['skipped']} skipped. Report: {os.path.join(output_dir, 'batch_report.json')}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='Directory of videos or manifest file')
+    parser.add_argument('--output', default='batch_output')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPUs, limited by memory)')
+    parser.add_argument('--memory-budget-mb', type=float, default=4096, help='Memory budget per worker')
+    parser.add_argument('--enforce-memory', action='store_true',
+                        help='Hard-limit each worker to its budget (it fails instead of swapping)')
+    parser.add_argument('--force', action='store_true', help='Reprocess videos that are already complete')
+    args = parser.parse_args()
+
+    videos = find_videos(args.source)
+    if not videos:
+        print(f"No videos found in {args.source}")
+        return 1
+    try:
+        check_unique_stems(videos)
+    except ValueError as e:
+        print(e)
+        return 1
+    summaries = run_batch(videos, args.output, args.workers, args.memory_budget_mb, args.enforce_memory, args.force)
+    return 1 if any(summary['status'] == 'failed' for summary in summaries) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""Benchmark the pipeline stages on a synthetic match
+
+Generates a seeded synthetic video (grass texture, camera pan, players in
+two jersey colours plus referees) and the matching TrackStore, times each
+stage in isolation, and Tracker.process_video with the settings main.py
+uses, then compares the medians with a stored baseline.
+Correctness checks of the optimisations (see run_checks) run as well and
+fail the run like a regression does:
+
+    python benchmark.py --save-baseline          # record a baseline
+    python benchmark.py                          # compare, exit 1 on regression
+    python benchmark.py --frames 300 --players 30 --threshold 0.1
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import supervision as sv
+from utils import save_video
+from trackers.camera_motion import CameraMotionEstimator
+from trackers.optical_flow import to_gray
+from trackers.team_assignment import TeamClassifier
+from trackers.perspective_transform import PerspectiveTransformer
+from trackers.speed_distance import calculate_speed_and_distance
+from trackers.renderer import AnnotationRenderer
+from trackers.detectors import Detector
+from trackers.realtime import RealtimeProcessor
+from trackers.tracker import Tracker
+from trackers.pitch_region import PitchRegion
+from trackers.track_store import TrackStore
+from player_statistics import analyze_consecutive_players
+
+JERSEY_COLORS = [(200, 40, 40), (40, 40, 200), (20, 220, 240)]  # Team A, team B, referee (BGR)
+
+def synthetic_match(num_frames=120, width=960, height=540, num_players=22, num_refs=1, seed=0):
+    """Synthetic frames and the TrackStore of the players drawn on them
+
+    Players wander across a textured pitch while the camera pans, so
+    flow, team colours and speeds all have realistic work to do.
+    """
+    rng = np.random.default_rng(seed)
+    pan = 2 * num_frames
+    texture = rng.integers(0, 40, (height, width + pan), dtype=np.uint8)
+    pitch = np.stack([texture + 30, texture + 110, texture + 30], axis=2).astype(np.uint8)
+
+    num_objects = num_players + num_refs
+    box_w, box_h = max(width // 40, 8), max(height // 12, 16)
+    start = rng.random((num_objects, 2)) * [width - box_w, height - box_h]
+    step = rng.normal(0, 1.5, (num_objects, 2))
+    colors = [JERSEY_COLORS[i % 2] for i in range(num_players)] + [JERSEY_COLORS[2]] * num_refs
+    class_ids = np.r_[np.zeros(num_players, dtype=int), np.ones(num_refs, dtype=int)]
+
+    frames, tracks = [], TrackStore()
+    for frame_num in range(num_frames):
+        offset = 2 * frame_num
+        frame = pitch[:, offset:offset + width].copy()
+        positions = np.clip(start + step * frame_num, 0, [width - box_w, height - box_h]).astype(int)
+        for (x, y), color in zip(positions, colors):
+            frame[y:y + box_h // 2, x:x + box_w] = color
+            frame[y + box_h // 2:y + box_h, x:x + box_w] = (30, 30, 30)
+        frames.append(frame)
+        bboxes = np.c_[positions, positions + [box_w, box_h]]
+        tracks.append_frame(bboxes, np.arange(1, num_objects + 1), class_ids)
+    tracks.consolidate()
+    return frames, tracks
+
+class SyntheticDetector(Detector):
+    """Stand-in detector returning the synthetic match's boxes, one frame per call"""
+    class_names = {0: 'Player', 1: 'ref'}
+
+    def __init__(self, tracks, scale_factor):
+        self.tracks = tracks
+        self.scale_factor = scale_factor
+        self.frame_num = 0
+
+    def predict(self, frames):
+        results = []
+        for _ in frames:
+            rows = self.tracks.frame_rows(self.frame_num)
+            self.frame_num += 1
+            results.append(sv.Detections(xyxy=(self.tracks.row_bboxes(rows) * self.scale_factor).astype(np.float32),
+                                         confidence=np.ones(len(rows), dtype=np.float32),
+                                         class_id=self.tracks.class_id[rows].astype(int)))
+        return results
+
+def time_stage(function, repeat):
+    """Median and min wall time of function() over repeat runs"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'median_s': float(np.median(times)), 'min_s': float(np.min(times))}
+
+def run_benchmarks(num_frames=120, width=960, height=540, num_players=22, repeat=3, seed=0):
+    frames, tracks = synthetic_match(num_frames, width, height, num_players, seed=seed)
+
+    transformer = PerspectiveTransformer()
+    transformer.set_field_corners(frames[0], [(width * 0.1, height * 0.2), (width * 0.9, height * 0.2),
+                                              (width * 0.1, height * 0.9), (width * 0.9, height * 0.9)])
+    classifier = TeamClassifier()
+    renderer = AnnotationRenderer()
+    # Flow, camera motion, team sampling and speed as main.py runs them (process_video defaults)
+    tracker = Tracker('synthetic', scale_factor=0.5, backend=SyntheticDetector(tracks, 0.5))
+    camera_motion_estimator = CameraMotionEstimator()
+    output_dir = tempfile.mkdtemp(prefix='benchmark_')
+
+    def team_assignment():
+        classifier.reset()
+        for frame_num, frame in enumerate(frames):
+            classifier.add_frame(frame, tracks, frame_num)
+        tracks.map_track_values('team', classifier.fit())
+
+    def camera_motion():
+        camera_motion_estimator.reset()
+        for frame_num, frame in enumerate(frames):
+            boxes = tracks.row_bboxes(tracks.frame_rows(frame_num, 'Player')) * 0.5
+            camera_motion_estimator.update(to_gray(cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)), boxes)
+
+    stages = {
+        'camera_motion': camera_motion,
+        'process_video': lambda: tracker.process_video(iter(frames), tracks, frame_rate=30.0),
+        'team_assignment': team_assignment,
+        'speed_distance': lambda: calculate_speed_and_distance(tracks, transformer, frame_rate=30.0),
+        'draw_annotations': lambda: list(renderer.iter_render((frame.copy() for frame in frames), tracks)),
+        'save_video': lambda: save_video(frames, os.path.join(output_dir, 'benchmark.mp4'), fps=30),
+        'player_statistics': lambda: analyze_consecutive_players(tracks, min_seconds=1, fps=30),
+    }
+
+    results = {}
+    try:
+        for name, function in stages.items():
+            results[name] = time_stage(function, repeat)
+            results[name]['per_frame_ms'] = round(results[name]['median_s'] / num_frames * 1000, 3)
+            print(f"{name:<20} {results[name]['median_s'] * 1000:9.1f} ms  ({results[name]['per_frame_ms']:.2f} ms/frame)")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    config = {'frames': num_frames, 'width': width, 'height': height, 'players': num_players,
+              'repeat': repeat, 'seed': seed}
+    return {'config': config, 'stages': results}
+
+def check_pitch_crop(frames, scale_factor=0.5, input_size=640):
+    """Whether the pitch crop gives players more detector pixels than the downscaled frame
+
+    A stand-in detector records the letterbox ratio of every image it is
+    given, as the ONNX detector would resize it to input_size. Ratios are
+    compared in detector pixels per full-size frame pixel.
+    """
+    ratios = []
+
+    def record(images):
+        ratios.extend(min(input_size / image.shape[0], input_size / image.shape[1]) for image in images)
+        return [sv.Detections.empty() for _ in images]
+
+    record([cv2.resize(frame, (0, 0), fx=scale_factor, fy=scale_factor) for frame in frames])
+    baseline = min(ratios) * scale_factor
+    ratios.clear()
+    PitchRegion().predict(frames, record)
+    cropped = min(ratios)
+    print(f"{'pitch_crop':<20} {cropped:.3f} vs {baseline:.3f} detector px per frame px "
+          f"({cropped / baseline:.2f}x)")
+    return cropped > baseline
+
+def check_frame_cache(frames, tracks, scale_factor=0.5):
+    """Whether RealtimeProcessor gets its detector input from the frame cache
+
+    Runs RealtimeProcessor without a pitch crop (realtime.py
+    --no-pitch-crop) and a stand-in detector. The grayscale frame for the
+    flow and camera motion is made from the downscaled frame, which the
+    detector then reuses, so at least half of the requests must be hits.
+    """
+    tracker = Tracker('synthetic', scale_factor=scale_factor, backend=SyntheticDetector(tracks, scale_factor))
+    processor = RealtimeProcessor(tracker, fps=30.0)
+    for frame_num, frame in enumerate(frames):
+        processor.process(frame_num, frame)
+    cache = tracker.frame_cache
+    print(f"{'frame_cache':<20} {cache.hits}/{cache.hits + cache.misses} hits "
+          f"({cache.hit_rate():.1%}) over {len(frames)} frames")
+    return cache.hit_rate() >= 0.5
+
+def run_checks(width=960, height=540, seed=0):
+    """Names of the failed correctness checks"""
+    frames, _ = synthetic_match(10, width, height, seed=seed)
+    checks = {
+        'pitch_crop': lambda: check_pitch_crop(frames),
+        'frame_cache': lambda: check_frame_cache(*synthetic_match(300, width // 2, height // 2, seed=seed)),
+    }
+    return [name for name, check in checks.items() if not check()]
+
+def compare_to_baseline(results, baseline, threshold=0.2, min_delta=0.005):
+    """Names of stages whose median got slower than baseline by more than threshold
+
+    Slowdowns below min_delta seconds are ignored, so millisecond-scale
+    stages do not fail on timer noise.
+    """
+    regressions = []
+    for name, stage in results['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        before, after = baseline['stages'][name]['median_s'], stage['median_s']
+        change = after / before - 1 if before > 0 else 0.0
+        regressed = change > threshold and after - before > min_delta
+        print(f"{name:<20} {before * 1000:9.1f} -> {after * 1000:9.1f} ms  {change:+7.1%}  "
+              f"{'REGRESSION' if regressed else 'ok'}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--width', type=int, default=960)
+    parser.add_argument('--height', type=int, default=540)
+    parser.add_argument('--players', type=int, default=22)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown per stage (0.2 = 20%%)')
+    parser.add_argument('--min-delta', type=float, default=0.005, help='Ignore slowdowns below this many seconds')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--output', help='Also write these results to a JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.frames, args.width, args.height, args.players, args.repeat, args.seed)
+    failed_checks = run_checks(args.width, args.height, args.seed)
+    if failed_checks:
+        print(f"Failed checks: {', '.join(failed_checks)}")
+        return 1
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['config'] != results['config']:
+        print(f"Baseline {args.baseline} was recorded with {baseline['config']}; "
+              f"rerun with the same options or save a new baseline")
+        return 2
+    regressions = compare_to_baseline(results, baseline, args.threshold, args.min_delta)
+    if regressions:
+        print(f"Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
 # conversion_script.py
-import coremltools as ct
 from ultralytics import YOLO
 
 # Load original PyTorch model
 model = YOLO('models/model.pt')
 
-# Export to Core ML format
-model.export(format='coreml')  # This creates 'best(4).mlmodel'
+# Export to ONNX for the CPU ONNX Runtime backend (creates 'models/model.onnx')
+model.export(format='onnx', dynamic=True)
+
+# Export to Core ML format for MacBooks (creates 'models/model.mlpackage')
+model.export(format='coreml')
@@ -0,0 +1,291 @@
+"""Rerun only the stages affected by a parameter change
+
+    python incremental.py input_videos/input_video.mp4 --output output_videos/output_video.mp4
+    python incremental.py input_videos/input_video.mp4 --set min_seconds=3      # stats only
+    python incremental.py input_videos/input_video.mp4 --output output_videos/output_video.mp4 --set alpha=0.5   # render only
+    python incremental.py input_videos/input_video.mp4 --set frame_skip=2 --set camera_motion_mode=flow
+
+The pipeline is a chain of explicit stages (tracks -> flow -> camera
+motion -> teams -> velocity/distance -> stats -> render). Each stage's
+artifact is cached on disk under a key of its parameters and of the keys
+of its inputs, so a run recomputes only the stages downstream of what
+changed. Stages that need decoded frames (flow, camera motion, teams)
+share one decoding pass.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+from utils import get_video_info, iter_video, save_video
+from trackers.camera_motion import CameraMotionEstimator
+from trackers.detection_cache import fingerprint_file, hash_file
+from trackers.optical_flow import calculate_optical_flow, calculate_player_flow, camera_motion_per_frame
+from trackers.perspective_transform import PerspectiveTransformer, default_field_corners
+from trackers.renderer import AnnotationRenderer
+from trackers.speed_distance import calculate_speed_and_distance
+from trackers.stage_cache import StageCache
+from trackers.team_assignment import TeamClassifier
+from trackers.track_store import TrackStore
+from player_statistics import analyze_consecutive_players, save_stats_to_csv
+
+DEFAULT_PARAMS = {
+    # tracks
+    'model_path': 'models/model.onnx', 'scale_factor': 0.5, 'backend': 'onnx', 'pitch_crop': True, 'detect_every': 1,
+    # flow and camera motion
+    'frame_skip': 3, 'flow_mode': 'players', 'camera_motion_mode': 'keyframes',
+    # teams
+    'n_teams': 2, 'sample_every': 10, 'samples_per_track': 5,
+    # velocity/distance (field_corners None = the predefined corners)
+    'field_corners': None, 'max_gap': 5,
+    # stats
+    'min_seconds': 2, 'sprint_speeds': [5.5, 7.0], 'min_sprint_seconds': 0.5, 'max_valid_speed': 12.5,
+    # render
+    'alpha': 0.7, 'font_scale': 0.6, 'font_thickness': 1, 'line_thickness': 3,
+}
+
+# Stage -> parameters its artifact depends on
+STAGE_PARAMS = {
+    'tracks': ('model_path', 'scale_factor', 'backend', 'pitch_crop', 'detect_every'),
+    'flow': ('frame_skip', 'flow_mode', 'scale_factor'),
+    'camera_motion': ('camera_motion_mode', 'scale_factor'),
+    'teams': ('n_teams', 'sample_every', 'samples_per_track'),
+    'velocity': ('field_corners', 'max_gap'),
+    'stats': ('min_seconds', 'sprint_speeds', 'min_sprint_seconds', 'max_valid_speed'),
+    'render': ('alpha', 'font_scale', 'font_thickness', 'line_thickness'),
+}
+
+# Stages whose computation decodes the video
+FRAME_STAGES = ('flow', 'camera_motion', 'teams')
+
+def stage_inputs(name, params):
+    """Stages the artifact of name is computed from"""
+    if name == 'tracks':
+        return ()
+    if name == 'camera_motion':
+        return ('tracks', 'flow') if params['camera_motion_mode'] == 'flow' else ('tracks',)
+    if name == 'velocity':
+        return ('tracks', 'camera_motion')
+    if name == 'stats':
+        return ('tracks', 'velocity')
+    if name == 'render':
+        return ('tracks', 'teams', 'velocity')
+    return ('tracks',)
+
+def needed_stages(targets, params):
+    """Targets and everything they depend on, in dependency order"""
+    order = []
+
+    def visit(name):
+        for input_name in stage_inputs(name, params):
+            visit(input_name)
+        if name not in order:
+            order.append(name)
+
+    for target in targets:
+        visit(target)
+    return order
+
+def stage_keys(stages, params, cache, video_path, fps):
+    """Cache key of every stage; the tracks key covers the video and model contents"""
+    keys = {}
+    for name in stages:
+        stage_params = {param: params[param] for param in STAGE_PARAMS[name]}
+        if name == 'tracks':
+            stage_params.update(video=fingerprint_file(video_path), model=hash_file(params['model_path']))
+        if name in ('velocity', 'stats'):
+            stage_params['fps'] = fps
+        keys[name] = cache.key(name, stage_params, [keys[input_name] for input_name in stage_inputs(name, params)])
+    return keys
+
+def compute_tracks(video_path, params):
+    from trackers import Tracker
+    tracker = Tracker(params['model_path'], scale_factor=params['scale_factor'], backend=params['backend'],
+                      detect_every=params['detect_every'], pitch_crop=params['pitch_crop'], num_threads=os.cpu_count())
+    return tracker.get_object_tracks(iter_video(video_path), cache=tracker.detection_cache(video_path))
+
+def compute_frame_stages(video_path, stale, tracks, params):
+    """Run the stale frame stages (flow, keyframe camera motion, teams) in one decoding pass"""
+    scale = params['scale_factor']
+    classifier = TeamClassifier(params['n_teams'], params['sample_every'], params['samples_per_track'])
+    estimator = CameraMotionEstimator()
+    track_camera = 'camera_motion' in stale and params['camera_motion_mode'] == 'keyframes'
+
+    def gray_stream():
+        for frame_num, frame in enumerate(iter_video(video_path)):
+            if 'teams' in stale:
+                classifier.add_frame(frame, tracks, frame_num)
+            gray = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=scale, fy=scale), cv2.COLOR_BGR2GRAY)
+            if track_camera:
+                boxes = None
+                if frame_num < tracks.num_frames:
+                    boxes = tracks.row_bboxes(tracks.frame_rows(frame_num, 'Player')) * scale
+                estimator.update(gray, boxes)
+            yield gray
+
+    results = {}
+    if 'flow' in stale:
+        if params['flow_mode'] == 'players':
+            results['flow'] = calculate_player_flow(gray_stream(), tracks, params['frame_skip'], scale=scale)
+        else:
+            results['flow'] = calculate_optical_flow(gray_stream(), params['frame_skip'])
+    else:
+        for _ in gray_stream():
+            pass
+
+    if track_camera:
+        results['camera_motion'] = estimator.camera_motion(tracks.num_frames) / scale
+    if 'teams' in stale:
+        results['teams'] = {'track_teams': classifier.fit(), 'team_colors': classifier.team_colors()}
+    return results
+
+def camera_motion_from_flow(flow, tracks, params):
+    # Player-anchored background flow is already in full-frame pixels
+    flow_vectors = [entry['background_flow'] for entry in flow] if params['flow_mode'] == 'players' else flow
+    flow_scale = 1.0 if params['flow_mode'] == 'players' else params['scale_factor']
+    return camera_motion_per_frame(flow_vectors, tracks.num_frames, params['frame_skip']) / flow_scale
+
+def compute_velocity(video_path, tracks, camera_motion, params, fps):
+    first_frame = next(iter_video(video_path, 0, 1))
+    transformer = PerspectiveTransformer()
+    transformer.set_field_corners(first_frame, params['field_corners'] or default_field_corners(first_frame))
+    store = TrackStore.from_columns(tracks.num_frames, **{name: getattr(tracks, name) for name in
+                                                          ('frame', 'track_id', 'class_id', 'x1', 'y1', 'x2', 'y2')})
+    calculate_speed_and_distance(store, transformer, frame_rate=fps, camera_motion=camera_motion,
+                                 max_gap=params['max_gap'])
+    return {'velocity': store.velocity, 'distance': store.distance}
+
+def processed_tracks(tracks, artifacts):
+    """Tracks with the teams and velocity/distance artifacts applied"""
+    if 'teams' in artifacts:
+        tracks.map_track_values('team', artifacts['teams']['track_teams'])
+    if 'velocity' in artifacts:
+        tracks.velocity = artifacts['velocity']['velocity']
+        tracks.distance = artifacts['velocity']['distance']
+    return tracks
+
+def run_incremental(video_path, output_video_path=None, stats_csv_path=None, params=None, cache_dir='stubs/stages',
+                    targets=None):
+    """Bring the targets (default: stats and render) up to date, recomputing only stale stages
+
+    Returns {stage: 'cached' or the time spent computing it} for the stages that were used.
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    targets = targets or (['stats'] + (['render'] if output_video_path else []))
+    fps = get_video_info(video_path)['fps']
+    cache = StageCache(cache_dir)
+    stages = needed_stages(targets, params)
+    keys = stage_keys(stages, params, cache, video_path, fps)
+
+    # Render's artifact is the video itself, marked with the key it was made with
+    render_marker = f"{output_video_path}.stage.json" if output_video_path else None
+    def is_cached(name):
+        if name == 'render':
+            try:
+                with open(render_marker) as f:
+                    return json.load(f)['key'] == keys[name] and os.path.exists(output_video_path)
+            except (OSError, ValueError, KeyError):
+                return False
+        return cache.has(name, keys[name])
+
+    stale = [name for name in stages if not is_cached(name)]
+    print(f"Stages to recompute: {', '.join(stale) or 'none'} (of {', '.join(stages)})")
+
+    timings, artifacts = {}, {}
+
+    def load_or_compute(name, compute):
+        if name not in stale:
+            timings[name] = 'cached'
+            artifacts[name] = cache.load(name, keys[name])
+            return artifacts[name]
+        start = time.perf_counter()
+        artifacts[name] = compute()
+        cache.save(name, keys[name], artifacts[name])
+        timings[name] = f"{time.perf_counter() - start:.2f}s"
+        return artifacts[name]
+
+    def needs(name):
+        # A cached stage is only loaded when a stale stage reads it (or it is a target)
+        return name in stages and (name in stale or name in targets or
+                                   any(name in stage_inputs(other, params) for other in stale))
+
+    tracks = load_or_compute('tracks', lambda: compute_tracks(video_path, params))
+
+    frame_stale = [name for name in FRAME_STAGES if name in stale and
+                   not (name == 'camera_motion' and params['camera_motion_mode'] == 'flow')]
+    frame_results = {}
+    if frame_stale:
+        start = time.perf_counter()
+        frame_results = compute_frame_stages(video_path, frame_stale, tracks, params)
+        elapsed = f"{time.perf_counter() - start:.2f}s (shared decoding pass)"
+    for name in FRAME_STAGES:
+        if not needs(name):
+            continue
+        if name in frame_results:
+            artifacts[name] = frame_results[name]
+            cache.save(name, keys[name], artifacts[name])
+            timings[name] = elapsed
+        else:
+            # Cached, or camera motion derived from the flow
+            load_or_compute(name, lambda: camera_motion_from_flow(artifacts['flow'], tracks, params))
+
+    if needs('velocity'):
+        load_or_compute('velocity', lambda: compute_velocity(video_path, tracks, artifacts['camera_motion'],
+                                                             params, fps))
+    tracks = processed_tracks(tracks, artifacts)
+
+    if needs('stats'):
+        stats_df = load_or_compute('stats', lambda: analyze_consecutive_players(
+            tracks, params['min_seconds'], fps, params['sprint_speeds'], params['min_sprint_seconds'],
+            params['max_valid_speed']))
+        if stats_csv_path:
+            save_stats_to_csv(stats_df, stats_csv_path)
+
+    if 'render' in stages:
+        if 'render' in stale:
+            start = time.perf_counter()
+            renderer = AnnotationRenderer(alpha=params['alpha'], font_scale=params['font_scale'],
+                                          font_thickness=params['font_thickness'],
+                                          line_thickness=params['line_thickness'])
+            save_video(renderer.iter_render(iter_video(video_path), tracks), output_video_path,
+                       source_video_path=video_path)
+            with open(render_marker, 'w') as f:
+                json.dump({'key': keys['render'], 'params': {name: params[name] for name in STAGE_PARAMS['render']}}, f)
+            timings['render'] = f"{time.perf_counter() - start:.2f}s"
+        else:
+            timings['render'] = 'cached'
+
+    for name in stages:
+        if name in timings:
+            print(f"  {name:<14} {timings[name]}")
+    return timings
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--output', help='Annotated output video (render stage)')
+    parser.add_argument('--stats-csv', default='all_player_statistics.csv')
+    parser.add_argument('--cache-dir', default='stubs/stages')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help=f"Override a parameter (JSON value); one of: {', '.join(DEFAULT_PARAMS)}")
+    args = parser.parse_args()
+
+    params = {}
+    for item in args.set:
+        name, _, value = item.partition('=')
+        params[name] = parse_value(value)
+    run_incremental(args.video, args.output, args.stats_csv, params, args.cache_dir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,95 @@
-from utils import read_video, save_video
-from trackers import Tracker
+from utils import iter_video, save_video, get_video_info
+from trackers import Tracker, TrackFile
+from trackers.segments import process_video_segments
 from player_statistics import analyze_consecutive_players, save_stats_to_csv
 from performance_tracker import PerformanceTracker
 import subprocess
+import os
 
-def main():
-    # Initialize performance tracker
-    perf_tracker = PerformanceTracker()
+def process_match(video_path, output_video_path, perf_tracker, tracks_path='stubs/tracks', stats_csv_path=None,
+                  model_path='models/model.onnx', num_threads=None, flow_workers=None, segment_workers=None):
+    """Run detection, processing and rendering for one video
 
-    try:
-        # Start tracking the installation process
-        perf_tracker.start_section('installation_time')
-        subprocess.check_call(["pip", "install", "opencv-python-headless", "numpy", "scikit-learn"])
-        perf_tracker.end_section('installation_time')
+    Sections are timed on perf_tracker. With stats_csv_path, the player
+    statistics are written there as well. With segment_workers, detection
+    and processing run on that many time segments in parallel and the
+    tracks are stitched afterwards (see trackers.segments).
+    """
+    num_threads = num_threads or os.cpu_count()
+    flow_workers = flow_workers or os.cpu_count() or 1
 
-        # Read video (track I/O time)
-        perf_tracker.start_section('video_io_time')
-        video_frames = read_video('input_videos/input_video.mp4')
-        perf_tracker.end_section('video_io_time')
+    # Probe video (frames are decoded lazily by each pass below)
+    perf_tracker.start_section('video_io_time')
+    video_info = get_video_info(video_path)
+    perf_tracker.end_section('video_io_time')
 
-        # Initialize tracker (track model loading time)
-        perf_tracker.start_section('model_loading_time')
-        tracker = Tracker('models/model.mlpackage/Data/com.apple.CoreML/model.mlmodel', scale_factor=0.5)
-        perf_tracker.end_section('model_loading_time')
+    # Initialize tracker (track model loading time)
+    perf_tracker.start_section('model_loading_time')
+    tracker = Tracker(model_path, scale_factor=0.5, backend='onnx', pitch_crop=True, num_threads=num_threads)
+    perf_tracker.end_section('model_loading_time')
 
+    if segment_workers:
+        # Detection, tracking and processing of each segment in its own worker
+        perf_tracker.start_section('processing_time')
+        processed_tracks, tracker.camera_motion, tracker.team_colors = process_video_segments(
+            video_path, model_path, num_workers=segment_workers,
+            tracker_options={'scale_factor': 0.5, 'backend': 'onnx', 'pitch_crop': True,
+                             'num_threads': max(1, num_threads // segment_workers)},
+            process_options={'frame_skip': 3, 'frame_rate': video_info['fps']}
+        )
+    else:
         # Object tracking (track detection time)
         perf_tracker.start_section('detection_time')
-        tracks = tracker.get_object_tracks(video_frames, read_from_stub=True, stub_path='stubs/track_stub.pkl')
+        tracks = tracker.get_object_tracks(perf_tracker.iter_timed('decode', iter_video(video_path)),
+                                           cache=tracker.detection_cache(video_path))
         perf_tracker.end_section('detection_time')
 
         # Process video WITH OPTIMIZED OPTICAL FLOW
         perf_tracker.start_section('processing_time')
         processed_tracks = tracker.process_video(
-            video_frames, 
+            perf_tracker.iter_timed('decode', iter_video(video_path)),
             tracks,
-            frame_skip=3  # 👈 Add this parameter for frame skipping
+            frame_skip=3,  # 👈 Add this parameter for frame skipping
+            frame_rate=video_info['fps'],
+            flow_workers=flow_workers
         )
-        perf_tracker.end_section('processing_time')
+    # Save tracks and metrics in the chunked track file; the renderer
+    # (and player_statistics) read it back one chunk at a time
+    track_file = TrackFile.write(processed_tracks, tracks_path,
+                                 frame_metrics={'camera_motion': tracker.camera_motion})
+    perf_tracker.end_section('processing_time')
+
+    # Render output video (track rendering time)
+    # Frames are decoded, annotated and encoded one at a time
+    perf_tracker.start_section('rendering_time')
+    # Per-frame render times exclude the decoding nested inside them; the
+    # renderer gets this process's thread share (batch workers split the CPUs)
+    output_video_frames = perf_tracker.iter_timed(
+        'render', tracker.iter_annotations(perf_tracker.iter_timed('decode', iter_video(video_path)), track_file,
+                                           num_workers=num_threads)
+    )
+    save_video(output_video_frames, output_video_path, source_video_path=video_path)
+    perf_tracker.end_section('rendering_time')
+
+    if stats_csv_path is not None:
+        perf_tracker.start_section('statistics_time')
+        stats_df = analyze_consecutive_players(track_file, fps=video_info['fps'])
+        save_stats_to_csv(stats_df, stats_csv_path)
+        perf_tracker.end_section('statistics_time')
+
+    return track_file
+
+def main():
+    # Initialize performance tracker
+    perf_tracker = PerformanceTracker()
+
+    try:
+        # Start tracking the installation process
+        perf_tracker.start_section('installation_time')
+        subprocess.check_call(["pip", "install", "opencv-python-headless", "numpy", "scikit-learn"])
+        perf_tracker.end_section('installation_time')
 
-        # Render output video (track rendering time)
-        perf_tracker.start_section('rendering_time')
-        output_video_frames = tracker.draw_annotations(video_frames, processed_tracks)
-        save_video(output_video_frames, 'output_videos/output_video_cuhk_1.mp4')
-        perf_tracker.end_section('rendering_time')
+        process_match('input_videos/input_video.mp4', 'output_videos/output_video_cuhk_1.mp4', perf_tracker)
 
     finally:
         # Record all metrics to CSV
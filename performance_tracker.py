@@ -1,30 +1,264 @@
 import time
 from datetime import datetime
 import csv
+import cProfile
+import functools
+import io
+import json
+import pstats
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Marks the end of an iterator in PerformanceTracker.iter_timed
+_DONE = object()
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
 
 class PerformanceTracker:
-    def __init__(self, csv_file='performance_metrics.csv'):
+    def __init__(self, csv_file='performance_metrics.csv', json_file='performance_metrics.json',
+                 trace_memory=False, profile_section=None):
+        """
+        Wall-clock, per-frame and memory instrumentation for a pipeline run
+
+        Sections are timed either with start_section/end_section or as
+        nested spans (`with tracker.span('name')` or the `timed` decorator);
+        nested spans are recorded under 'parent/child' paths. Per-frame stage
+        timings come from `frame(stage)` blocks or by wrapping a lazy frame
+        iterator with iter_timed, and are summarized as p50/p95/p99 and
+        frames per second. Per-frame times are exclusive: time spent in a
+        nested frame stage (e.g. decoding inside rendering) is only counted
+        for the inner stage.
+
+        Args:
+            csv_file: CSV file the flat section totals are appended to
+            json_file: JSON file for the full report (None to skip)
+            trace_memory: Record tracemalloc current/peak per span
+            profile_section: Span name to capture with cProfile
+        """
         self.start_time = time.time()
         self.section_times = {}
         self.csv_file = csv_file
+        self.json_file = json_file
+        self.trace_memory = trace_memory
+        self.profile_section = profile_section
+        self.profile_stats = None
+        self.spans = {}
+        self.frame_times = {}
+        self.memory_snapshots = []
+        self._section_starts = {}
+        self._profiler = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # Flat sections (CSV columns)
 
     def start_section(self, section_name):
         """Start timing a section."""
-        self.section_times[section_name] = time.time()
+        self._section_starts[section_name] = time.perf_counter()
+        self._span_stack().append(section_name)
+        if section_name == self.profile_section:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
 
     def end_section(self, section_name):
         """End timing a section and calculate elapsed time."""
-        if section_name in self.section_times:
-            elapsed_time = time.time() - self.section_times[section_name]
+        if section_name in self._section_starts:
+            elapsed_time = time.perf_counter() - self._section_starts.pop(section_name)
             self.section_times[section_name] = round(elapsed_time, 2)
+            if section_name == self.profile_section and self._profiler is not None:
+                self._profiler.disable()
+                self._save_profile(self._profiler)
+                self._profiler = None
+            stack = self._span_stack()
+            depth = stack.index(section_name) + 1 if section_name in stack else len(stack)
+            path = '/'.join(stack[:depth])
+            del stack[depth - 1:]
+            self._record_span(path, elapsed_time, self._traced_memory())
         else:
             print(f"Warning: Section '{section_name}' was not started.")
 
+    # Nested spans
+
+    def _span_stack(self):
+        if not hasattr(self._local, 'spans'):
+            self._local.spans = []
+        return self._local.spans
+
+    def _record_span(self, path, elapsed_time, memory=None):
+        with self._lock:
+            span = self.spans.setdefault(path, {'calls': 0, 'total_time': 0.0})
+            span['calls'] += 1
+            span['total_time'] += elapsed_time
+            span['peak_rss_mb'] = peak_rss_mb()
+            if memory is not None:
+                span['traced_current_mb'], span['traced_peak_mb'] = memory
+
+    @contextmanager
+    def span(self, name):
+        """Time a block as a span nested under the spans that are open on this thread"""
+        stack = self._span_stack()
+        stack.append(name)
+        path = '/'.join(stack)
+        profiler = None
+        if name == self.profile_section:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_time = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._save_profile(profiler)
+            stack.pop()
+            self._record_span(path, elapsed_time, self._traced_memory())
+
+    def _traced_memory(self):
+        """(current, peak) traced memory in MB, or None without trace_memory"""
+        if not self.trace_memory:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        return round(current / 1e6, 1), round(peak / 1e6, 1)
+
+    def timed(self, name=None):
+        """Decorator that runs the function inside a span (named after the function by default)"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name or function.__name__):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _save_profile(self, profiler, top=30):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output).sort_stats('cumulative')
+        stats.print_stats(top)
+        stats.dump_stats(f"{self.profile_section}.prof")
+        self.profile_stats = output.getvalue()
+
+    # Per-frame stage timings
+
+    def _frame_stack(self):
+        if not hasattr(self._local, 'frames'):
+            self._local.frames = []
+        return self._local.frames
+
+    @contextmanager
+    def frame(self, stage):
+        """Time one frame of a stage, excluding nested frame stages"""
+        stack = self._frame_stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_time = time.perf_counter() - start
+            nested_time = stack.pop()
+            if stack:
+                stack[-1] += elapsed_time
+            self.record_frame(stage, elapsed_time - nested_time)
+
+    def record_frame(self, stage, seconds):
+        """Add one per-frame timing for a stage"""
+        with self._lock:
+            self.frame_times.setdefault(stage, []).append(seconds)
+
+    def iter_timed(self, stage, iterable):
+        """Yield from iterable, timing each item's production as one frame of stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.frame(stage):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                # The final (empty) call is not a frame
+                self.frame_times[stage].pop()
+                return
+            yield item
+
+    def frame_summary(self):
+        """{stage: frames, total, mean, p50/p95/p99 (ms) and fps}"""
+        summary = {}
+        for stage, times in self.frame_times.items():
+            if not times:
+                continue
+            times = np.asarray(times)
+            p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+            total = float(times.sum())
+            summary[stage] = {
+                'frames': len(times),
+                'total_time': round(total, 3),
+                'mean_ms': round(float(times.mean()) * 1000, 2),
+                'p50_ms': round(float(p50), 2),
+                'p95_ms': round(float(p95), 2),
+                'p99_ms': round(float(p99), 2),
+                'max_ms': round(float(times.max()) * 1000, 2),
+                'fps': round(len(times) / total, 1) if total > 0 else None,
+            }
+        return summary
+
+    # Memory
+
+    def memory_snapshot(self, label, top=10):
+        """Record the top tracemalloc allocation sites (needs trace_memory=True)"""
+        if not tracemalloc.is_tracing():
+            print("Warning: tracemalloc is not tracing; pass trace_memory=True")
+            return
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        self.memory_snapshots.append({
+            'label': label,
+            'peak_rss_mb': peak_rss_mb(),
+            'top': [{'where': str(stat.traceback), 'size_mb': round(stat.size / 1e6, 2), 'count': stat.count}
+                    for stat in stats],
+        })
+
+    # Export
+
+    def report(self):
+        """Everything recorded so far as a JSON-serializable dict"""
+        return {
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'total_time': round(time.time() - self.start_time, 2),
+            'peak_rss_mb': peak_rss_mb(),
+            'sections': dict(self.section_times),
+            'spans': {path: dict(span, total_time=round(span['total_time'], 4))
+                      for path, span in self.spans.items()},
+            'frames': self.frame_summary(),
+            'memory_snapshots': self.memory_snapshots,
+            'profile': {'section': self.profile_section, 'stats': self.profile_stats} if self.profile_stats else None,
+        }
+
+    def export_json(self, json_file=None):
+        """Write report() to a JSON file"""
+        json_file = json_file or self.json_file
+        with open(json_file, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+        print(f"Detailed metrics written to {json_file}")
+
     def record_metrics(self):
-        """Record all metrics to a CSV file."""
+        """Record all metrics to a CSV file (and the JSON report)."""
         total_time = round(time.time() - self.start_time, 2)
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
+
         # Prepare data for CSV
         row = {'timestamp': timestamp, 'total_time': total_time}
         row.update(self.section_times)
@@ -39,3 +273,9 @@ class PerformanceTracker:
             print(f"Metrics recorded to {self.csv_file}")
         except Exception as e:
             print(f"Error writing to CSV: {e}")
+
+        if self.json_file:
+            try:
+                self.export_json()
+            except Exception as e:
+                print(f"Error writing JSON: {e}")
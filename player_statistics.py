@@ -1,70 +1,116 @@
+import numpy as np
 import pandas as pd
+from trackers.track_store import TrackStore, CLASS_NAMES
 
-def analyze_consecutive_players(processed_tracks, min_seconds=2, fps=30):
+STAT_COLUMNS = ['Player ID', 'Highest Distance Covered (meters)', 'Total Distance (meters)',
+                'Top Speed (m/s)', 'Longest Streak (s)', 'Time On Screen (s)']
+
+def _player_columns(processed_tracks):
+    """frame, track_id, velocity and distance of every Player row"""
+    columns = ('frame', 'track_id', 'velocity', 'distance')
+    if hasattr(processed_tracks, 'read'):
+        # TrackFile: decompress only the columns needed here
+        store = processed_tracks.read(class_name='Player', columns=columns)
+    else:
+        store = TrackStore.from_tracks(processed_tracks)
+    store.consolidate()
+    players = store.class_id == CLASS_NAMES.index('Player')
+    return [getattr(store, name)[players] for name in columns]
+
+def analyze_consecutive_players(processed_tracks, min_seconds=2, fps=30, sprint_speeds=(5.5, 7.0),
+                                min_sprint_seconds=0.5, max_valid_speed=12.5):
     """
     Find all players who appeared for at least min_seconds consecutive seconds
-    and calculate their highest distance covered.
-    
+    and calculate their distance, speed and sprint statistics.
+
+    Every statistic is computed for all players at once from the track
+    columns: rows are sorted by (track, frame), runs of consecutive frames
+    give the streaks and per-track reductions give the rest.
+
     Args:
-        processed_tracks: The tracking data
+        processed_tracks: The tracking data (dict, TrackStore or TrackFile)
         min_seconds: Minimum consecutive seconds required
         fps: Frames per second of the video
-    
+        sprint_speeds: Speeds (m/s) to count sprints and distance above
+        min_sprint_seconds: Shortest run above a speed that counts as a sprint
+        max_valid_speed: Speeds above this (m/s) are treated as tracking glitches
+
     Returns:
         DataFrame with player statistics
     """
-    # Define minimum consecutive frames
-    min_consecutive_frames = min_seconds * fps
-    
-    # Track consecutive frame appearances
-    player_consecutive_frames = {}
-    player_current_streaks = {}
+    frame, track_id, velocity, distance = _player_columns(processed_tracks)
+    sprint_columns = []
+    for speed in sprint_speeds:
+        sprint_columns += [f'Sprints >= {speed} m/s', f'Distance >= {speed} m/s (meters)']
+    if len(frame) == 0:
+        print(f"Found 0 players who appeared for at least {min_seconds} consecutive seconds")
+        return pd.DataFrame(columns=STAT_COLUMNS + sprint_columns)
 
-    for frame_idx, frame_data in enumerate(processed_tracks['Player']):
-        for player_id in frame_data.keys():
-            # Initialize if new player
-            if player_id not in player_current_streaks:
-                player_current_streaks[player_id] = 1
-                player_consecutive_frames[player_id] = 1
-            else:
-                # Check if this is the next consecutive frame
-                if frame_idx > 0 and player_id in processed_tracks['Player'][frame_idx-1]:
-                    player_current_streaks[player_id] += 1
-                else:
-                    player_current_streaks[player_id] = 1
-                
-                # Update max consecutive frames if current streak is higher
-                if player_current_streaks[player_id] > player_consecutive_frames[player_id]:
-                    player_consecutive_frames[player_id] = player_current_streaks[player_id]
+    # Group rows by track, in frame order
+    order = np.lexsort((frame, track_id))
+    frame, track_id = frame[order], track_id[order]
+    velocity, distance = velocity[order].astype(np.float64), distance[order].astype(np.float64)
+    track_start = np.r_[True, track_id[1:] != track_id[:-1]]
+    starts = np.flatnonzero(track_start)
+    track_num = np.cumsum(track_start) - 1
+    gap = np.where(track_start, 0, np.r_[0, np.diff(frame)])
 
-    # Filter players who appeared for at least the minimum consecutive frames
-    qualified_players = [player_id for player_id, frames in player_consecutive_frames.items() 
-                        if frames >= min_consecutive_frames]
+    # Longest run of consecutive frames per track
+    run_start = track_start | (gap != 1)
+    run_lengths = np.bincount(np.cumsum(run_start) - 1)
+    longest_streak = np.zeros(len(starts), dtype=np.int64)
+    np.maximum.at(longest_streak, track_num[run_start], run_lengths)
 
-    print(f"Found {len(qualified_players)} players who appeared for at least {min_seconds} consecutive seconds")
+    # Distance is cumulative per track; speeds above max_valid_speed are glitches
+    highest_distance = np.fmax.reduceat(distance, starts)
+    velocity = np.where(velocity <= max_valid_speed, velocity, np.nan)
+    top_speed = np.fmax.reduceat(velocity, starts)
+    # Each row's velocity covers the step since the previous row of the track
+    step_distance = np.nan_to_num(velocity * gap / fps)
+    # Total from the cumulative distance column where the track has one: the sum
+    # of its increments is last minus first, and a legacy per-frame reset does not
+    # subtract. Live velocities are smoothed, so integrating them undercounts
+    # accelerations; they are only the fallback for tracks without distances.
+    measured = np.flatnonzero(~np.isnan(distance))
+    measured_track = track_num[measured]
+    increment = np.where(np.r_[False, measured_track[1:] == measured_track[:-1]],
+                         np.r_[0.0, np.diff(distance[measured])], 0.0)
+    has_distance = np.bincount(measured_track, minlength=len(starts)) > 0
+    total_distance = np.where(has_distance,
+                              np.bincount(measured_track, weights=np.clip(increment, 0, None), minlength=len(starts)),
+                              np.bincount(track_num, weights=step_distance, minlength=len(starts)))
 
-    # Find highest distance for each qualified player
-    all_stats = []
+    stats = {
+        'Player ID': track_id[starts],
+        'Highest Distance Covered (meters)': highest_distance,
+        'Total Distance (meters)': total_distance,
+        'Top Speed (m/s)': top_speed,
+        'Longest Streak (s)': longest_streak / fps,
+        'Time On Screen (s)': np.bincount(track_num) / fps,
+    }
 
-    for player_id in qualified_players:
-        # Get all distance values for this player
-        player_distances = [frame[player_id]['distance'] for frame in processed_tracks['Player']
-                          if player_id in frame and 'distance' in frame[player_id]]
-        
-        # Find highest distance
-        if player_distances:
-            highest_distance = max(player_distances)
-            all_stats.append({
-                'Player ID': player_id,
-                'Highest Distance Covered (meters)': highest_distance
-            })
-            
+    for speed in sprint_speeds:
+        count_column, distance_column = f'Sprints >= {speed} m/s', f'Distance >= {speed} m/s (meters)'
+        fast = velocity >= speed
+        stats[distance_column] = np.bincount(track_num, weights=np.where(fast, step_distance, 0.0),
+                                             minlength=len(starts))
+        # Runs of fast rows in consecutive frames, kept if long enough
+        sprint_start = fast & (track_start | (gap != 1) | ~np.r_[False, fast[:-1]])
+        sprint_id = np.cumsum(sprint_start) - 1
+        sprint_lengths = np.bincount(sprint_id[fast], minlength=sprint_start.sum())
+        long_enough = sprint_lengths >= max(min_sprint_seconds * fps, 1)
+        stats[count_column] = np.bincount(track_num[sprint_start][long_enough], minlength=len(starts))
 
-    # Create DataFrame with all player stats
-    if all_stats:
-        return pd.DataFrame(all_stats)
-    else:
-        return pd.DataFrame(columns=['Player ID', 'Total Distance Covered (meters)'])
+    stats_df = pd.DataFrame(stats)[STAT_COLUMNS + sprint_columns]
+
+    # Filter players who appeared for at least the minimum consecutive frames
+    qualified = longest_streak >= min_seconds * fps
+    print(f"Found {qualified.sum()} players who appeared for at least {min_seconds} consecutive seconds")
+
+    # Players with neither a distance nor a valid speed have nothing to report
+    stats_df = stats_df[qualified & (has_distance | ~np.isnan(top_speed))].reset_index(drop=True)
+    stats_df['Player ID'] = stats_df['Player ID'].astype(int)
+    return stats_df
 
 def save_stats_to_csv(stats_df, output_file='all_player_statistics.csv'):
     """Save player statistics to CSV file"""
@@ -1 +1,3 @@
-from .tracker import Tracker 
\ No newline at end of file
+from .tracker import Tracker 
+from .track_store import TrackStore
+from .track_file import TrackFile
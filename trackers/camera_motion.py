@@ -0,0 +1,123 @@
+# trackers/camera_motion.py
+import cv2
+import numpy as np
+from trackers.optical_flow import LK_PARAMS
+
+class CameraMotionEstimator:
+    def __init__(self, min_features=40, max_features=200, model='affine', ransac_threshold=3.0):
+        """
+        Estimate global camera motion by tracking background features forward
+
+        Corners are detected only on keyframes (away from player boxes) and
+        then tracked frame to frame with Lucas-Kanade. A global model is fit
+        to each step with RANSAC, so moving players end up as outliers and
+        are dropped from the tracked set. New corners are detected only when
+        fewer than min_features points survive.
+
+        Args:
+            min_features: Re-seed features when fewer than this many survive
+            max_features: Number of corners detected on a keyframe
+            model: 'affine' (rotation, zoom and pan) or 'translation'
+            ransac_threshold: RANSAC reprojection threshold in pixels
+        """
+        if model not in ('affine', 'translation'):
+            raise ValueError(f"Unknown camera model: {model}")
+        self.min_features = min_features
+        self.max_features = max_features
+        self.model = model
+        self.ransac_threshold = ransac_threshold
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.points = None
+        self.num_frames = 0
+        self.motion = []
+        self.transforms = []
+        self.keyframes = []
+
+    def update(self, frame, boxes=None):
+        """Add the next frame and return the camera motion (dx, dy) since the previous one
+
+        boxes are the player boxes of this frame in the frame's own pixel
+        coordinates; they are kept out of the features detected on keyframes.
+        """
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        dx, dy = 0.0, 0.0
+        transform = np.eye(2, 3, dtype=np.float32)
+        if self.prev_gray is not None:
+            if self.points is not None and len(self.points) >= 3:
+                transform, (dx, dy) = self._track(gray)
+            else:
+                self.points = None
+            self.motion.append((dx, dy))
+            self.transforms.append(transform)
+
+        if self.points is None or len(self.points) < self.min_features:
+            self._seed(gray, boxes)
+            self.keyframes.append(self.num_frames)
+
+        self.prev_gray = gray
+        self.num_frames += 1
+        return dx, dy
+
+    def _seed(self, gray, boxes):
+        """Detect fresh background corners on a keyframe"""
+        mask = None
+        if boxes is not None and len(boxes):
+            mask = np.full(gray.shape[:2], 255, dtype=np.uint8)
+            for x1, y1, x2, y2 in np.asarray(boxes).astype(int):
+                mask[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] = 0
+        self.points = cv2.goodFeaturesToTrack(gray, maxCorners=self.max_features, qualityLevel=0.01,
+                                              minDistance=10, blockSize=7, mask=mask)
+
+    def _track(self, gray):
+        """Track the surviving points into gray and fit the global model"""
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **LK_PARAMS)
+        tracked = status.ravel() == 1
+        old_points, new_points = self.points[tracked], new_points[tracked]
+
+        transform, inliers = None, None
+        if len(old_points) >= 3:
+            transform, inliers = cv2.estimateAffinePartial2D(
+                old_points, new_points, method=cv2.RANSAC, ransacReprojThreshold=self.ransac_threshold
+            )
+        if transform is None:
+            self.points = None
+            return np.eye(2, 3, dtype=np.float32), (0.0, 0.0)
+
+        inliers = inliers.ravel() == 1
+        self.points = new_points[inliers].reshape(-1, 1, 2)
+
+        if self.model == 'translation':
+            dx, dy = np.median(new_points[inliers] - old_points[inliers], axis=0).ravel()
+            transform = np.array([[1, 0, dx], [0, 1, dy]], dtype=np.float32)
+        else:
+            # Report the displacement of the image centre under the fitted model
+            h, w = gray.shape[:2]
+            centre = np.array([w / 2, h / 2, 1.0])
+            dx, dy = transform @ centre - centre[:2]
+        return transform.astype(np.float32), (float(dx), float(dy))
+
+    def camera_motion(self, num_frames=None):
+        """Per-frame motion as an (F, 2) array; row f is the motion from frame f to f + 1"""
+        num_frames = num_frames if num_frames is not None else self.num_frames
+        motion = np.zeros((num_frames, 2), dtype=np.float32)
+        steps = np.asarray(self.motion, dtype=np.float32).reshape(-1, 2)[:num_frames]
+        motion[:len(steps)] = steps
+        return motion
+
+    def estimate(self, frames, tracks=None, scale=1.0):
+        """Run over a whole (lazy) sequence of frames and return camera_motion()
+
+        tracks is an optional TrackStore in full-frame coordinates; scale is the
+        size of frames relative to it. Motion is in the frames' own pixels.
+        """
+        self.reset()
+        for frame_num, frame in enumerate(frames):
+            boxes = None
+            if tracks is not None and frame_num < tracks.num_frames:
+                boxes = tracks.row_bboxes(tracks.frame_rows(frame_num, 'Player')) * scale
+            self.update(frame, boxes)
+        return self.camera_motion()
@@ -0,0 +1,236 @@
+# trackers/detection_cache.py
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import numpy as np
+from trackers.track_store import TrackStore
+
+# Columns saved per chunk; team/velocity/distance are derived later
+CACHED_COLUMNS = ("frame", "track_id", "class_id", "x1", "y1", "x2", "y2")
+
+# An incomplete entry written to this recently belongs to a run still in progress
+ACTIVE_SECONDS = 15 * 60
+
+def fingerprint_file(path, sample_blocks=16, block_size=1 << 16):
+    """Cheap content hash of a (possibly huge) file
+
+    Hashes the file size, the first and last MB and sample_blocks evenly
+    spaced blocks, so a multi-GB video is fingerprinted in milliseconds but
+    any re-encode or trim changes the result.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        offsets = [0, max(size - (1 << 20), 0)]
+        offsets += [size * i // (sample_blocks + 1) for i in range(1, sample_blocks + 1)]
+        for offset in offsets:
+            f.seek(offset)
+            digest.update(f.read(1 << 20 if offset in offsets[:2] else block_size))
+    return digest.hexdigest()
+
+def hash_file(path):
+    """Full sha256 of a file, used for model weights"""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        # Model packages (e.g. .mlpackage) are directories
+        for root, _, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                digest.update(hash_file(os.path.join(root, name)).encode())
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    def __init__(self, video_path, model_path, scale_factor, conf, cache_dir='stubs/detection_cache',
+                 chunk_size=500, max_bytes=5 * 1024 ** 3, extra=None):
+        """
+        Content-addressed, chunked cache of detection + tracking results
+
+        The cache key hashes the video contents, the model file, the scale
+        factor, the confidence threshold and any extra settings, so results
+        are never reused for different inputs. Tracks are written every
+        chunk_size frames together with the ByteTrack state, so an
+        interrupted run resumes from the last completed chunk.
+
+        Args:
+            video_path: Input video
+            model_path: Detection model file (or package directory)
+            scale_factor: Detection downscale factor
+            conf: Detector confidence threshold
+            cache_dir: Directory holding one subdirectory per cache key
+            chunk_size: Frames per chunk file
+            max_bytes: Size budget for the whole cache directory
+            extra: Other settings that change the detections (e.g. backend options)
+        """
+        params = {
+            'video': fingerprint_file(video_path),
+            'model': hash_file(model_path),
+            'scale_factor': float(scale_factor),
+            'conf': float(conf),
+            'extra': extra or {},
+        }
+        self.key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:24]
+        self.params = params
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, self.key)
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.meta = None
+
+    def _meta_path(self, path=None):
+        return os.path.join(path or self.path, 'meta.json')
+
+    def _write_json(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """Load cached chunks
+
+        Returns (tracks, tracker_state, complete): a TrackStore with every
+        completed frame, the ByteTrack attribute dict to resume with (None
+        when starting fresh) and whether the whole video is cached.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.meta = {'params': self.params, 'chunks': [], 'complete': False}
+        if os.path.exists(self._meta_path()):
+            try:
+                with open(self._meta_path()) as f:
+                    self.meta = json.load(f)
+            except (OSError, ValueError):
+                print(f"Detection cache {self.key} is corrupt, starting over")
+
+        columns = {name: [] for name in CACHED_COLUMNS}
+        num_frames = 0
+        valid_chunks = []
+        for chunk in self.meta['chunks']:
+            try:
+                with np.load(os.path.join(self.path, chunk['file'])) as data:
+                    for name in CACHED_COLUMNS:
+                        columns[name].append(data[name])
+            except (OSError, ValueError, KeyError):
+                # Drop a damaged chunk and everything after it
+                break
+            valid_chunks.append(chunk)
+            num_frames = chunk['end']
+
+        tracker_state = None
+        if len(valid_chunks) != len(self.meta['chunks']):
+            self.meta['complete'] = False
+        if valid_chunks and not self.meta['complete']:
+            state_path = os.path.join(self.path, valid_chunks[-1]['state'])
+            try:
+                with open(state_path, 'rb') as f:
+                    tracker_state = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                # Without the ByteTrack state the run cannot resume mid-video
+                valid_chunks, num_frames = [], 0
+                columns = {name: [] for name in CACHED_COLUMNS}
+
+        self.meta['chunks'] = valid_chunks
+        self.meta['last_used'] = time.time()
+        self._write_json(self._meta_path(), self.meta)
+
+        if valid_chunks:
+            tracks = TrackStore.from_columns(
+                num_frames, **{name: np.concatenate(parts) for name, parts in columns.items()}
+            )
+        else:
+            tracks = TrackStore()
+        if self.meta['complete']:
+            print(f"Loaded {num_frames} frames of tracks from detection cache {self.key}")
+        elif num_frames:
+            print(f"Resuming detection from frame {num_frames} (cache {self.key})")
+        return tracks, tracker_state, self.meta['complete']
+
+    @property
+    def next_frame(self):
+        """First frame not covered by a saved chunk"""
+        chunks = self.meta['chunks'] if self.meta else []
+        return chunks[-1]['end'] if chunks else 0
+
+    def save_chunk(self, tracks, tracker):
+        """Write the frames added since the last chunk, plus the ByteTrack state"""
+        start, end = self.next_frame, tracks.num_frames
+        if end <= start:
+            return
+        offsets = tracks.frame_offsets
+        rows = slice(offsets[start], offsets[end])
+
+        name = f"chunk_{start:08d}_{end:08d}"
+        tmp_path = os.path.join(self.path, name + '.tmp.npz')
+        np.savez(tmp_path, **{column: getattr(tracks, column)[rows] for column in CACHED_COLUMNS})
+        os.replace(tmp_path, os.path.join(self.path, name + '.npz'))
+
+        state_file = name + '.state.pkl'
+        with open(os.path.join(self.path, state_file + '.tmp'), 'wb') as f:
+            # Newer supervision versions wrap ByteTrack so the object itself
+            # cannot be pickled; its attributes can
+            pickle.dump(vars(tracker), f)
+        os.replace(os.path.join(self.path, state_file + '.tmp'), os.path.join(self.path, state_file))
+
+        # The manifest is written last, so a chunk only counts once it is complete
+        self.meta['chunks'].append({'start': start, 'end': end, 'file': name + '.npz', 'state': state_file})
+        self._write_json(self._meta_path(), self.meta)
+
+    def mark_complete(self, tracks, tracker):
+        """Save the final partial chunk, drop resume states and enforce the size budget"""
+        self.save_chunk(tracks, tracker)
+        for chunk in self.meta['chunks']:
+            state_path = os.path.join(self.path, chunk['state'])
+            if os.path.exists(state_path):
+                os.remove(state_path)
+        self.meta['complete'] = True
+        self.meta['num_frames'] = tracks.num_frames
+        self._write_json(self._meta_path(), self.meta)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes
+
+        Entries without a readable manifest are stale leftovers and go first.
+        The current entry is never evicted, and neither is an incomplete
+        entry written to in the last ACTIVE_SECONDS, since other processes
+        (e.g. batch.py workers) may still be filling it.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        now = time.time()
+        for key in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(path):
+                continue
+            try:
+                files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+                size = sum(os.path.getsize(file) for file in files)
+                last_write = max([os.path.getmtime(file) for file in files] + [os.path.getmtime(path)])
+            except OSError:
+                # Removed by another process while we looked
+                continue
+            try:
+                with open(self._meta_path(path)) as f:
+                    meta = json.load(f)
+                last_used, complete = meta.get('last_used', 0), meta.get('complete', False)
+            except (OSError, ValueError):
+                last_used, complete = -1, False
+            in_progress = not complete and now - last_write < ACTIVE_SECONDS
+            entries.append((last_used, key, path, size, in_progress))
+
+        total = sum(entry[3] for entry in entries)
+        for last_used, key, path, size, in_progress in sorted(entries):
+            if total <= self.max_bytes and last_used >= 0:
+                break
+            if key == self.key or in_progress:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            print(f"Evicted detection cache {key} ({size / 1e6:.1f} MB)")
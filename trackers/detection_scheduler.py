@@ -0,0 +1,89 @@
+# trackers/detection_scheduler.py
+import numpy as np
+from utils import iter_batches
+from trackers.optical_flow import player_flow_pair, to_gray
+
+class DetectionScheduler:
+    def __init__(self, detect_every=1, motion_threshold=6.0, max_lost=0.3, batch_size=8):
+        """
+        Run the detector on keyframes only and propagate boxes in between
+
+        Between keyframes, the previous frame's boxes are moved by the median
+        Lucas-Kanade flow of their anchor points (see player_flow_pair) and
+        fed to ByteTrack like regular detections, so its motion model and
+        track ids carry over. A frame becomes a keyframe when detect_every
+        frames have passed, when the camera moves faster than
+        motion_threshold pixels per frame, or when more than max_lost of the
+        boxes could not be followed.
+
+        Args:
+            detect_every: Maximum keyframe stride; 1 detects every frame (batched)
+            motion_threshold: Median background motion (small-frame pixels) that forces a keyframe
+            max_lost: Fraction of unfollowed boxes that forces a keyframe
+            batch_size: Frames per detector call when detect_every is 1
+        """
+        self.detect_every = detect_every
+        self.motion_threshold = motion_threshold
+        self.max_lost = max_lost
+        self.batch_size = batch_size
+        self.reset()
+
+    def reset(self):
+        self.num_frames = 0
+        self.keyframes = []
+        self.prev_gray = None
+        self.prev_detections = None
+
+    @property
+    def call_rate(self):
+        """Fraction of frames that ran the detector"""
+        return len(self.keyframes) / self.num_frames if self.num_frames else 0.0
+
+    def report(self):
+        print(f"Detector ran on {len(self.keyframes)}/{self.num_frames} frames "
+              f"({self.call_rate:.1%}, detect_every={self.detect_every})")
+
+    def iter_detections(self, frames, predict, downscale):
+        """Yield one sv.Detections per frame, calling predict only on keyframes
+
+        predict(frames, small_frames) returns detections in the pixels of
+        downscale(frame), the frames boxes are propagated on.
+        """
+        if self.detect_every <= 1:
+            for batch in iter_batches(frames, self.batch_size):
+                self.keyframes += range(self.num_frames, self.num_frames + len(batch))
+                self.num_frames += len(batch)
+                yield from predict(batch)
+            return
+
+        for frame in frames:
+            small_frame = downscale(frame)
+            gray = to_gray(small_frame)
+            is_keyframe = (self.prev_detections is None or
+                           self.num_frames - self.keyframes[-1] >= self.detect_every)
+            if not is_keyframe:
+                detections, lost, motion = self.propagate(self.prev_gray, gray, self.prev_detections)
+                is_keyframe = lost > self.max_lost or motion > self.motion_threshold
+            if is_keyframe:
+                detections = predict([frame], [small_frame])[0]
+                self.keyframes.append(self.num_frames)
+
+            self.prev_gray, self.prev_detections = gray, detections
+            self.num_frames += 1
+            yield detections
+
+    def propagate(self, prev_gray, gray, detections):
+        """Move detections from prev_gray to gray
+
+        Returns (detections, lost, motion): the boxes that could be followed,
+        the fraction that could not and the median background motion.
+        """
+        rows = np.arange(len(detections))
+        flow = player_flow_pair(prev_gray, gray, rows, detections.xyxy, frame_num=None)
+        followed = detections[flow['rows']]
+        followed.xyxy = followed.xyxy + np.tile(flow['player_flow'], 2)
+
+        lost = 1.0 - len(followed) / len(detections) if len(detections) else 0.0
+        background = flow['background_flow']
+        motion = float(np.median(np.linalg.norm(background, axis=1))) if len(background) else np.inf
+        return followed, lost, motion
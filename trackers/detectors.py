@@ -0,0 +1,208 @@
+# trackers/detectors.py
+import ast
+import os
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+import supervision as sv
+
+# Per-class shift in NMS; larger than any box coordinate span (as ultralytics' max_wh)
+NMS_CLASS_OFFSET = 7680
+
+class Detector(ABC):
+    """Interface for detector backends used by Tracker
+
+    predict() takes a list of BGR frames and returns one sv.Detections per
+    frame, in frame pixel coordinates. class_names maps class id -> name and
+    num_classes is the number of class ids the model can output. Frames are
+    resized to input_size for the model; when dynamic_input_size is True it
+    can be changed between calls (a smaller input is cheaper to run).
+    """
+    batch_size = 20
+    class_names = {}
+    input_size = 640
+    dynamic_input_size = True
+
+    @property
+    def num_classes(self):
+        return max(self.class_names, default=-1) + 1
+
+    @abstractmethod
+    def predict(self, frames):
+        """One sv.Detections per frame of frames"""
+
+
+class UltralyticsDetector(Detector):
+    def __init__(self, model_path, conf=0.1, batch_size=20, input_size=640):
+        """
+        Run a model through Ultralytics (PyTorch .pt, or CoreML on macOS)
+
+        Args:
+            model_path: Path to a model Ultralytics can load
+            conf: Confidence threshold
+            batch_size: Frames per predict call
+            input_size: Inference size (imgsz)
+        """
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.conf = conf
+        self.batch_size = batch_size
+        self.input_size = input_size
+        self.class_names = dict(self.model.names)
+
+    def predict(self, frames):
+        results = self.model.predict(frames, conf=self.conf, imgsz=self.input_size, verbose=False)
+        return [sv.Detections.from_ultralytics(result) for result in results]
+
+
+class OnnxRuntimeDetector(Detector):
+    def __init__(self, model_path, conf=0.1, iou=0.5, input_size=640, num_threads=None, batch_size=8,
+                 class_names=None):
+        """
+        Run a YOLOv8 ONNX export on the CPU with ONNX Runtime
+
+        Frames are letterboxed to input_size, stacked into one batch (or run
+        one at a time if the model has a fixed batch of 1), and the raw
+        output is decoded with vectorized confidence filtering and NMS.
+
+        Args:
+            model_path: Path to the .onnx model (see conversion_script.py)
+            conf: Confidence threshold
+            iou: IoU threshold for non-maximum suppression
+            input_size: Model input size (square); fixed by the model unless it was exported with dynamic=True
+            num_threads: ONNX Runtime intra-op threads (None = runtime default)
+            batch_size: Frames per inference call
+            class_names: {id: name}; read from the model metadata if None
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.fixed_batch = self.session.get_inputs()[0].shape[0] == 1
+        # A static export has integer height/width in its input shape
+        self.dynamic_input_size = not isinstance(self.session.get_inputs()[0].shape[2], int)
+        self.conf = conf
+        self.iou = iou
+        self.input_size = input_size
+        self.batch_size = batch_size
+
+        if class_names is None:
+            # Ultralytics stores the class names in the model metadata
+            metadata = self.session.get_modelmeta().custom_metadata_map
+            if 'names' not in metadata:
+                raise ValueError(f"{model_path} has no class names in its metadata; pass class_names")
+            class_names = ast.literal_eval(metadata['names'])
+        self.class_names = dict(class_names)
+
+    @property
+    def num_classes(self):
+        # The output is (batch, 4 + num_classes, N); the metadata may name fewer classes
+        output_classes = self.session.get_outputs()[0].shape[1]
+        named_classes = max(self.class_names, default=-1) + 1
+        return max(output_classes - 4, named_classes) if isinstance(output_classes, int) else named_classes
+
+    def predict(self, frames):
+        if not frames:
+            return []
+        batch, ratios, pads = zip(*(letterbox(frame, self.input_size) for frame in frames))
+        batch = np.stack(batch)
+
+        if self.fixed_batch:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                                      for i in range(len(batch))])
+        else:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+
+        return [self._decode(output, ratio, pad) for output, ratio, pad in zip(outputs, ratios, pads)]
+
+    def _decode(self, output, ratio, pad):
+        """Turn one (4 + num_classes, N) YOLOv8 output into sv.Detections"""
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_id = scores.argmax(axis=1)
+        confidence = scores[np.arange(len(scores)), class_id]
+
+        keep = confidence >= self.conf
+        predictions, class_id, confidence = predictions[keep], class_id[keep], confidence[keep]
+
+        # Centre/size -> corners, then undo the letterbox
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        xyxy = (xyxy - np.array([pad[0], pad[1], pad[0], pad[1]])) / ratio
+
+        keep = non_max_suppression(xyxy, confidence, self.iou, class_id)
+        return sv.Detections(
+            xyxy=xyxy[keep].astype(np.float32),
+            confidence=confidence[keep].astype(np.float32),
+            class_id=class_id[keep].astype(int),
+        )
+
+
+def letterbox(frame, size=640, color=114):
+    """Resize keeping aspect ratio and pad to size x size
+
+    Returns the (3, size, size) float32 RGB input in [0, 1], the resize
+    ratio and the (x, y) padding, so boxes can be mapped back.
+    """
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(frame, (new_w, new_h),
+                                                                  interpolation=cv2.INTER_LINEAR)
+    blob = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255.0
+    return blob, ratio, (pad_x, pad_y)
+
+
+def non_max_suppression(xyxy, scores, iou_threshold=0.5, class_id=None):
+    """Greedy NMS with vectorized IoU; returns the indices of the kept boxes
+
+    With class_id, boxes of different classes never suppress each other.
+    """
+    if len(xyxy) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = xyxy.astype(np.float32)
+    if class_id is not None:
+        # Shift each class into its own region so cross-class IoU is zero; a
+        # constant offset stays safe for the negative coordinates letterbox padding produces
+        boxes = boxes + (class_id.astype(np.float32) * NMS_CLASS_OFFSET)[:, None]
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def create_detector(model_path, backend='auto', **kwargs):
+    """Build a detector backend
+
+    backend 'auto' picks ONNX Runtime for .onnx files and Ultralytics for
+    everything else (.pt, .mlpackage). A Detector instance is used as it is.
+    """
+    if isinstance(backend, Detector):
+        return backend
+    if backend == 'auto':
+        backend = 'onnx' if os.path.splitext(model_path)[1].lower() == '.onnx' else 'ultralytics'
+    if backend == 'onnx':
+        return OnnxRuntimeDetector(model_path, **kwargs)
+    if backend == 'ultralytics':
+        return UltralyticsDetector(model_path, **kwargs)
+    raise ValueError(f"Unknown detector backend: {backend}")
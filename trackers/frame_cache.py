@@ -0,0 +1,95 @@
+# trackers/frame_cache.py
+import threading
+from collections import OrderedDict
+import cv2
+
+class FrameCache:
+    def __init__(self, max_bytes=256 * 1024 ** 2, fingerprint_step=32):
+        """
+        Derived images of frames (downscaled, grayscale), each computed once
+
+        Only pays off when one pass over the frames needs several variants
+        of the same frame, e.g. RealtimeProcessor's flow (grayscale) and
+        detector input (downscaled) at the same scale. Separate decoding
+        passes never hit and should not use it.
+
+        Variants are keyed by frame number, a fingerprint of the source
+        frame (a sparse pixel sample, so a different video or a re-decoded
+        different frame never hits a stale entry) and the variant itself.
+        Grayscale variants are derived from the cached downscaled frame of
+        the same scale. Entries are evicted least recently used first once
+        they hold more than max_bytes. hits and misses count the callers'
+        requests (not the downscaled frame a grayscale one is derived from).
+
+        Args:
+            max_bytes: Memory budget of the cached images
+            fingerprint_step: Pixel stride of the fingerprint sample
+        """
+        self.max_bytes = max_bytes
+        self.fingerprint_step = fingerprint_step
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.num_bytes = 0
+
+    def frame_key(self, frame, frame_num):
+        step = self.fingerprint_step
+        return frame_num, hash(frame[::step, ::step].tobytes())
+
+    def small(self, frame, frame_num, scale):
+        """frame resized by scale"""
+        if scale == 1.0:
+            return frame
+        return self._get(self.frame_key(frame, frame_num), ('small', scale), frame, scale)
+
+    def gray(self, frame, frame_num, scale=1.0):
+        """Grayscale of frame resized by scale"""
+        return self._get(self.frame_key(frame, frame_num), ('gray', scale), frame, scale)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _get(self, frame_key, variant, frame, scale, count=True):
+        key = frame_key + variant
+        with self._lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return image
+            if count:
+                self.misses += 1
+
+        if variant[0] == 'small':
+            image = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+        else:
+            small = frame if scale == 1.0 else self._get(frame_key, ('small', scale), frame, scale, count=False)
+            image = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        self._put(key, image)
+        return image
+
+    def _put(self, key, image):
+        with self._lock:
+            if key in self.entries:
+                return
+            # Shared between stages, so nobody may draw on a cached image
+            image.flags.writeable = False
+            self.entries[key] = image
+            self.num_bytes += image.nbytes
+            while self.num_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.num_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def report(self):
+        print(f"Frame cache: {self.hits}/{self.hits + self.misses} hits ({self.hit_rate():.1%}), "
+              f"{len(self.entries)} images, {self.num_bytes / 1024 ** 2:.0f} MB, {self.evictions} evicted")
@@ -2,40 +2,175 @@
 import cv2
 import numpy as np
 
+LK_PARAMS = dict(winSize=(15, 15),
+                 maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+# Points tracked for each player, as fractions of the bbox (x, y):
+# the foot point plus a few points on the legs and lower body
+PLAYER_ANCHORS = np.array([[0.5, 1.0], [0.5, 0.8], [0.3, 0.9], [0.7, 0.9]], dtype=np.float32)
+
+def to_gray(frame):
+    """Grayscale version of a BGR frame; grayscale frames are returned as they are"""
+    return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+def build_pyramid(gray, lk_params=LK_PARAMS):
+    """Image pyramid of gray for pyramid_flow, so a frame in two pairs is pyramided once"""
+    return cv2.buildOpticalFlowPyramid(gray, lk_params['winSize'], lk_params['maxLevel'],
+                                       withDerivatives=False)[1]
+
+def pyramid_flow(prev_pyramid, next_pyramid, points, lk_params=LK_PARAMS):
+    """calcOpticalFlowPyrLK on prebuilt pyramids (see build_pyramid)
+
+    The Python binding only takes images, so the levels are tracked coarse
+    to fine here: one single-level call per level, seeded with the previous
+    level's result. Points and status match calcOpticalFlowPyrLK on the
+    images.
+    """
+    next_points = status = error = None
+    for level in range(len(prev_pyramid) - 1, -1, -1):
+        level_points = points / (1 << level)
+        next_points = level_points.copy() if next_points is None else next_points * 2
+        next_points, status, error = cv2.calcOpticalFlowPyrLK(
+            prev_pyramid[level], next_pyramid[level], level_points, next_points,
+            winSize=lk_params['winSize'], maxLevel=0, criteria=lk_params['criteria'],
+            flags=cv2.OPTFLOW_USE_INITIAL_FLOW
+        )
+    return next_points, status, error
+
+def iter_gray_pairs(frames, frame_skip=3):
+    """Yield (frame_num, prev_gray, next_gray) for every nth frame pair
+
+    Each frame is converted to grayscale at most once (frames that are
+    already grayscale, e.g. from a FrameCache, are used as they are) and
+    only the current pair is kept in memory, so frames can be a lazy
+    iterator.
+    """
+    prev_gray = None
+    for i, frame in enumerate(frames):
+        gray = None
+        if prev_gray is not None:
+            gray = to_gray(frame)
+            yield i - 1, prev_gray, gray
+            prev_gray = None
+
+        if i % frame_skip == 0:
+            prev_gray = gray if gray is not None else to_gray(frame)
+
 def calculate_optical_flow(frames, frame_skip=3):
-    """Calculate sparse optical flow using Lucas-Kanade every nth frame"""
-    flow_vectors = []
-    lk_params = dict(winSize=(15, 15),
-                     maxLevel=2,
-                     criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
-    
+    """Calculate sparse optical flow using Lucas-Kanade every nth frame
+
+    frames can be a list or a lazy iterator; only the current frame pair
+    is kept in memory.
+    """
     # Process every nth frame pair (0-1, 3-4, 6-7, etc.)
-    for i in range(0, len(frames) - 1, frame_skip):
-        prev_gray = cv2.cvtColor(frames[i], cv2.COLOR_BGR2GRAY)
-        next_gray = cv2.cvtColor(frames[i+1], cv2.COLOR_BGR2GRAY)
-        
-        # Detect key features to track
-        features = cv2.goodFeaturesToTrack(prev_gray, 
-                                         maxCorners=100,
-                                         qualityLevel=0.3,
-                                         minDistance=7,
-                                         blockSize=7)
-        
-        if features is not None:
-            # Calculate optical flow
-            new_features, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, next_gray, features, None, **lk_params)
-            
-            # Filter only successful tracks
-            good_old = features[status == 1]
-            good_new = new_features[status == 1]
-            
-            # Calculate displacement vectors
-            displacements = good_new - good_old
-            flow_vectors.append(displacements)
-        else:
-            flow_vectors.append(np.array([]))  # Empty array if no features
+    return [sparse_flow_pair(prev_gray, next_gray)
+            for _, prev_gray, next_gray in iter_gray_pairs(frames, frame_skip)]
+
+def calculate_player_flow(frames, tracks, frame_skip=3, scale=1.0, num_background=64):
+    """Player-anchored sparse Lucas-Kanade flow every nth frame
+
+    Instead of detecting corners over the whole frame, LK runs only at a few
+    anchor points on each tracked player plus a small background grid that
+    avoids the players, so the cost depends on the number of players rather
+    than the frame area.
+
+    Args:
+        frames: Frames (already scaled by scale) as a list or lazy iterator
+        tracks: TrackStore with boxes in full-frame coordinates
+        frame_skip: Process every nth frame pair
+        scale: Size of frames relative to the track coordinates
+        num_background: Approximate number of background points
+
+    Returns:
+        One dict per processed pair with 'frame', 'rows' (TrackStore rows),
+        'player_flow' (per-row displacement) and 'background_flow', both in
+        full-frame pixels.
+    """
+    flows = []
+    for frame_num, prev_gray, next_gray in iter_gray_pairs(frames, frame_skip):
+        rows = tracks.frame_rows(frame_num, 'Player') if frame_num < tracks.num_frames else np.empty(0, dtype=np.int64)
+        flows.append(player_flow_pair(prev_gray, next_gray, rows, tracks.row_bboxes(rows), frame_num,
+                                      scale, num_background))
+    return flows
+
+def player_flow_pair(prev_gray, next_gray, rows, bboxes, frame_num, scale=1.0, num_background=64, pyramids=None):
+    """Track player anchors and background points from prev_gray to next_gray
+
+    bboxes are the (N, 4) full-frame boxes of rows. pyramids, the
+    (prev, next) build_pyramid of the two frames, are used instead of
+    building them again.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4) * scale
+    x1, y1, x2, y2 = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3]
+
+    # Anchor points on every player, clipped to the image
+    h, w = prev_gray.shape[:2]
+    anchor_x = x1[:, None] + (x2 - x1)[:, None] * PLAYER_ANCHORS[:, 0]
+    anchor_y = y1[:, None] + (y2 - y1)[:, None] * PLAYER_ANCHORS[:, 1]
+    anchors = np.stack([np.clip(anchor_x, 0, w - 1), np.clip(anchor_y, 0, h - 1)], axis=2).reshape(-1, 2)
+
+    # Background grid, dropping points that fall on a player
+    side = max(int(np.sqrt(num_background)), 1)
+    grid_x, grid_y = np.meshgrid(np.linspace(0, w - 1, side + 2)[1:-1], np.linspace(0, h - 1, side + 2)[1:-1])
+    background = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1)
+    on_player = ((background[:, None, 0] >= x1) & (background[:, None, 0] <= x2) &
+                 (background[:, None, 1] >= y1) & (background[:, None, 1] <= y2)).any(axis=1)
+    background = background[~on_player]
+
+    points = np.concatenate([anchors, background]).astype(np.float32).reshape(-1, 1, 2)
+    if len(points) == 0:
+        return {'frame': frame_num, 'rows': rows, 'player_flow': np.empty((0, 2), dtype=np.float32),
+                'background_flow': np.empty((0, 2), dtype=np.float32)}
+
+    if pyramids is not None:
+        new_points, status, _ = pyramid_flow(*pyramids, points)
+    else:
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, next_gray, points, None, **LK_PARAMS)
+    displacements = (new_points - points).reshape(-1, 2) / scale
+    tracked = status.ravel() == 1
+
+    # Per-player motion is the median over the anchors that were tracked
+    num_anchors = len(anchors)
+    anchor_flow = displacements[:num_anchors].reshape(len(rows), len(PLAYER_ANCHORS), 2)
+    anchor_tracked = tracked[:num_anchors].reshape(len(rows), len(PLAYER_ANCHORS))
+    anchor_flow = np.where(anchor_tracked[:, :, None], anchor_flow, np.nan)
+    has_flow = anchor_tracked.any(axis=1)
+    player_flow = np.empty((0, 2))
+    if has_flow.any():
+        player_flow = np.nanmedian(anchor_flow[has_flow], axis=1)
+
+    return {
+        'frame': frame_num,
+        'rows': rows[has_flow],
+        'player_flow': player_flow.astype(np.float32),
+        'background_flow': displacements[num_anchors:][tracked[num_anchors:]],
+    }
+
+def sparse_flow_pair(prev_gray, next_gray, lk_params=LK_PARAMS, pyramids=None):
+    """Displacements of corners tracked from prev_gray to next_gray (see player_flow_pair for pyramids)"""
+    # Detect key features to track
+    features = cv2.goodFeaturesToTrack(prev_gray, 
+                                     maxCorners=100,
+                                     qualityLevel=0.3,
+                                     minDistance=7,
+                                     blockSize=7)
+    
+    if features is None:
+        return np.array([])  # Empty array if no features
+
+    # Calculate optical flow
+    if pyramids is not None:
+        new_features, status, _ = pyramid_flow(*pyramids, features, lk_params)
+    else:
+        new_features, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, next_gray, features, None, **lk_params)
+    
+    # Filter only successful tracks
+    good_old = features[status == 1]
+    good_new = new_features[status == 1]
     
-    return flow_vectors
+    # Calculate displacement vectors
+    return good_new - good_old
 
 def estimate_camera_motion(flow):
     """Estimate global camera motion from sparse flow vectors"""
@@ -46,10 +181,26 @@ def estimate_camera_motion(flow):
     return mean_dx, mean_dy
 
 def compensate_camera_motion(flow, camera_motion):
-    """Compensate for camera motion in sparse flow vectors"""
+    """Compensate for camera motion in sparse flow vectors
+
+    camera_motion is a (dx, dy) pair, e.g. one row of
+    CameraMotionEstimator.camera_motion().
+    """
     if len(flow) == 0:
         return flow
     compensated = flow.copy()
     compensated[:, 0] -= camera_motion[0]
     compensated[:, 1] -= camera_motion[1]
     return compensated
+
+def camera_motion_per_frame(flow_vectors, num_frames, frame_skip=3):
+    """Per-frame (dx, dy) camera motion from sparse flow of every nth frame pair
+
+    Row f is the image displacement of the background between frames f and
+    f + 1; each sampled pair stands in for the frame_skip frames after it.
+    """
+    motion = np.zeros((num_frames, 2), dtype=np.float32)
+    for pair_num, flow in enumerate(flow_vectors):
+        start = pair_num * frame_skip
+        motion[start:start + frame_skip] = estimate_camera_motion(flow)
+    return motion
@@ -0,0 +1,124 @@
+# trackers/parallel_flow.py
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from trackers.optical_flow import sparse_flow_pair, player_flow_pair, to_gray, build_pyramid
+
+def calculate_optical_flow_parallel(frames, frame_skip=3, tracks=None, scale=1.0, num_workers=None,
+                                    chunk_pairs=32, num_background=64):
+    """Sparse Lucas-Kanade flow every nth frame, spread over a process pool
+
+    Frames are grouped into chunks of chunk_pairs frame pairs. Each chunk is
+    copied once into a shared memory block (only the frames that take part
+    in a pair) and a worker process computes its flow, converting each frame
+    to grayscale and building its LK pyramid once even when it takes part in
+    two pairs (frame_skip=1). Results are merged in
+    frame order. At most two chunks per worker are in flight, so memory
+    stays bounded when frames is a lazy iterator.
+
+    Without tracks this returns the same list as calculate_optical_flow;
+    with a TrackStore it returns the same list as calculate_player_flow.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    flow_vectors = []
+    in_flight = deque()
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        for frame_nums, chunk_frames, pairs in _iter_pair_chunks(frames, frame_skip, chunk_pairs):
+            block = _to_shared_memory(chunk_frames)
+            boxes = None
+            if tracks is not None:
+                boxes = []
+                for _, _, frame_num in pairs:
+                    rows = (tracks.frame_rows(frame_num, 'Player') if frame_num < tracks.num_frames
+                            else np.empty(0, dtype=np.int64))
+                    boxes.append((rows, tracks.row_bboxes(rows)))
+
+            future = pool.submit(_flow_chunk_worker, block.name, (len(chunk_frames),) + chunk_frames[0].shape,
+                                 pairs, boxes, scale, num_background)
+            in_flight.append((block, future))
+
+            if len(in_flight) >= 2 * num_workers:
+                flow_vectors += _collect(*in_flight.popleft())
+
+        while in_flight:
+            flow_vectors += _collect(*in_flight.popleft())
+
+    return flow_vectors
+
+def _iter_pair_chunks(frames, frame_skip, chunk_pairs):
+    """Group the frames needed for every nth frame pair into chunks
+
+    Yields (frame_nums, frames, pairs) where pairs holds
+    (prev_index, next_index, frame_num) with indexes into the chunk.
+    """
+    chunk_nums, chunk_frames, pairs = [], [], []
+    for i, frame in enumerate(frames):
+        is_next = (i - 1) % frame_skip == 0 and len(chunk_nums) > 0 and chunk_nums[-1] == i - 1
+        is_prev = i % frame_skip == 0
+        if not (is_next or is_prev):
+            continue
+
+        chunk_nums.append(i)
+        chunk_frames.append(frame)
+        if is_next:
+            pairs.append((len(chunk_nums) - 2, len(chunk_nums) - 1, i - 1))
+
+        if len(pairs) == chunk_pairs:
+            yield chunk_nums, chunk_frames, pairs
+            # With frame_skip=1 the last frame also starts the next pair
+            chunk_nums, chunk_frames = ([i], [frame]) if is_prev else ([], [])
+            pairs = []
+
+    if pairs:
+        yield chunk_nums, chunk_frames, pairs
+
+def _to_shared_memory(frames):
+    """Copy a list of equally sized frames into a new shared memory block"""
+    shape = (len(frames),) + frames[0].shape
+    block = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    np.ndarray(shape, dtype=np.uint8, buffer=block.buf)[:] = np.stack(frames)
+    return block
+
+def _collect(block, future):
+    """Wait for a chunk and free its shared memory"""
+    try:
+        return future.result()
+    finally:
+        block.close()
+        block.unlink()
+
+def _flow_chunk_worker(block_name, shape, pairs, boxes, scale, num_background):
+    """Compute the flow of every pair in a shared memory chunk (runs in a worker)"""
+    # Workers share the parent's resource tracker; the parent unlinks the block
+    block = shared_memory.SharedMemory(name=block_name)
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+    try:
+        grays = {}
+
+        def gray(index):
+            if index not in grays:
+                image = to_gray(frames[index])
+                grays[index] = image, build_pyramid(image)
+            return grays[index]
+
+        flows = []
+        for pair_num, (prev_index, next_index, frame_num) in enumerate(pairs):
+            (prev_gray, prev_pyramid), (next_gray, next_pyramid) = gray(prev_index), gray(next_index)
+            pyramids = prev_pyramid, next_pyramid
+            if boxes is None:
+                flows.append(sparse_flow_pair(prev_gray, next_gray, pyramids=pyramids))
+            else:
+                rows, bboxes = boxes[pair_num]
+                flows.append(player_flow_pair(prev_gray, next_gray, rows, bboxes, frame_num,
+                                              scale, num_background, pyramids))
+
+            # Pairs are in frame order, so prev_index is not needed again
+            del grays[prev_index]
+
+        return flows
+    finally:
+        del frames
+        block.close()
@@ -2,6 +2,16 @@
 import cv2
 import numpy as np
 
+def default_field_corners(frame):
+    """Predefined field corners (top left, top right, bottom left, bottom right) for a frame"""
+    h, w = frame.shape[:2]
+    return [
+        (w * 0.1, h * 0.2),  # Top left
+        (w * 0.9, h * 0.2),  # Top right
+        (w * 0.1, h * 0.9),  # Bottom left
+        (w * 0.9, h * 0.9)   # Bottom right
+    ]
+
 class PerspectiveTransformer:
     def __init__(self, field_width_meters=105, field_height_meters=68):
         """Initialize with real-world field dimensions"""
@@ -38,17 +48,28 @@ class PerspectiveTransformer:
     
     def transform_point(self, point):
         """Transform a point from image coordinates to field coordinates"""
+        x_meters, y_meters = self.transform_points(np.array([point]))[0]
+        return x_meters, y_meters
+
+    def transform_points(self, points):
+        """Transform an (N, 2) array of image points to field coordinates in meters"""
         if self.transform_matrix is None:
             raise ValueError("Transform matrix not set, call set_field_corners first")
-        
-        # Reshape point for transformation
-        point = np.array([point], dtype=np.float32).reshape(-1, 1, 2)
-        
-        # Apply perspective transform
-        transformed_point = cv2.perspectiveTransform(point, self.transform_matrix)
-        
+
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        if len(points) == 0:
+            return np.empty((0, 2), dtype=np.float32)
+
+        # Apply perspective transform to every point in one call
+        transformed_points = cv2.perspectiveTransform(points, self.transform_matrix)
+
         # Convert to meters
-        x_meters = transformed_point[0][0][0] / self.pixels_per_meter
-        y_meters = transformed_point[0][0][1] / self.pixels_per_meter
-        
-        return x_meters, y_meters
+        return transformed_points.reshape(-1, 2) / self.pixels_per_meter
+
+    def transform_track_store(self, store):
+        """Project the foot point of every row of a TrackStore to field meters.
+
+        Returns an (N, 2) array aligned with the store's rows, so whole-video
+        positions come out of a single vectorized pass.
+        """
+        return self.transform_points(store.foot_points())
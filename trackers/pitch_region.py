@@ -0,0 +1,129 @@
+# trackers/pitch_region.py
+import cv2
+import numpy as np
+import supervision as sv
+from trackers.detectors import non_max_suppression
+
+# Same grass thresholds as jersey_features (OpenCV hue is 0-179)
+GRASS_LOWER = np.array([35, 60, 40], dtype=np.uint8)
+GRASS_UPPER = np.array([85, 255, 255], dtype=np.uint8)
+
+class PitchRegion:
+    def __init__(self, update_every=25, min_row_fraction=0.2, margin=0.03, top_margin=0.12,
+                 min_grass=0.05, tiles=2, tile_overlap=192, iou=0.5):
+        """
+        Crop detector input to the playing area
+
+        The pitch is found from grass colour on a small copy of the frame:
+        rows and then columns where enough pixels are grass give a bounding
+        box, which is widened by a margin (more at the top, where heads stick
+        out above the far touchline). The box is cached and re-estimated only
+        every update_every detector calls, i.e. on keyframes. If too little
+        grass is visible (close-ups, replays) the whole frame is used.
+
+        Crops are cut from the full-size frame. A detector with a fixed
+        square input (640 for the ONNX export) letterboxes a wide broadcast
+        crop at nearly the same ratio as the whole frame, so the crop is
+        split into tiles: two tiles give players nearly twice the detector
+        pixels of the downscaled frame, for two detector calls per frame.
+        Boxes cut by an inner tile edge are dropped; as long as no player is
+        wider than tile_overlap, the neighbouring tile holds all of them.
+
+        Args:
+            update_every: Detector calls between pitch estimates
+            min_row_fraction: Fraction of grass a row/column needs to count as pitch
+            margin: Margin added on each side, as a fraction of the frame size
+            top_margin: Margin added above the pitch, as a fraction of the frame height
+            min_grass: Minimum grass fraction of the frame to crop at all
+            tiles: Split the crop into this many overlapping horizontal tiles
+            tile_overlap: Overlap between neighbouring tiles in full-size frame pixels (at least the widest player)
+            iou: IoU for merging boxes found twice in tile overlaps
+        """
+        self.update_every = update_every
+        self.min_row_fraction = min_row_fraction
+        self.margin = margin
+        self.top_margin = top_margin
+        self.min_grass = min_grass
+        self.tiles = tiles
+        self.tile_overlap = tile_overlap
+        self.iou = iou
+        self.reset()
+
+    def reset(self):
+        self.region = None
+        self.calls = 0
+
+    def estimate(self, frame):
+        """Pitch bounding box (x1, y1, x2, y2) in frame pixels"""
+        h, w = frame.shape[:2]
+        step = max(1, min(h, w) // 90)
+        small = frame[::step, ::step]
+        grass = cv2.inRange(cv2.cvtColor(small, cv2.COLOR_BGR2HSV), GRASS_LOWER, GRASS_UPPER) > 0
+        if grass.mean() < self.min_grass:
+            return 0, 0, w, h
+
+        rows = np.flatnonzero(grass.mean(axis=1) >= self.min_row_fraction)
+        if len(rows) == 0:
+            return 0, 0, w, h
+        cols = np.flatnonzero(grass[rows[0]:rows[-1] + 1].mean(axis=0) >= self.min_row_fraction)
+        if len(cols) == 0:
+            return 0, 0, w, h
+
+        x1 = max(int(cols[0] * step - self.margin * w), 0)
+        x2 = min(int((cols[-1] + 1) * step + self.margin * w), w)
+        y1 = max(int(rows[0] * step - self.top_margin * h), 0)
+        y2 = min(int((rows[-1] + 1) * step + self.margin * h), h)
+        return x1, y1, x2, y2
+
+    def update(self, frame):
+        """Return the cached pitch box, re-estimating it every update_every calls"""
+        if self.region is None or self.calls % self.update_every == 0:
+            self.region = self.estimate(frame)
+        self.calls += 1
+        return self.region
+
+    def tile_boxes(self, region):
+        """Split a region into self.tiles overlapping horizontal tiles"""
+        x1, y1, x2, y2 = region
+        if self.tiles <= 1 or x2 - x1 <= self.tile_overlap:
+            return [region]
+        width = (x2 - x1 + (self.tiles - 1) * self.tile_overlap) / self.tiles
+        stride = width - self.tile_overlap
+        return [(int(x1 + i * stride), y1, min(int(x1 + i * stride + width), x2), y2) for i in range(self.tiles)]
+
+    def predict(self, frames, predict):
+        """Run predict on the pitch crop (or tiles) of each frame
+
+        frames are full size; returns one sv.Detections per frame in the
+        frame's own pixels.
+        """
+        tiles, owners, regions = [], [], []
+        for frame_num, frame in enumerate(frames):
+            region = self.update(frame)
+            for tile in self.tile_boxes(region):
+                tiles.append(tile)
+                owners.append(frame_num)
+                regions.append(region)
+        crops = [frames[owner][y1:y2, x1:x2] for owner, (x1, y1, x2, y2) in zip(owners, tiles)]
+
+        results = [[] for _ in frames]
+        for owner, region, (x1, y1, x2, _), detections in zip(owners, regions, tiles, predict(crops)):
+            if self.tiles > 1 and len(detections):
+                # Boxes cut by an inner tile edge are partial; the overlapping
+                # neighbour tile sees the whole player
+                xyxy = detections.xyxy
+                cut = (((xyxy[:, 0] <= 1) & (x1 > region[0])) |
+                       ((xyxy[:, 2] >= x2 - x1 - 1) & (x2 < region[2])))
+                detections = detections[~cut]
+            detections.xyxy = detections.xyxy + np.array([x1, y1, x1, y1], dtype=detections.xyxy.dtype)
+            results[owner].append(detections)
+
+        merged = []
+        for parts in results:
+            detections = sv.Detections.merge(parts) if len(parts) > 1 else parts[0]
+            if len(parts) > 1 and len(detections):
+                # Players in the overlap of two tiles are found twice
+                detections = detections[non_max_suppression(detections.xyxy, detections.confidence,
+                                                             self.iou, detections.class_id)]
+            merged.append(detections)
+        return merged
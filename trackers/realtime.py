@@ -0,0 +1,397 @@
+# trackers/realtime.py
+import os
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from trackers.camera_motion import CameraMotionEstimator
+from trackers.perspective_transform import PerspectiveTransformer, default_field_corners
+from trackers.renderer import AnnotationRenderer
+from trackers.speed_distance import LiveSpeedDistance
+from trackers.track_store import CLASS_NAMES
+
+class LiveSource:
+    def __init__(self, source, fps=None, pace=None, size=None):
+        """
+        Frames from a video file, capture device or raw pipe, as they arrive
+
+        Frames are read on a background thread into a single slot. When the
+        consumer is slower than the source, the frame waiting in the slot is
+        replaced by the newer one and counted as dropped, so the consumer
+        always gets the most recent frame instead of falling further behind.
+        A file is paced to wall-clock at its fps (like a live feed) unless
+        pace is False, in which case nothing is dropped and frames come as
+        fast as they are consumed.
+
+        Args:
+            source: Video path or URL, capture device index (int or digit
+                string), or '-' for raw BGR frames on stdin (needs size)
+            fps: Source frame rate (default: from the source, else 25)
+            pace: Pace reading to fps (default: True for files)
+            size: (width, height) of raw frames on stdin
+        """
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.is_pipe = source == '-'
+        self.is_file = isinstance(source, str) and not self.is_pipe and os.path.exists(source)
+        self.size = size
+        self.cap = None
+        if self.is_pipe:
+            if size is None:
+                raise ValueError("Reading frames from stdin needs their size (width, height)")
+        else:
+            self.cap = cv2.VideoCapture(source)
+            if not self.cap.isOpened():
+                raise ValueError(f"Could not open video source: {source}")
+        self.fps = fps or (self.cap.get(cv2.CAP_PROP_FPS) if self.cap is not None else 0) or 25.0
+        self.pace = self.is_file if pace is None else pace
+        self.drop = self.pace or not self.is_file
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.error = None
+        self._latest = None
+        self._done = False
+        self._stop = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def read(self):
+        """Next frame from the source, None at the end"""
+        if self.is_pipe:
+            width, height = self.size
+            data = sys.stdin.buffer.read(width * height * 3)
+            if len(data) < width * height * 3:
+                return None
+            # frombuffer views the immutable bytes; copy so the frame can be drawn on
+            return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3).copy()
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def __iter__(self):
+        """Yield (frame_num, frame, capture_time); frame_num counts source frames, so drops leave gaps"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                with self._condition:
+                    while self._latest is None and not self._done:
+                        self._condition.wait()
+                    item, self._latest = self._latest, None
+                    self._condition.notify_all()
+                if item is None:
+                    break
+                yield item
+            if self.error is not None:
+                raise RuntimeError(f"Reading {self.source} failed") from self.error
+        finally:
+            self.close()
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            frame_num = 0
+            while not self._stop:
+                frame = self.read()
+                if frame is None:
+                    break
+                if self.pace:
+                    delay = start + frame_num / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                with self._condition:
+                    while not self.drop and self._latest is not None and not self._stop:
+                        self._condition.wait()
+                    if self._latest is not None:
+                        self.frames_dropped += 1
+                    self._latest = (frame_num, frame, time.perf_counter())
+                    self._condition.notify_all()
+                self.frames_read += 1
+                frame_num += 1
+        except BaseException as error:
+            self.error = error
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class RealtimeProcessor:
+    def __init__(self, tracker, fps, latency_budget_ms=None, max_detect_every=8, max_render_every=4,
+                 min_input_size=320, recover_fraction=0.6, cooldown_frames=15, max_gap_seconds=0.5,
+                 max_valid_speed=12.5, speed_smoothing=0.5, emit_every=1.0):
+        """
+        Detect, track, measure and render each frame as it arrives
+
+        Every frame is tracked with ByteTrack on detections that either come
+        from the detector or, between keyframes, are propagated from the
+        previous frame with optical flow (see DetectionScheduler.propagate).
+        Camera pan is followed with CameraMotionEstimator and speed and
+        distance are updated per player on every frame.
+
+        The latency of a frame is measured from its capture to the end of its
+        processing. While the smoothed latency is over the budget, the
+        processor degrades one step at a time: first it detects less often
+        (up to max_detect_every), then it renders fewer frames (up to every
+        max_render_every frames), then it lowers the detector's input size
+        in multiples of 32 (down to min_input_size; only for detectors with a
+        dynamic input size). Lowering scale_factor would not help: with a
+        pitch crop the detector gets a full-size crop, and either way it is
+        resized to the detector's input size. Once latency is back under
+        recover_fraction of the budget, the steps are undone in reverse order.
+
+        Args:
+            tracker: Tracker providing the detector, ByteTrack and scale_factor
+            fps: Source frame rate
+            latency_budget_ms: Per-frame budget (default: one frame interval)
+            max_detect_every: Largest keyframe stride when degrading
+            max_render_every: Render only every nth frame at most when degrading
+            min_input_size: Smallest detector input size when degrading
+            recover_fraction: Fraction of the budget under which steps are undone
+            cooldown_frames: Frames between two changes of the settings
+            max_gap_seconds: Longer gaps in a track do not count as movement
+            max_valid_speed: Steps faster than this (m/s) are treated as glitches
+            speed_smoothing: Weight of the previous speed in the displayed speed
+            emit_every: Seconds between live statistics updates
+        """
+        self.tracker = tracker
+        self.fps = fps
+        self.budget = (latency_budget_ms or 1000.0 / fps) / 1000.0
+        self.max_detect_every = max_detect_every
+        self.max_render_every = max_render_every
+        self.recover_fraction = recover_fraction
+        self.cooldown_frames = cooldown_frames
+        self.max_gap = max(1, int(round(max_gap_seconds * fps)))
+        self.emit_every = emit_every
+        self.flow_scale = tracker.scale_factor
+        # Detector input sizes from the initial one down, each a multiple of the YOLO stride
+        self.input_sizes = [tracker.detector.input_size]
+        while tracker.detector.dynamic_input_size and self.input_sizes[-1] > min_input_size:
+            self.input_sizes.append(max(int(self.input_sizes[-1] * 0.75) // 32 * 32, min_input_size))
+        self.base_detect_every = max(1, tracker.detection_scheduler.detect_every)
+        self.class_codes = tracker.class_codes()
+        self.renderer = tracker.renderer or AnnotationRenderer(num_workers=1)
+        self.camera_motion_estimator = CameraMotionEstimator()
+        self.perspective_transformer = PerspectiveTransformer()
+        self.speed_distance = LiveSpeedDistance(self.perspective_transformer, fps, self.max_gap, max_valid_speed,
+                                                speed_smoothing)
+        self.reset()
+
+    def reset(self):
+        self.detect_every = self.base_detect_every
+        self.render_every = 1
+        self.size_level = 0
+        self.tracker.detector.input_size = self.input_sizes[0]
+        self.speed_distance.reset()
+        self.camera_offset = np.zeros(2)
+        self.prev_gray = None
+        self.prev_detections = None
+        self.last_keyframe = None
+        self.latency = None
+        self.last_change = 0
+        self.frames_processed = 0
+        self.detector_calls = 0
+        self.frames_rendered = 0
+        self.changes = []
+        self.camera_motion_estimator.reset()
+
+    @property
+    def settings(self):
+        return {'detect_every': self.detect_every, 'render_every': self.render_every,
+                'input_size': self.input_sizes[self.size_level]}
+
+    def detect(self, frame_num, frame, gray):
+        """Detections of this frame in full-frame pixels, from the detector or propagated by flow"""
+        scheduler = self.tracker.detection_scheduler
+        if self.prev_detections is not None and frame_num - self.last_keyframe < self.detect_every:
+            previous = self.prev_detections[:]
+            previous.xyxy = previous.xyxy * self.flow_scale
+            detections, lost, motion = scheduler.propagate(self.prev_gray, gray, previous)
+            if lost <= scheduler.max_lost and motion <= scheduler.motion_threshold:
+                detections.xyxy = detections.xyxy / self.flow_scale
+                return detections
+
+        # The pitch crop is cut from the full-size frame; otherwise detect on the cached downscaled frame
+        small_frames = None
+        if self.tracker.pitch_region is None:
+            small_frames = [self.tracker.downscale_frame(frame, frame_num)]
+        detections = self.tracker.predict([frame], small_frames)[0]
+        detections.xyxy = detections.xyxy / self.tracker.scale_factor
+        self.last_keyframe = frame_num
+        self.detector_calls += 1
+        return detections
+
+    def process(self, frame_num, frame, perf_tracker=None):
+        """Run one frame through the pipeline
+
+        Returns (player_dict, referee_dict) in the renderer's format.
+        """
+        if self.perspective_transformer.transform_matrix is None:
+            self.perspective_transformer.set_field_corners(frame, default_field_corners(frame))
+
+        if self.tracker.pitch_region is None:
+            # From the tracker's frame cache: detection reuses the downscaled frame this is made from
+            gray = self.tracker.frame_cache.gray(frame, frame_num, self.flow_scale)
+        else:
+            # The detector gets the full-size pitch crop, so there is nothing to share
+            gray = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=self.flow_scale, fy=self.flow_scale),
+                                cv2.COLOR_BGR2GRAY)
+        boxes = self.prev_detections.xyxy * self.flow_scale if self.prev_detections is not None else None
+        dx, dy = self.camera_motion_estimator.update(gray, boxes)
+        self.camera_offset += np.array([dx, dy]) / self.flow_scale
+
+        if perf_tracker is not None:
+            with perf_tracker.frame('detect'):
+                detections = self.detect(frame_num, frame, gray)
+        else:
+            detections = self.detect(frame_num, frame, gray)
+        self.prev_gray, self.prev_detections = gray, detections
+
+        tracked = self.tracker.tracker.update_with_detections(detections)
+        codes = self.class_codes[tracked.class_id]
+        players = codes == CLASS_NAMES.index('Player')
+        states = self.speed_distance.update(frame_num, tracked.xyxy[players], tracked.tracker_id[players],
+                                            self.camera_offset)
+
+        player_dict = {track_id: dict(state, bbox=bbox)
+                       for track_id, state, bbox in zip(tracked.tracker_id[players].tolist(), states,
+                                                        tracked.xyxy[players])}
+        referees = codes == CLASS_NAMES.index('ref')
+        referee_dict = {track_id: {'bbox': bbox}
+                        for track_id, bbox in zip(tracked.tracker_id[referees].tolist(), tracked.xyxy[referees])}
+        return player_dict, referee_dict
+
+    def adapt(self, latency):
+        """Degrade or recover the settings from the smoothed latency of the frames so far"""
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.frames_processed - self.last_change < self.cooldown_frames:
+            return
+        if self.latency > self.budget:
+            changed = self._degrade()
+        elif self.latency < self.recover_fraction * self.budget:
+            changed = self._recover()
+        else:
+            return
+        if changed:
+            self.last_change = self.frames_processed
+            self.changes.append({'frame': self.frames_processed, 'latency_ms': round(self.latency * 1000, 1),
+                                 **self.settings})
+            print(f"Latency {self.latency * 1000:.1f} ms (budget {self.budget * 1000:.1f} ms): {self.settings}")
+
+    def _degrade(self):
+        if self.detect_every < self.max_detect_every:
+            self.detect_every = min(self.detect_every * 2, self.max_detect_every)
+        elif self.render_every < self.max_render_every:
+            self.render_every += 1
+        elif self.size_level < len(self.input_sizes) - 1:
+            self._set_size_level(self.size_level + 1)
+        else:
+            return False
+        return True
+
+    def _recover(self):
+        if self.size_level > 0:
+            self._set_size_level(self.size_level - 1)
+        elif self.render_every > 1:
+            self.render_every -= 1
+        elif self.detect_every > self.base_detect_every:
+            self.detect_every = max(self.detect_every // 2, self.base_detect_every)
+        else:
+            return False
+        return True
+
+    def _set_size_level(self, size_level):
+        self.size_level = size_level
+        self.tracker.detector.input_size = self.input_sizes[size_level]
+
+    def live_stats(self, frame_num):
+        """Current speed and distance of every player seen so far"""
+        return {
+            'frame': frame_num,
+            'video_time': round(frame_num / self.fps, 2),
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'players': [{'id': track_id, 'speed': round(player['velocity'], 2),
+                         'distance': round(player['distance'], 1), 'top_speed': round(player['top_speed'], 2),
+                         'visible': frame_num - player['frame'] <= self.max_gap}
+                        for track_id, player in sorted(self.speed_distance.players.items())],
+        }
+
+    def run(self, source, encoder=None, display=False, on_stats=None, perf_tracker=None):
+        """Process a LiveSource until it ends (or q is pressed in the display window)
+
+        Rendered frames go to encoder (a VideoEncoder) and/or a display
+        window. Frames that are dropped or not rendered repeat the last
+        rendered frame in the recording, so it stays in step with the
+        source. on_stats(live_stats) is called every emit_every seconds.
+        Returns a summary of the run.
+        """
+        self.reset()
+        last_output, last_output_num = None, None
+        last_emit = time.perf_counter()
+        frame_num = -1
+        for frame_num, frame, capture_time in source:
+            player_dict, referee_dict = self.process(frame_num, frame, perf_tracker)
+
+            if self.frames_processed % self.render_every == 0:
+                if perf_tracker is not None:
+                    with perf_tracker.frame('render'):
+                        self.renderer.render(frame, self.renderer.frame_items(player_dict, referee_dict))
+                else:
+                    self.renderer.render(frame, self.renderer.frame_items(player_dict, referee_dict))
+                self.frames_rendered += 1
+                last_output = frame
+                if display:
+                    cv2.imshow('Live tracking', frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+            if encoder is not None and last_output is not None:
+                repeats = frame_num - last_output_num if last_output_num is not None else 1
+                for _ in range(max(repeats, 1)):
+                    encoder.write(last_output)
+                last_output_num = frame_num
+
+            self.frames_processed += 1
+            latency = time.perf_counter() - capture_time
+            if perf_tracker is not None:
+                perf_tracker.record_frame('latency', latency)
+            self.adapt(latency)
+
+            if on_stats is not None and time.perf_counter() - last_emit >= self.emit_every:
+                on_stats(self.live_stats(frame_num))
+                last_emit = time.perf_counter()
+
+        if display:
+            cv2.destroyAllWindows()
+        if on_stats is not None and frame_num >= 0:
+            on_stats(self.live_stats(frame_num))
+
+        frames_seen = frame_num + 1
+        summary = {
+            'budget_ms': round(self.budget * 1000, 1),
+            'frames_read': frames_seen,
+            'frames_processed': self.frames_processed,
+            'frames_dropped': frames_seen - self.frames_processed,
+            'detector_calls': self.detector_calls,
+            'frames_rendered': self.frames_rendered,
+            'frame_cache_hit_rate': round(self.tracker.frame_cache.hit_rate(), 3),
+            'final_settings': self.settings,
+            'changes': self.changes,
+        }
+        if perf_tracker is not None and 'latency' in perf_tracker.frame_summary():
+            summary['latency'] = perf_tracker.frame_summary()['latency']
+        print(f"Processed {self.frames_processed}/{frames_seen} frames "
+              f"({summary['frames_dropped']} dropped), detector on {self.detector_calls}, "
+              f"rendered {self.frames_rendered}")
+        return summary
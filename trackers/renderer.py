@@ -0,0 +1,228 @@
+# trackers/renderer.py
+import os
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# Modern color schemes for teams
+TEAM_COLORS = [
+    {"primary": (59, 89, 152), "secondary": (223, 227, 238)},    # Blue
+    {"primary": (176, 58, 46), "secondary": (241, 221, 219)},    # Red
+    {"primary": (46, 134, 87), "secondary": (221, 236, 230)}     # Green
+]
+
+# Referee color
+REF_COLOR = {"primary": (255, 204, 0), "secondary": (30, 30, 30)}
+
+PLAYER_ELLIPSE_COLOR = (255, 255, 255)
+PLAYER_TEXT_COLOR = (255, 0, 0)
+REF_LABEL_COLOR = (240, 240, 200)
+REF_TEXT_COLOR = (0, 0, 0)
+
+class AnnotationRenderer:
+    def __init__(self, num_workers=None, alpha=0.7, font_scale=0.6, font_thickness=1, line_thickness=3,
+                 max_cached_labels=4096):
+        """
+        Draw player/referee annotations at native resolution
+
+        Instead of drawing onto a full-frame layer and blending the whole
+        frame, each frame's ellipses and labels are grouped into their
+        (merged) bounding rectangles, drawn onto small patches and blended
+        into those rectangles only, in the same per-object order as a full
+        annotation layer. Labels are composed from cached patches: the
+        background box with the static part ("ID:7 ") and one patch per word
+        of the changing speed/distance, so a new reading is usually a few
+        copies instead of a text render. Frames are rendered on a thread
+        pool and yielded in order.
+
+        Args:
+            num_workers: Render threads (None = CPU count)
+            alpha: Weight of the annotations when blended onto the frame
+            font_scale: Label font scale
+            font_thickness: Label font thickness
+            line_thickness: Ellipse line thickness
+            max_cached_labels: Cached label pieces; the least recently used go first
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.alpha = alpha
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.font_scale = font_scale
+        self.font_thickness = font_thickness
+        self.line_thickness = line_thickness
+        self.max_cached_labels = max_cached_labels
+        self.patches = OrderedDict()
+        self.label_hits = 0
+        self.label_misses = 0
+        self.pad = 10
+        # Hershey text height depends on the font size only
+        (_, self.text_height), _ = cv2.getTextSize("ID:0", self.font, self.font_scale, self.font_thickness)
+        (space_width, _), _ = cv2.getTextSize(" ", self.font, self.font_scale, self.font_thickness)
+        self._space_advance = space_width - self.font_thickness
+
+    def _text_patch(self, text, background, color, min_width=0):
+        """Background box with text at the left pad, as wide as the text (or min_width)"""
+        (text_width, _), _ = cv2.getTextSize(text, self.font, self.font_scale, self.font_thickness)
+        patch = np.empty((self.text_height + self.pad, max(text_width + self.pad, min_width), 3), dtype=np.uint8)
+        patch[:] = background
+        cv2.putText(patch, text, (self.pad, self.text_height + self.pad // 2), self.font, self.font_scale, color,
+                    self.font_thickness, cv2.LINE_8)
+        return patch
+
+    def _cached(self, key, build):
+        """LRU lookup of label pieces (static patches and glyph masks)"""
+        value = self.patches.get(key)
+        if value is not None:
+            self.patches.move_to_end(key)
+            self.label_hits += 1
+            return value
+        self.label_misses += 1
+        value = self.patches[key] = build()
+        if len(self.patches) > self.max_cached_labels:
+            self.patches.popitem(last=False)
+        return value
+
+    def _word(self, word, background, color):
+        """(pixels, advance) of one word, starting at the word's origin"""
+        def build():
+            pixels = self._text_patch(word, background, color)[:, self.pad:]
+            return pixels, pixels.shape[1] - self.font_thickness
+        return self._cached(('word', word, background, color), build)
+
+    def label(self, static_text, background, color, dynamic_text='', min_width=0):
+        """Label patch (background box with text) built from cached pieces
+
+        static_text is rendered once and cached with its background. The
+        words of dynamic_text ("3.4m/s", "56m") change from frame to frame
+        but take few distinct values, so each is cached too and stamped at
+        the position putText would use. Those positions only match putText
+        for 1-pixel text, so thicker text renders dynamic_text whole.
+        """
+        if dynamic_text and self.font_thickness != 1:
+            return self._text_patch(static_text + dynamic_text, background, color, min_width)
+        if not dynamic_text:
+            return self._cached(('text', static_text, background, color, min_width),
+                                lambda: self._text_patch(static_text, background, color, min_width))
+
+        static = self._cached(('text', static_text, background, color, 0),
+                              lambda: self._text_patch(static_text, background, color))
+        # Words are separated by spaces, so their patches never overlap and are copied whole
+        words = [self._word(word, background, color) if word != ' ' else (None, self._space_advance)
+                 for word in re.split(r'( )', dynamic_text) if word]
+        # Where putText would continue after static_text
+        x = static.shape[1] - self.font_thickness
+        width = x + sum(advance for _, advance in words) + self.font_thickness
+        patch = np.empty((static.shape[0], max(width, min_width), 3), dtype=np.uint8)
+        patch[:] = background
+        patch[:, :static.shape[1]] = static
+        for pixels, advance in words:
+            if pixels is not None:
+                patch[:, x:x + pixels.shape[1]] = pixels
+            x += advance
+        return patch
+
+    def frame_items(self, player_dict, referee_dict):
+        """Ellipses ('ellipse', (center, axes, color)) and labels ('label', (x, y, patch)) of one frame
+
+        Items are in drawing order: each object's ellipse, then its label.
+        """
+        items = []
+        for track_id, player in player_dict.items():
+            x1, y1, x2, y2 = [int(coord) for coord in player["bbox"]]
+            colors = TEAM_COLORS[player.get('team', 0) % len(TEAM_COLORS)]
+            width = abs(x2 - x1)
+            items.append(('ellipse', ((int((x1 + x2) / 2), y2), (width, int(0.35 * width)), PLAYER_ELLIPSE_COLOR)))
+
+            velocity = player.get('velocity', 0.0)
+            distance = player.get('distance', 0.0)
+            patch = self.label(f"ID:{track_id} ", colors["secondary"], PLAYER_TEXT_COLOR,
+                               dynamic_text=f"{velocity:.1f}m/s {distance:.0f}m")
+            items.append(('label', (x1, y1, patch)))
+
+        for track_id, referee in referee_dict.items():
+            x1, y1, x2, y2 = [int(coord) for coord in referee["bbox"]]
+            width = abs(x2 - x1)
+            items.append(('ellipse', ((int((x1 + x2) / 2), y2), (width, int(0.35 * width)), REF_COLOR["primary"])))
+            items.append(('label', (x1, y1, self.label(f"REF:{track_id}", REF_LABEL_COLOR, REF_TEXT_COLOR,
+                                                       min_width=140))))
+        return items
+
+    def render(self, frame, items):
+        """Blend the frame_items into frame in place, touching only their rectangles"""
+        h, w = frame.shape[:2]
+        pad = self.line_thickness
+        rects = []
+        for kind, item in items:
+            if kind == 'ellipse':
+                (cx, cy), (ax, ay), _ = item
+                rects.append(((cx - ax - pad, cy - ay - pad, cx + ax + pad + 1, cy + ay + pad + 1), kind, item))
+            else:
+                x, y, patch = item
+                rects.append(((x, y - patch.shape[0], x + patch.shape[1], y), kind, item))
+
+        for (x1, y1, x2, y2), group in merge_rects(rects):
+            x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            layer = np.zeros((y2 - y1, x2 - x1, 3), dtype=np.uint8)
+            # Draw in the frame's order, so overlapping annotations stack as on a single layer
+            for _, (kind, item) in sorted(group, key=lambda entry: entry[0]):
+                if kind == 'ellipse':
+                    (cx, cy), axes, color = item
+                    cv2.ellipse(layer, center=(cx - x1, cy - y1), axes=axes, angle=0.0, startAngle=-45,
+                                endAngle=235, color=color, thickness=self.line_thickness, lineType=cv2.LINE_8)
+                else:
+                    paste(layer, item[2], item[0] - x1, item[1] - item[2].shape[0] - y1)
+
+            roi = frame[y1:y2, x1:x2]
+            frame[y1:y2, x1:x2] = cv2.addWeighted(roi, 1.0, layer, self.alpha, 0)
+        return frame
+
+    def iter_render(self, video_frames, tracks):
+        """Yield annotated frames in order, rendering up to 2 * num_workers frames at once
+
+        Track lookups happen on the calling thread (TrackFile keeps one chunk
+        loaded), only the drawing runs on the pool.
+        """
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            for frame_num, frame in enumerate(video_frames):
+                items = self.frame_items(tracks['Player'][frame_num], tracks['ref'][frame_num])
+                in_flight.append(pool.submit(self.render, frame, items))
+                if len(in_flight) >= 2 * self.num_workers:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+
+def merge_rects(rects):
+    """Merge overlapping (rect, kind, item) entries
+
+    Returns [(rect, [(index, (kind, item)), ...])] where index is the
+    position of the entry in rects.
+    """
+    groups = [(rect, [(index, (kind, item))]) for index, (rect, kind, item) in enumerate(rects)]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for rect, items in groups:
+            for i, (other, other_items) in enumerate(result):
+                if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                    result[i] = ((min(rect[0], other[0]), min(rect[1], other[1]),
+                                  max(rect[2], other[2]), max(rect[3], other[3])), other_items + items)
+                    merged = True
+                    break
+            else:
+                result.append((rect, items))
+        groups = result
+    return groups
+
+def paste(layer, patch, x, y):
+    """Copy patch into layer at (x, y), clipped to the layer"""
+    h, w = layer.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + patch.shape[1], w), min(y + patch.shape[0], h)
+    if x2 > x1 and y2 > y1:
+        layer[y1:y2, x1:x2] = patch[y1 - y:y2 - y, x1 - x:x2 - x]
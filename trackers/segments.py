@@ -0,0 +1,272 @@
+# trackers/segments.py
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils import get_video_info, iter_video
+from trackers.team_assignment import TeamClassifier
+from trackers.track_store import TrackStore, COLUMNS, CLASS_NAMES
+
+def split_segments(num_frames, num_segments, overlap=30):
+    """(start, stop, overlap) of each segment
+
+    A segment owns frames [start, stop) but is processed from start - overlap,
+    so its tracker is warmed up and its tracks can be matched to the previous
+    segment's in the overlap frames.
+    """
+    num_segments = max(1, min(num_segments, num_frames // max(2 * overlap, 1) or 1))
+    bounds = np.linspace(0, num_frames, num_segments + 1).astype(int)
+    return [(int(start), int(stop), min(overlap, int(start))) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def process_segment(video_path, start, stop, overlap, model_path, tracker_options, process_options):
+    """Detect, track, measure and sample jerseys in one segment (runs in a worker)
+
+    Frames are numbered from start - overlap in the returned tracks and
+    camera motion. stop=None reads to the end of the video; the tracks'
+    num_frames is the number of frames actually decoded.
+    """
+    from trackers.tracker import Tracker
+
+    tracker = Tracker(model_path, **tracker_options)
+    first = start - overlap
+    tracks = tracker.get_object_tracks(iter_video(video_path, first, stop, exact=True))
+    tracks = tracker.process_video(iter_video(video_path, first, stop, exact=True), tracks, **process_options)
+    classifier = tracker.team_classifier
+    num_features = classifier.sample_features[0].shape[1] if classifier.sample_features else 0
+    return {
+        'start': start, 'stop': stop, 'overlap': overlap,
+        'tracks': tracks,
+        'camera_motion': tracker.camera_motion,
+        'sample_track_ids': np.asarray(classifier.sample_track_ids, dtype=np.int64),
+        'sample_features': (np.concatenate(classifier.sample_features) if classifier.sample_features
+                            else np.empty((0, num_features), dtype=np.float32)),
+        'sample_colors': (np.concatenate(classifier.sample_colors) if classifier.sample_colors
+                          else np.empty((0, 3))),
+    }
+
+def mean_track_features(track_ids, features):
+    """{track_id: mean jersey feature} from per-sample features"""
+    if len(track_ids) == 0:
+        return {}
+    unique_ids, index = np.unique(track_ids, return_inverse=True)
+    sums = np.zeros((len(unique_ids), features.shape[1]))
+    np.add.at(sums, index, features)
+    means = sums / np.bincount(index)[:, None]
+    return dict(zip(unique_ids.tolist(), means))
+
+def box_iou(boxes_a, boxes_b):
+    """(len(a), len(b)) IoU matrix of two sets of xyxy boxes"""
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+def match_overlap(prev, prev_first, following, following_first, frames, prev_features=None,
+                  following_features=None, min_iou=0.3, max_feature_distance=0.5, feature_weight=0.5):
+    """Match the tracks of two segments on their common frames
+
+    prev and following are TrackStores numbered from prev_first and
+    following_first. A pair of tracks scores its mean box IoU over the
+    frames where either of them appears (boxes of different classes never
+    match), minus feature_weight times the distance between their mean
+    jersey features (half the L1 distance of the histograms). Pairs are
+    taken greedily from the best score. Returns {(class_id, following_id): prev_id}.
+    """
+    prev_features = prev_features or {}
+    following_features = following_features or {}
+    iou_sums, common, seen = {}, {}, {}
+    for frame_num in frames:
+        rows_a = prev.frame_rows(frame_num - prev_first)
+        rows_b = following.frame_rows(frame_num - following_first)
+        keys_a = list(zip(prev.class_id[rows_a].tolist(), prev.track_id[rows_a].tolist()))
+        keys_b = list(zip(following.class_id[rows_b].tolist(), following.track_id[rows_b].tolist()))
+        for key in keys_a:
+            seen[('a',) + key] = seen.get(('a',) + key, 0) + 1
+        for key in keys_b:
+            seen[('b',) + key] = seen.get(('b',) + key, 0) + 1
+        if not keys_a or not keys_b:
+            continue
+        iou = box_iou(prev.row_bboxes(rows_a), following.row_bboxes(rows_b))
+        same_class = prev.class_id[rows_a][:, None] == following.class_id[rows_b][None, :]
+        for i, j in zip(*np.nonzero((iou > 0) & same_class)):
+            pair = (keys_a[i], keys_b[j])
+            iou_sums[pair] = iou_sums.get(pair, 0.0) + float(iou[i, j])
+            common[pair] = common.get(pair, 0) + 1
+
+    candidates = []
+    for (key_a, key_b), iou_sum in iou_sums.items():
+        frames_either = seen[('a',) + key_a] + seen[('b',) + key_b] - common[(key_a, key_b)]
+        mean_iou = iou_sum / frames_either
+        feature_distance = 0.0
+        if key_a[1] in prev_features and key_b[1] in following_features:
+            feature_distance = 0.5 * float(np.abs(prev_features[key_a[1]] - following_features[key_b[1]]).sum())
+        if mean_iou >= min_iou and feature_distance <= max_feature_distance:
+            candidates.append((mean_iou - feature_weight * feature_distance, key_a, key_b))
+
+    matches, used = {}, set()
+    for _, key_a, key_b in sorted(candidates, reverse=True):
+        if key_a in used or key_b in matches:
+            continue
+        matches[key_b] = key_a[1]
+        used.add(key_a)
+    return matches
+
+def _distance_offset(prev, prev_first, prev_key, following, following_first, following_key, frames):
+    """Distance to add to a following track so it continues the prev track
+
+    Taken at the last frame of the overlap where both tracks have a row.
+    """
+    rows_a = prev.track_rows(prev_key[1], CLASS_NAMES[prev_key[0]])
+    rows_b = following.track_rows(following_key[1], CLASS_NAMES[following_key[0]])
+    frames_a = prev.frame[rows_a] + prev_first
+    frames_b = following.frame[rows_b] + following_first
+    both = np.intersect1d(frames_a[np.isin(frames_a, frames)], frames_b)
+    if len(both) == 0:
+        return 0.0
+    frame_num = both[-1]
+    offset = prev.distance[rows_a[frames_a == frame_num][0]] - following.distance[rows_b[frames_b == frame_num][0]]
+    return 0.0 if np.isnan(offset) else float(offset)
+
+def stitch_segments(results, **match_options):
+    """Merge per-segment results into one TrackStore with video-wide track ids
+
+    Each segment's tracks are matched to the previous segment's in the
+    overlap frames (see match_overlap); matched tracks keep the previous
+    global id and their cumulative distance continues from where the
+    previous segment left it. Unmatched tracks get new ids. Only the rows
+    of the frames a segment owns are kept.
+
+    Lengths come from the frames each segment actually decoded, not from
+    the planned bounds: a segment must continue exactly where the previous
+    one ended (ValueError otherwise), and segments past the end of the
+    video are dropped.
+
+    Returns (tracks, camera_motion, id_maps) where id_maps[i] maps
+    (class_id, local track id) of segment i to its global id.
+    """
+    id_maps, columns, camera_motion = [], {name: [] for name in COLUMNS}, []
+    next_id = 1
+    stitched = 0
+    prev = None
+    num_frames = 0
+    for result in results:
+        tracks, start, overlap = result['tracks'], result['start'], result['overlap']
+        first = start - overlap
+        if tracks.num_frames <= overlap:
+            # Planned from an overestimated frame count: the video ended before this segment
+            id_maps.append({})
+            continue
+        if start != num_frames:
+            raise ValueError(f"Segment starting at frame {start} does not continue the previous segment, "
+                             f"which ended at frame {num_frames}")
+        tracks.consolidate()
+        features = mean_track_features(result['sample_track_ids'], result['sample_features'])
+
+        id_map = {}
+        if prev is not None and overlap > 0:
+            frames = np.arange(first, start)
+            prev_first = prev['start'] - prev['overlap']
+            matches = match_overlap(prev['tracks'], prev_first, tracks, first, frames,
+                                    prev['features'], features, **match_options)
+            stitched += len(matches)
+            for key, prev_id in matches.items():
+                id_map[key] = prev['id_map'][(key[0], prev_id)]
+                offset = _distance_offset(prev['tracks'], prev_first, (key[0], prev_id), tracks, first, key, frames)
+                if offset:
+                    tracks.distance[tracks.track_rows(key[1], CLASS_NAMES[key[0]])] += offset
+
+        _, keys, _ = tracks.track_index()
+        for class_id, track_id in keys.tolist():
+            if (class_id, track_id) not in id_map:
+                id_map[(class_id, track_id)] = next_id
+                next_id += 1
+        id_maps.append(id_map)
+
+        kept = tracks.frame >= overlap
+        for name in COLUMNS:
+            columns[name].append(getattr(tracks, name)[kept])
+        columns['frame'][-1] = columns['frame'][-1] + first
+        columns['track_id'][-1] = np.array([id_map[key] for key in zip(tracks.class_id[kept].tolist(),
+                                                                        tracks.track_id[kept].tolist())],
+                                           dtype=np.int64)
+        motion = result['camera_motion']
+        if motion is not None:
+            if len(motion) != tracks.num_frames:
+                raise ValueError(f"Segment starting at frame {start} has camera motion for {len(motion)} "
+                                 f"frames but tracks for {tracks.num_frames}")
+            camera_motion.append(np.asarray(motion)[overlap:])
+        num_frames = first + tracks.num_frames
+        prev = dict(result, features=features, id_map=id_map)
+
+    print(f"Stitched {stitched} tracks across {max(len(results) - 1, 0)} segment boundaries")
+    merged = TrackStore.from_columns(num_frames, **{name: np.concatenate(parts) if parts else []
+                                                     for name, parts in columns.items()})
+    camera_motion = np.concatenate(camera_motion) if camera_motion else np.zeros((num_frames, 2), dtype=np.float32)
+    if len(camera_motion) != num_frames:
+        raise ValueError(f"Stitched camera motion covers {len(camera_motion)} frames, tracks cover {num_frames}")
+    return merged, camera_motion, id_maps
+
+def assign_teams(results, id_maps, tracks, n_teams=2):
+    """Fit one team clustering on the jerseys sampled by all segments
+
+    Each segment fits its own clusters, so its team labels can be swapped
+    relative to the others; refitting on the pooled samples (under global
+    track ids) gives labels that agree across the whole video.
+    """
+    classifier = TeamClassifier(n_teams=n_teams)
+    for result, id_map in zip(results, id_maps):
+        if len(result['sample_track_ids']) == 0:
+            continue
+        classifier.sample_features.append(result['sample_features'])
+        classifier.sample_colors.append(result['sample_colors'])
+        player = CLASS_NAMES.index('Player')
+        classifier.sample_track_ids += [id_map.get((player, track_id), -1)
+                                        for track_id in result['sample_track_ids'].tolist()]
+    tracks.map_track_values('team', classifier.fit())
+    return classifier.team_colors()
+
+def process_video_segments(video_path, model_path, num_segments=None, overlap=30, num_workers=None,
+                           tracker_options=None, process_options=None, **match_options):
+    """Split a video into segments, process them on a process pool and stitch the results
+
+    Every worker runs detection, tracking, flow, camera motion and
+    velocity on its own segment (with its own ByteTrack), so a full match
+    uses all cores instead of one. Returns (tracks, camera_motion,
+    team_colors) for the whole video, as Tracker.get_object_tracks
+    followed by process_video would.
+
+    Args:
+        video_path: Video to process
+        model_path: Detection model, loaded once per worker
+        num_segments: Number of segments (default: num_workers)
+        overlap: Frames each segment shares with the previous one
+        num_workers: Worker processes (default: CPU count)
+        tracker_options: Passed to Tracker (e.g. scale_factor, backend, num_threads)
+        process_options: Passed to Tracker.process_video (e.g. frame_skip, frame_rate)
+        match_options: Passed to match_overlap
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    num_frames = get_video_info(video_path)['frame_count']
+    segments = split_segments(num_frames, num_segments or num_workers, overlap)
+    # The frame count is an estimate: the last segment reads to the actual end
+    segments[-1] = segments[-1][0], None, segments[-1][2]
+    print(f"Processing ~{num_frames} frames in {len(segments)} segments on {num_workers} workers")
+
+    pool_options = {}
+    if sys.version_info >= (3, 11):
+        pool_options = {'max_tasks_per_child': 1, 'mp_context': multiprocessing.get_context('spawn')}
+    with ProcessPoolExecutor(max_workers=min(num_workers, len(segments)), **pool_options) as pool:
+        futures = [pool.submit(process_segment, video_path, start, stop, segment_overlap, model_path,
+                               tracker_options or {}, process_options or {})
+                   for start, stop, segment_overlap in segments]
+        results = [future.result() for future in futures]
+
+    tracks, camera_motion, id_maps = stitch_segments(results, **match_options)
+    team_colors = assign_teams(results, id_maps, tracks)
+    return tracks, camera_motion, team_colors
@@ -1,54 +1,63 @@
 # trackers/speed_distance.py
 import cv2
 import numpy as np
-from trackers.optical_flow import estimate_camera_motion, compensate_camera_motion
+from trackers.track_store import TrackStore, CLASS_NAMES
 
-def calculate_player_velocity(tracks, flow_vectors, perspective_transformer, frame_num, frame_rate=30.0):
-    """Calculate velocity for each player using optical flow and perspective transformation"""
-    if frame_num >= len(flow_vectors):
-        return {}
-    
-    velocities = {}
-    flow = flow_vectors[frame_num]
-    
-    # Calculate camera motion
-    camera_motion = estimate_camera_motion(flow)
-    
-    # Compensate for camera motion
-    compensated_flow = compensate_camera_motion(flow, camera_motion)
-    
-    for track_id, player in tracks['Player'][frame_num].items():
-        bbox = player["bbox"]
-        x1, y1, x2, y2 = [int(coord) for coord in bbox]
-        
-        # Get center point of bottom of bbox (feet position)
-        foot_point = (int((x1 + x2) / 2), int(y2))
-        
-        # Check if point is within flow bounds
-        h, w = flow.shape[:2]
-        if 0 <= foot_point[0] < w and 0 <= foot_point[1] < h:
-            # Get flow vector at foot position
-            flow_x = compensated_flow[foot_point[1], foot_point[0], 0]
-            flow_y = compensated_flow[foot_point[1], foot_point[0], 1]
-            
-            # Transform points to real-world coordinates
-            p1 = perspective_transformer.transform_point(foot_point)
-            p2 = perspective_transformer.transform_point((foot_point[0] + flow_x, foot_point[1] + flow_y))
-            
-            # Calculate displacement in meters
-            dx = p2[0] - p1[0]
-            dy = p2[1] - p1[1]
-            
-            # Calculate velocity in m/s
-            displacement = np.sqrt(dx**2 + dy**2)
-            velocity = displacement * frame_rate  # Convert to m/s
-            
-            velocities[track_id] = velocity
-    
-    return velocities
+def calculate_speed_and_distance(store, perspective_transformer, frame_rate=30.0, camera_motion=None,
+                                 max_gap=5, class_name='Player'):
+    """Compute velocity and cumulative distance for every track in the video at once
+
+    Foot points are projected to field meters in one pass (after removing
+    the accumulated camera pan, if camera_motion is given as an (F, 2)
+    per-frame image displacement), then each track's positions are
+    differenced in frame order. Steps across a gap of more than max_gap
+    frames are dropped, so a track that disappears and returns does not
+    teleport, but its distance carries over the gap.
+
+    Fills store.velocity (m/s) and store.distance (meters) in place.
+    """
+    order, keys, offsets = store.track_index()
+    if len(order) == 0:
+        return store
+
+    foot_points = store.foot_points()
+    if camera_motion is not None and len(camera_motion):
+        # Camera offset at frame f is the sum of the motion of all earlier frames
+        camera_offset = np.vstack([np.zeros((1, 2)), np.cumsum(camera_motion, axis=0)])
+        frame_index = np.minimum(store.frame, len(camera_offset) - 1)
+        foot_points = foot_points - camera_offset[frame_index]
+    pitch_points = perspective_transformer.transform_points(foot_points)
+
+    # Work in track order: rows of each track are contiguous and sorted by frame
+    positions = pitch_points[order].astype(np.float64)
+    frames = store.frame[order]
+
+    track_start = np.zeros(len(order), dtype=bool)
+    track_start[offsets[:-1]] = True
+
+    steps = np.linalg.norm(np.diff(positions, axis=0), axis=1)
+    gaps = np.diff(frames)
+    valid = ~track_start[1:] & (gaps >= 1) & (gaps <= max_gap)
+    steps = np.where(valid, steps, 0.0)
+
+    step_velocity = np.full(len(order), np.nan)
+    step_velocity[1:][valid] = steps[valid] * frame_rate / gaps[valid]
+
+    # Cumulative distance per track: global cumsum minus the value at each track start
+    cumulative = np.concatenate([[0.0], np.cumsum(steps)])
+    track_num = np.cumsum(track_start) - 1
+    distance = cumulative - cumulative[offsets[:-1]][track_num]
+
+    selected = store.class_id[order] == CLASS_NAMES.index(class_name)
+    store.velocity[order[selected]] = step_velocity[selected]
+    store.distance[order[selected]] = distance[selected]
+    return store
 
 def update_player_distances(tracks, velocities, frame_num, frame_rate=30.0):
     """Update cumulative distance for each player"""
+    if isinstance(tracks, TrackStore):
+        return _update_store_distances(tracks, velocities, frame_num, frame_rate)
+
     # Time between frames in seconds
     dt = 1.0 / frame_rate
     
@@ -78,11 +87,93 @@ def update_player_distances(tracks, velocities, frame_num, frame_rate=30.0):
     
     return tracks
 
+def _update_store_distances(store, velocities, frame_num, frame_rate):
+    """update_player_distances for a TrackStore, working on its columns"""
+    dt = 1.0 / frame_rate
+    rows = store.frame_rows(frame_num, 'Player')
+
+    if frame_num == 0:
+        store.distance[rows] = 0.0
+        return store
+
+    prev_rows = store.frame_rows(frame_num - 1, 'Player')
+    prev_distances = np.nan_to_num(store.distance[prev_rows])
+    prev_by_track = dict(zip(store.track_id[prev_rows].tolist(), prev_distances.tolist()))
+
+    for row in rows:
+        track_id = int(store.track_id[row])
+        store.distance[row] = prev_by_track.get(track_id, 0.0) + velocities.get(track_id, 0.0) * dt
+
+    return store
+
 
 def get_player_final_distance(tracks, player_id):
+    if isinstance(tracks, TrackStore):
+        rows = tracks.track_rows(player_id)
+        distances = tracks.distance[rows]
+        distances = distances[~np.isnan(distances)]
+        return float(distances[-1]) if len(distances) else None
+
     for frame_data in reversed(tracks['Player']):
         if player_id in frame_data and 'distance' in frame_data[player_id]:
             return frame_data[player_id]['distance']
 
     # Player not found
-    return None
\ No newline at end of file
+    return None
+
+
+class LiveSpeedDistance:
+    def __init__(self, perspective_transformer, frame_rate=30.0, max_gap=15, max_valid_speed=12.5,
+                 speed_smoothing=0.5):
+        """
+        Speed and cumulative distance per player, updated one frame at a time
+
+        The streaming counterpart of calculate_speed_and_distance: each
+        frame's foot points are projected to the pitch and compared with the
+        player's last position. Steps across more than max_gap frames or
+        faster than max_valid_speed are not counted.
+
+        Args:
+            perspective_transformer: PerspectiveTransformer with its field corners set
+            frame_rate: Frames per second of the source
+            max_gap: Longest gap (frames) that still counts as movement
+            max_valid_speed: Steps faster than this (m/s) are treated as glitches
+            speed_smoothing: Weight of the previous speed in the reported speed
+        """
+        self.perspective_transformer = perspective_transformer
+        self.frame_rate = frame_rate
+        self.max_gap = max_gap
+        self.max_valid_speed = max_valid_speed
+        self.speed_smoothing = speed_smoothing
+        self.reset()
+
+    def reset(self):
+        self.players = {}
+
+    def update(self, frame_num, bboxes, track_ids, camera_offset=(0.0, 0.0)):
+        """Add the players of one frame (full-frame boxes) and return their state dicts
+
+        camera_offset is the accumulated camera pan at this frame, removed
+        from the foot points before projecting them.
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        foot_points = np.c_[(bboxes[:, 0] + bboxes[:, 2]) / 2, bboxes[:, 3]] - np.asarray(camera_offset)
+        positions = self.perspective_transformer.transform_points(foot_points).astype(np.float64)
+        updated = []
+        for track_id, position in zip(np.asarray(track_ids).tolist(), positions):
+            player = self.players.get(track_id)
+            if player is None:
+                player = self.players[track_id] = {'position': position, 'frame': frame_num, 'velocity': 0.0,
+                                                   'distance': 0.0, 'top_speed': 0.0}
+                updated.append(player)
+                continue
+            gap = frame_num - player['frame']
+            step = float(np.linalg.norm(position - player['position']))
+            speed = step * self.frame_rate / gap if gap else 0.0
+            if 1 <= gap <= self.max_gap and speed <= self.max_valid_speed:
+                player['distance'] += step
+                player['velocity'] = self.speed_smoothing * player['velocity'] + (1 - self.speed_smoothing) * speed
+                player['top_speed'] = max(player['top_speed'], player['velocity'])
+            player['position'], player['frame'] = position, frame_num
+            updated.append(player)
+        return updated
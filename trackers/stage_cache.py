@@ -0,0 +1,58 @@
+# trackers/stage_cache.py
+import hashlib
+import json
+import os
+import pickle
+
+class StageCache:
+    def __init__(self, cache_dir='stubs/stages', keep=3):
+        """
+        On-disk artifacts of pipeline stages, keyed by their inputs and parameters
+
+        A stage's key hashes its name, its parameters and the keys of the
+        stages it reads from, so a change anywhere upstream gives every
+        downstream stage a new key (and a cache miss) while unaffected
+        stages keep hitting. The newest keep artifacts of each stage are
+        kept, so switching back to recent settings is free as well.
+
+        Args:
+            cache_dir: Directory holding one subdirectory per stage
+            keep: Artifacts kept per stage
+        """
+        self.cache_dir = cache_dir
+        self.keep = keep
+
+    def key(self, name, params, input_keys=()):
+        payload = json.dumps({'stage': name, 'params': params, 'inputs': list(input_keys)},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+    def path(self, name, key):
+        return os.path.join(self.cache_dir, name, f"{key}.pkl")
+
+    def has(self, name, key):
+        return os.path.exists(self.path(name, key))
+
+    def load(self, name, key):
+        path = self.path(name, key)
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        # Touch it, so pruning keeps the artifacts in use
+        os.utime(path)
+        return value
+
+    def save(self, name, key, value):
+        path = self.path(name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so an interrupted run never leaves a half-written artifact
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.prune(name)
+
+    def prune(self, name):
+        """Delete all but the keep most recently used artifacts of a stage"""
+        stage_dir = os.path.join(self.cache_dir, name)
+        paths = [os.path.join(stage_dir, file) for file in os.listdir(stage_dir) if file.endswith('.pkl')]
+        for path in sorted(paths, key=os.path.getmtime, reverse=True)[self.keep:]:
+            os.remove(path)
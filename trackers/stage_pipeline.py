@@ -0,0 +1,323 @@
+# trackers/stage_pipeline.py
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+import supervision as sv
+from utils import get_video_info, iter_video, VideoEncoder
+from trackers.camera_motion import CameraMotionEstimator
+from trackers.perspective_transform import PerspectiveTransformer, default_field_corners
+from trackers.renderer import AnnotationRenderer
+from trackers.speed_distance import LiveSpeedDistance
+from trackers.track_store import TrackStore, CLASS_NAMES
+
+# Per-stage counters in the shared array: frames, busy, waiting for input, blocked on output
+COUNTERS = ('frames', 'busy_s', 'wait_s', 'blocked_s')
+
+class FrameRing:
+    def __init__(self, num_slots, frame_shape, name=None):
+        """
+        Fixed-size uint8 frame slots in one shared memory block
+
+        The process that passes no name creates (and later unlinks) the
+        block; stage processes attach to it by name.
+        """
+        self.num_slots = num_slots
+        self.frame_shape = tuple(frame_shape)
+        size = int(num_slots * np.prod(self.frame_shape))
+        self.owner = name is None
+        self.block = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.frames = np.ndarray((num_slots,) + self.frame_shape, dtype=np.uint8, buffer=self.block.buf)
+
+    @property
+    def name(self):
+        return self.block.name
+
+    def close(self):
+        del self.frames
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+
+class Stage:
+    def __init__(self, name, setup, *args, **kwargs):
+        """
+        One pipeline stage, run in its own process
+
+        setup(*args, **kwargs) is called in the stage's process and returns
+        the per-frame function `function(frame, meta) -> meta`. frame is the
+        frame's shared slot (write to it to pass a changed frame on) and meta
+        a small dict that travels with it; returning None keeps meta. If the
+        function has a close() method, its return value is collected as the
+        stage's result. For the source stage, setup returns an iterable of
+        frames instead.
+        """
+        self.name = name
+        self.setup = setup
+        self.args = args
+        self.kwargs = kwargs
+
+
+def _run_source(stage, ring_name, num_slots, frame_shape, free_slots, out_queue, counters, index, results):
+    ring = FrameRing(num_slots, frame_shape, name=ring_name)
+    base = index * len(COUNTERS)
+    try:
+        frames = iter(stage.setup(*stage.args, **stage.kwargs))
+        frame_num = 0
+        while True:
+            start = time.perf_counter()
+            frame = next(frames, None)
+            if frame is None:
+                break
+            produced = time.perf_counter()
+            # Backpressure: wait for a slot the last stage has released
+            slot = free_slots.get()
+            waited = time.perf_counter()
+            ring.frames[slot] = frame
+            copied = time.perf_counter()
+            out_queue.put((slot, {'frame': frame_num}))
+            counters[base + 0] += 1
+            counters[base + 1] += produced - start + copied - waited
+            counters[base + 2] += waited - produced
+            counters[base + 3] += time.perf_counter() - copied
+            frame_num += 1
+        out_queue.put(None)
+        results.put((stage.name, frame_num))
+    finally:
+        ring.close()
+
+def _run_stage(stage, ring_name, num_slots, frame_shape, free_slots, in_queue, out_queue, counters, index,
+               results):
+    ring = FrameRing(num_slots, frame_shape, name=ring_name)
+    base = index * len(COUNTERS)
+    try:
+        function = stage.setup(*stage.args, **stage.kwargs)
+        while True:
+            start = time.perf_counter()
+            item = in_queue.get()
+            received = time.perf_counter()
+            counters[base + 2] += received - start
+            if item is None:
+                break
+            slot, meta = item
+            meta = function(ring.frames[slot], meta) or meta
+            done = time.perf_counter()
+            if out_queue is None:
+                free_slots.put(slot)
+            else:
+                out_queue.put((slot, meta))
+            counters[base + 0] += 1
+            counters[base + 1] += done - received
+            counters[base + 3] += time.perf_counter() - done
+        results.put((stage.name, function.close() if hasattr(function, 'close') else None))
+        if out_queue is not None:
+            out_queue.put(None)
+    finally:
+        ring.close()
+
+
+class StagePipeline:
+    def __init__(self, source, stages, frame_shape, num_slots=16):
+        """
+        Run a source and a chain of stages as separate processes over shared frame slots
+
+        Frames live in a FrameRing of num_slots slots; only (slot, meta)
+        pairs go through the queues between stages, so multi-megabyte
+        frames are never pickled. The source writes each frame into a free
+        slot, every stage works on it in place and the last stage returns
+        the slot. With all slots in flight the source blocks, which bounds
+        memory and applies backpressure along the chain. Each stage runs in
+        one process, so frames stay in order.
+
+        Args:
+            source: Stage whose setup returns an iterable of frames
+            stages: Stages in order
+            frame_shape: (height, width, channels) of every frame
+            num_slots: Frames in flight at most
+        """
+        self.source = source
+        self.stages = stages
+        self.frame_shape = tuple(frame_shape)
+        self.num_slots = num_slots
+
+    def run(self):
+        """Run to completion and return (results by stage name, utilisation report)"""
+        context = multiprocessing.get_context()
+        ring = FrameRing(self.num_slots, self.frame_shape)
+        all_stages = [self.source] + list(self.stages)
+        counters = context.Array('d', len(COUNTERS) * len(all_stages), lock=False)
+        free_slots = context.Queue()
+        for slot in range(self.num_slots):
+            free_slots.put(slot)
+        queues = [context.Queue(maxsize=self.num_slots) for _ in self.stages]
+        results = context.Queue()
+
+        processes = [context.Process(target=_run_source, name=self.source.name,
+                                     args=(self.source, ring.name, self.num_slots, self.frame_shape,
+                                           free_slots, queues[0], counters, 0, results))]
+        for index, stage in enumerate(self.stages):
+            out_queue = queues[index + 1] if index + 1 < len(queues) else None
+            processes.append(context.Process(target=_run_stage, name=stage.name,
+                                             args=(stage, ring.name, self.num_slots, self.frame_shape, free_slots,
+                                                   queues[index], out_queue, counters, index + 1, results)))
+
+        start_time = time.perf_counter()
+        collected = {}
+        try:
+            for process in processes:
+                process.start()
+            # Results are drained while waiting, so no process blocks on a full result pipe
+            while len(collected) < len(processes):
+                try:
+                    name, result = results.get(timeout=0.2)
+                    collected[name] = result
+                except queue.Empty:
+                    failed = [process.name for process in processes if process.exitcode not in (None, 0)]
+                    if failed:
+                        raise RuntimeError(f"Pipeline stage failed: {', '.join(failed)}")
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            ring.close()
+
+        wall_time = time.perf_counter() - start_time
+        return collected, self.report(counters, wall_time)
+
+    def report(self, counters, wall_time):
+        """Frames, busy/wait/blocked seconds and utilisation (busy / wall time) per stage"""
+        report = {'wall_time': round(wall_time, 3), 'stages': {}}
+        for index, stage in enumerate([self.source] + list(self.stages)):
+            values = dict(zip(COUNTERS, counters[index * len(COUNTERS):(index + 1) * len(COUNTERS)]))
+            frames = int(values['frames'])
+            report['stages'][stage.name] = {
+                'frames': frames,
+                'busy_s': round(values['busy_s'], 3),
+                'wait_s': round(values['wait_s'], 3),
+                'blocked_s': round(values['blocked_s'], 3),
+                'utilisation': round(values['busy_s'] / wall_time, 3) if wall_time > 0 else 0.0,
+                'ms_per_frame': round(values['busy_s'] / frames * 1000, 2) if frames else None,
+            }
+            stats = report['stages'][stage.name]
+            print(f"{stage.name:<10} {frames:6d} frames  {stats['utilisation']:6.1%} busy  "
+                  f"wait {stats['wait_s']:7.2f}s  blocked {stats['blocked_s']:7.2f}s")
+        return report
+
+
+class DetectStage:
+    def __init__(self, model_path, scale_factor=0.5, **tracker_options):
+        """Detect; boxes go on in full-frame pixels with store class codes"""
+        from trackers.tracker import Tracker
+        self.tracker = Tracker(model_path, scale_factor=scale_factor, **tracker_options)
+        self.class_codes = self.tracker.class_codes()
+
+    def __call__(self, frame, meta):
+        detections = self.tracker.predict([frame])[0]
+        codes = self.class_codes[detections.class_id]
+        keep = codes >= 0
+        meta['xyxy'] = detections.xyxy[keep] / self.tracker.scale_factor
+        meta['confidence'] = detections.confidence[keep]
+        meta['class_id'] = codes[keep].astype(int)
+        return meta
+
+
+class TrackStage:
+    def __init__(self, frame_rate=30.0, flow_scale=0.5, max_gap=5):
+        """ByteTrack, camera motion and running speed/distance; collects the TrackStore"""
+        self.tracker = sv.ByteTrack()
+        self.flow_scale = flow_scale
+        self.camera_motion_estimator = CameraMotionEstimator()
+        self.perspective_transformer = PerspectiveTransformer()
+        self.speed_distance = LiveSpeedDistance(self.perspective_transformer, frame_rate, max_gap)
+        self.camera_offset = np.zeros(2)
+        self.tracks = TrackStore()
+        self.velocity, self.distance = [], []
+
+    def __call__(self, frame, meta):
+        if self.perspective_transformer.transform_matrix is None:
+            self.perspective_transformer.set_field_corners(frame, default_field_corners(frame))
+        gray = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=self.flow_scale, fy=self.flow_scale), cv2.COLOR_BGR2GRAY)
+        dx, dy = self.camera_motion_estimator.update(gray, meta['xyxy'] * self.flow_scale)
+        self.camera_offset += np.array([dx, dy]) / self.flow_scale
+
+        detections = sv.Detections(xyxy=meta.pop('xyxy'), confidence=meta.pop('confidence'),
+                                   class_id=meta.pop('class_id'))
+        tracked = self.tracker.update_with_detections(detections)
+        players = tracked.class_id == CLASS_NAMES.index('Player')
+        states = self.speed_distance.update(meta['frame'], tracked.xyxy[players], tracked.tracker_id[players],
+                                            self.camera_offset)
+
+        self.tracks.append_frame(tracked.xyxy, tracked.tracker_id, tracked.class_id)
+        velocity = np.full(len(tracked), np.nan)
+        distance = np.full(len(tracked), np.nan)
+        velocity[players] = [state['velocity'] for state in states]
+        distance[players] = [state['distance'] for state in states]
+        self.velocity.append(velocity)
+        self.distance.append(distance)
+
+        meta['players'] = {track_id: {'bbox': bbox, 'velocity': state['velocity'], 'distance': state['distance']}
+                           for track_id, bbox, state in zip(tracked.tracker_id[players].tolist(),
+                                                            tracked.xyxy[players], states)}
+        referees = tracked.class_id == CLASS_NAMES.index('ref')
+        meta['referees'] = {track_id: {'bbox': bbox}
+                            for track_id, bbox in zip(tracked.tracker_id[referees].tolist(), tracked.xyxy[referees])}
+        return meta
+
+    def close(self):
+        """The tracks (with velocity and distance) and the per-frame camera motion"""
+        self.tracks.consolidate()
+        if self.velocity:
+            self.tracks.velocity = np.concatenate(self.velocity).astype(np.float32)
+            self.tracks.distance = np.concatenate(self.distance).astype(np.float32)
+        return {'tracks': self.tracks,
+                'camera_motion': self.camera_motion_estimator.camera_motion() / self.flow_scale}
+
+
+class RenderStage:
+    def __init__(self):
+        """Draw the annotations into the shared frame in place"""
+        self.renderer = AnnotationRenderer(num_workers=1)
+
+    def __call__(self, frame, meta):
+        self.renderer.render(frame, self.renderer.frame_items(meta.pop('players'), meta.pop('referees')))
+        return meta
+
+
+class EncodeStage:
+    def __init__(self, output_video_path, fps):
+        """Encode the frames; the encoder thread gets a copy, since the slot is reused"""
+        self.encoder = VideoEncoder(output_video_path, fps)
+
+    def __call__(self, frame, meta):
+        self.encoder.write(frame.copy())
+
+    def close(self):
+        self.encoder.close()
+        return self.encoder.frames_written
+
+
+def run_tracking_pipeline(video_path, output_video_path, model_path='models/model.onnx', scale_factor=0.5,
+                          num_slots=16, **tracker_options):
+    """Decode, detect, track, render and encode a video with each stage in its own process
+
+    Returns (tracks, camera_motion, report): the TrackStore with velocity
+    and distance, the per-frame camera motion and the per-stage
+    utilisation report (see StagePipeline).
+    """
+    info = get_video_info(video_path)
+    pipeline = StagePipeline(
+        Stage('decode', iter_video, video_path),
+        [Stage('detect', DetectStage, model_path, scale_factor, **tracker_options),
+         Stage('track', TrackStage, info['fps'], scale_factor),
+         Stage('render', RenderStage),
+         Stage('encode', EncodeStage, output_video_path, info['fps'])],
+        frame_shape=(info['height'], info['width'], 3), num_slots=num_slots,
+    )
+    results, report = pipeline.run()
+    return results['track']['tracks'], results['track']['camera_motion'], report
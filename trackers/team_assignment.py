@@ -1,13 +1,14 @@
 # trackers/team_assignment.py
 import cv2
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from trackers.track_store import TrackStore
 
 def extract_player_colors(frame, tracks, frame_num):
     """Extract colors from player jerseys using their bounding boxes"""
     player_colors = {}
 
-    if 'Player' in tracks and frame_num in tracks['Player']:
+    if 'Player' in tracks and frame_num < len(tracks['Player']):
         for track_id, player in tracks['Player'][frame_num].items():
             bbox = player["bbox"]
             x1, y1, x2, y2 = [int(coord) for coord in bbox]
@@ -25,6 +26,71 @@ def extract_player_colors(frame, tracks, frame_num):
         
     return player_colors
 
+def crop_jerseys(frame, bboxes, crop_size=(16, 16)):
+    """Sample the upper half (jersey) of every bbox into an (N, h, w, 3) stack
+
+    All crops are resized (nearest neighbour) with a single fancy-indexing
+    pass over the frame instead of slicing and resizing one player at a time.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+    crop_h, crop_w = crop_size
+    h, w = frame.shape[:2]
+
+    x1, y1, x2 = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2]
+    y_mid = (bboxes[:, 1] + bboxes[:, 3]) / 2
+
+    # Sample points at the centre of each cell of a crop_h x crop_w grid
+    fx = (np.arange(crop_w) + 0.5) / crop_w
+    fy = (np.arange(crop_h) + 0.5) / crop_h
+    xs = np.clip(x1[:, None] + (x2 - x1)[:, None] * fx, 0, w - 1).astype(np.intp)
+    ys = np.clip(y1[:, None] + (y_mid - y1)[:, None] * fy, 0, h - 1).astype(np.intp)
+
+    return frame[ys[:, :, None], xs[:, None, :]]
+
+def jersey_features(crops, hue_bins=16, sat_bins=4):
+    """HSV histogram of each crop with grass pixels masked, as an (N, F) matrix
+
+    Hue and saturation are quantized jointly into hue_bins * sat_bins bins.
+    Rows are L1-normalized; a crop that is all grass gets a zero row.
+    """
+    n = len(crops)
+    num_bins = hue_bins * sat_bins
+    if n == 0:
+        return np.empty((0, num_bins), dtype=np.float32)
+
+    # One colour conversion for the whole stack
+    crop_h, crop_w = crops.shape[1:3]
+    hsv = cv2.cvtColor(np.ascontiguousarray(crops).reshape(n * crop_h, crop_w, 3), cv2.COLOR_BGR2HSV)
+    hsv = hsv.reshape(n, crop_h * crop_w, 3).astype(np.int32)
+    hue, sat, val = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
+
+    # Grass: green hue with enough saturation and brightness (OpenCV hue is 0-179)
+    grass = (hue >= 35) & (hue <= 85) & (sat >= 60) & (val >= 40)
+
+    bins = (hue * hue_bins // 180) * sat_bins + (sat * sat_bins // 256)
+    bins = bins + np.arange(n)[:, None] * num_bins
+    hist = np.bincount(bins[~grass], minlength=n * num_bins).reshape(n, num_bins).astype(np.float32)
+
+    totals = hist.sum(axis=1, keepdims=True)
+    return np.divide(hist, totals, out=np.zeros_like(hist), where=totals > 0)
+
+def extract_jersey_features(frame, bboxes, track_ids, crop_size=(16, 16)):
+    """Batched jersey features for all players of a frame
+
+    Returns (track_ids, features) where features[i] is the (F,) colour
+    feature of track_ids[i].
+    """
+    track_ids = np.asarray(track_ids)
+    return track_ids, jersey_features(crop_jerseys(frame, bboxes, crop_size))
+
+def extract_jersey_features_batch(frames, bboxes_per_frame, track_ids_per_frame, crop_size=(16, 16)):
+    """Jersey features for many frames at once, stacked into a single (N, F) matrix"""
+    crops = [crop_jerseys(frame, bboxes, crop_size) for frame, bboxes in zip(frames, bboxes_per_frame)]
+    track_ids = [np.asarray(ids) for ids in track_ids_per_frame]
+    if not crops:
+        return np.empty(0, dtype=np.int64), jersey_features(np.empty((0,) + crop_size + (3,), dtype=np.uint8))
+    return np.concatenate(track_ids), jersey_features(np.concatenate(crops))
+
 def assign_teams(player_colors, n_teams=2):
     """Assign players to teams based on their dominant jersey colors"""
     if len(player_colors) < n_teams:
@@ -60,3 +126,87 @@ def get_team_colors(player_colors, team_assignments):
             team_colors[team_id] = np.array([0, 0, 0])
     
     return team_colors
+
+
+class TeamClassifier:
+    def __init__(self, n_teams=2, sample_every=10, samples_per_track=5):
+        """
+        Cluster jersey colours sampled across the whole video into teams
+
+        Jersey features (HSV histograms with grass masked out, see
+        jersey_features) are sampled from every sample_every-th frame and
+        from the first frame of any track not seen yet, at most
+        samples_per_track per track. The clusters are fit once and each track
+        gets the team most of its samples fall into.
+
+        Args:
+            n_teams: Number of teams to cluster into
+            sample_every: Sample jerseys from every nth frame
+            samples_per_track: Stop sampling a track after this many crops
+        """
+        self.n_teams = n_teams
+        self.sample_every = sample_every
+        self.samples_per_track = samples_per_track
+        self.reset()
+
+    def reset(self):
+        self.sample_features = []
+        self.sample_colors = []
+        self.sample_track_ids = []
+        self.sample_counts = {}
+        self.kmeans = None
+        self.labels = None
+        self.track_teams = {}
+
+    def add_frame(self, frame, tracks, frame_num):
+        """Sample jersey features of the players in one frame (none past the end of tracks)"""
+        if frame_num >= (tracks.num_frames if isinstance(tracks, TrackStore) else len(tracks['Player'])):
+            return
+        if isinstance(tracks, TrackStore):
+            rows = tracks.frame_rows(frame_num, 'Player')
+            track_ids = tracks.track_id[rows]
+            bboxes = tracks.row_bboxes(rows)
+        else:
+            frame_tracks = tracks['Player'][frame_num]
+            track_ids = np.array(list(frame_tracks.keys()))
+            bboxes = np.array([player["bbox"] for player in frame_tracks.values()]).reshape(-1, 4)
+
+        on_stride = frame_num % self.sample_every == 0
+        wanted = np.array([self.sample_counts.get(track_id, 0) < self.samples_per_track and
+                           (on_stride or track_id not in self.sample_counts)
+                           for track_id in track_ids.tolist()], dtype=bool)
+        if not wanted.any():
+            return
+
+        crops = crop_jerseys(frame, bboxes[wanted])
+        self.sample_features.append(jersey_features(crops))
+        self.sample_colors.append(crops.reshape(len(crops), -1, 3).mean(axis=1))
+        for track_id in track_ids[wanted].tolist():
+            self.sample_counts[track_id] = self.sample_counts.get(track_id, 0) + 1
+            self.sample_track_ids.append(track_id)
+
+    def fit(self):
+        """Fit the team clusters once and vote a team for every sampled track"""
+        self.track_teams = {}
+        self.labels = None
+        if len(self.sample_track_ids) < self.n_teams:
+            return self.track_teams
+
+        features = np.concatenate(self.sample_features)
+        self.kmeans = MiniBatchKMeans(n_clusters=self.n_teams, random_state=42, n_init=3)
+        self.labels = labels = self.kmeans.fit_predict(features)
+
+        # Majority vote per track over all of its samples
+        track_ids, track_index = np.unique(self.sample_track_ids, return_inverse=True)
+        votes = np.zeros((len(track_ids), self.n_teams), dtype=np.int32)
+        np.add.at(votes, (track_index, labels), 1)
+        self.track_teams = dict(zip(track_ids.tolist(), votes.argmax(axis=1).tolist()))
+        return self.track_teams
+
+    def team_colors(self):
+        """Mean jersey colour (BGR) of each team's samples"""
+        if self.labels is None:
+            return {}
+        colors = np.concatenate(self.sample_colors)
+        return {team_id: colors[self.labels == team_id].mean(axis=0).astype(int)
+                for team_id in range(self.n_teams) if (self.labels == team_id).any()}
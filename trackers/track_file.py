@@ -0,0 +1,186 @@
+# trackers/track_file.py
+import json
+import os
+import numpy as np
+from trackers.track_store import TrackStore, FrameListView, COLUMNS, CLASS_NAMES
+
+class TrackFile:
+    def __init__(self, path, chunk_frames=1000, compress=True):
+        """
+        Chunked, columnar on-disk format for a TrackStore and per-frame metrics
+
+        The file is a directory holding one .npz per range of chunk_frames
+        frames (all TrackStore columns plus any per-frame metric arrays) and a
+        meta.json index with the frame range, row count and track ids of each
+        chunk. Reads open only the chunks that overlap the requested frames or
+        contain the requested track ids, and only the requested columns are
+        decompressed, so a frame window or a few players can be queried
+        without loading the whole match. New frames are appended as new chunks.
+
+        Args:
+            path: Directory of the track file (created if missing)
+            chunk_frames: Frames per chunk written by append
+            compress: Write compressed chunks (np.savez_compressed)
+        """
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.compress = compress
+        self._cached_chunk = None
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path()) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'num_frames': 0, 'columns': list(COLUMNS), 'metrics': [], 'chunks': []}
+
+    @classmethod
+    def write(cls, store, path, frame_metrics=None, chunk_frames=1000, compress=True):
+        """Write a whole TrackStore (replacing any existing file) and return the TrackFile"""
+        track_file = cls(path, chunk_frames, compress)
+        for chunk in track_file.meta['chunks']:
+            chunk_path = os.path.join(path, chunk['file'])
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+        track_file.meta = {'num_frames': 0, 'columns': list(COLUMNS), 'metrics': [], 'chunks': []}
+        track_file.append(store, frame_metrics)
+        return track_file
+
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _write_meta(self):
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path())
+
+    @property
+    def num_frames(self):
+        return self.meta['num_frames']
+
+    # Writing
+
+    def append(self, store, frame_metrics=None):
+        """Write the frames of store that are not in the file yet
+
+        store holds absolute frame numbers (e.g. a TrackStore that is still
+        growing); frame_metrics maps a name to an array whose first axis is
+        the frame number, such as the (F, 2) camera motion.
+        """
+        frame_metrics = frame_metrics or {}
+        if self.meta['chunks'] and sorted(frame_metrics) != self.meta['metrics']:
+            raise ValueError(f"Track file has metrics {self.meta['metrics']}, got {sorted(frame_metrics)}")
+        self.meta['metrics'] = sorted(frame_metrics)
+
+        os.makedirs(self.path, exist_ok=True)
+        offsets = store.frame_offsets
+        save = np.savez_compressed if self.compress else np.savez
+        for start in range(self.num_frames, store.num_frames, self.chunk_frames):
+            end = min(start + self.chunk_frames, store.num_frames)
+            rows = slice(offsets[start], offsets[end])
+            arrays = {name: getattr(store, name)[rows] for name in COLUMNS}
+            for name, values in frame_metrics.items():
+                arrays['metric_' + name] = np.asarray(values)[start:end]
+
+            name = f"chunk_{start:08d}_{end:08d}.npz"
+            tmp_path = os.path.join(self.path, name + '.tmp.npz')
+            save(tmp_path, **arrays)
+            os.replace(tmp_path, os.path.join(self.path, name))
+
+            self.meta['chunks'].append({
+                'start': start, 'end': end, 'rows': int(offsets[end] - offsets[start]), 'file': name,
+                'track_ids': np.unique(arrays['track_id']).tolist(),
+            })
+            # The index is updated after every chunk, so a partial write stays readable
+            self.meta['num_frames'] = end
+            self._write_meta()
+
+    # Reading
+
+    def _chunks(self, start, stop, track_ids=None):
+        for chunk in self.meta['chunks']:
+            if chunk['end'] <= start or chunk['start'] >= stop:
+                continue
+            if track_ids is not None and not np.intersect1d(chunk['track_ids'], track_ids).size:
+                continue
+            yield chunk
+
+    def read(self, start=0, stop=None, track_ids=None, class_name=None, columns=None):
+        """Load a frame window and/or a set of tracks as a TrackStore
+
+        The result keeps absolute frame numbers (num_frames = stop), so
+        store['Player'][frame_num] works for frames inside the window; frames
+        outside it are empty. columns limits which columns are decompressed
+        (the others are filled with their defaults).
+        """
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+        names = list(COLUMNS) if columns is None else list(dict.fromkeys(('frame',) + tuple(columns)))
+        if class_name is not None and 'class_id' not in names:
+            names.append('class_id')
+        if track_ids is not None:
+            track_ids = np.asarray(track_ids)
+            if 'track_id' not in names:
+                names.append('track_id')
+
+        parts = {name: [] for name in names}
+        for chunk in self._chunks(start, stop, track_ids):
+            with np.load(os.path.join(self.path, chunk['file'])) as data:
+                frame = data['frame']
+                keep = (frame >= start) & (frame < stop)
+                if class_name is not None:
+                    keep &= data['class_id'] == CLASS_NAMES.index(class_name)
+                if track_ids is not None:
+                    keep &= np.isin(data['track_id'], track_ids)
+                for name in names:
+                    parts[name].append(data[name][keep])
+
+        columns = {name: np.concatenate(values) if values else np.empty(0, dtype=COLUMNS[name][0])
+                   for name, values in parts.items()}
+        return TrackStore.from_columns(stop, **columns)
+
+    def read_metric(self, name, start=0, stop=None):
+        """Per-frame metric values for frames start:stop"""
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+        parts = []
+        for chunk in self._chunks(start, stop):
+            with np.load(os.path.join(self.path, chunk['file'])) as data:
+                values = data['metric_' + name]
+            parts.append(values[max(start - chunk['start'], 0):stop - chunk['start']])
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def iter_windows(self, class_name=None, columns=None):
+        """Yield (start, stop, store) for each chunk, holding one chunk in memory at a time
+
+        store is chunk-local: its frame 0 is frame start of the file.
+        """
+        for chunk in self.meta['chunks']:
+            yield chunk['start'], chunk['end'], self._load_chunk(chunk, class_name, columns)
+
+    def _load_chunk(self, chunk, class_name=None, columns=None):
+        store = self.read(chunk['start'], chunk['end'], class_name=class_name, columns=columns)
+        # Rebase to chunk-local frame numbers so the offsets only cover this chunk
+        local = {name: getattr(store, name) for name in COLUMNS}
+        local['frame'] = local['frame'] - chunk['start']
+        return TrackStore.from_columns(chunk['end'] - chunk['start'], **local)
+
+    # Same read-only interface as TrackStore, for the renderer and statistics
+
+    def frame_dict(self, frame_num, class_name="Player"):
+        """{track_id: info} of one frame, keeping the chunk that holds it loaded"""
+        cached = self._cached_chunk
+        if cached is None or not cached[0] <= frame_num < cached[1]:
+            chunk = next(self._chunks(frame_num, frame_num + 1), None)
+            if chunk is None:
+                raise IndexError(frame_num)
+            cached = self._cached_chunk = (chunk['start'], chunk['end'], self._load_chunk(chunk))
+        return cached[2].frame_dict(frame_num - cached[0], class_name)
+
+    def __getitem__(self, class_name):
+        if class_name not in CLASS_NAMES:
+            raise KeyError(class_name)
+        return FrameListView(self, class_name)
+
+    def __contains__(self, class_name):
+        return class_name in CLASS_NAMES
+
+    def keys(self):
+        return list(CLASS_NAMES)
@@ -0,0 +1,266 @@
+# trackers/track_store.py
+import numpy as np
+
+CLASS_NAMES = ("Player", "ref")
+NO_TEAM = -1
+
+# Column name -> (dtype, fill value for rows that have no value yet)
+COLUMNS = {
+    "frame": (np.int32, 0),
+    "track_id": (np.int32, 0),
+    "class_id": (np.int8, 0),
+    "x1": (np.float32, 0.0),
+    "y1": (np.float32, 0.0),
+    "x2": (np.float32, 0.0),
+    "y2": (np.float32, 0.0),
+    "team": (np.int8, NO_TEAM),
+    "velocity": (np.float32, np.nan),
+    "distance": (np.float32, np.nan),
+}
+
+
+class TrackStore:
+    """Columnar store of every tracked box in a video.
+
+    Each row is one object in one frame. Rows are ordered by frame, so
+    frame_offsets[f]:frame_offsets[f + 1] are the rows of frame f, and
+    track_index() gives the rows of each track in frame order.
+
+    store['Player'][frame_num] still returns the old
+    {track_id: {"bbox": [...], "team": ..., ...}} dict for existing callers.
+    Those dicts are built on the fly, so writes must go through the columns
+    (e.g. set_frame_values) rather than into the dicts.
+    """
+
+    def __init__(self):
+        self.num_frames = 0
+        self._chunks = []
+        for name, (dtype, _) in COLUMNS.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self._frame_offsets = np.zeros(1, dtype=np.int64)
+        self._track_index = None
+
+    # Building
+
+    def append_frame(self, bboxes=None, track_ids=None, class_ids=None):
+        """Append the next frame's boxes (N x 4, in full-frame pixels)"""
+        frame_num = self.num_frames
+        self.num_frames += 1
+        if bboxes is None or len(bboxes) == 0:
+            return
+        bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        n = len(bboxes)
+        self._chunks.append({
+            "frame": np.full(n, frame_num, dtype=np.int32),
+            "track_id": np.asarray(track_ids, dtype=np.int32),
+            "class_id": np.asarray(class_ids, dtype=np.int8),
+            "x1": bboxes[:, 0], "y1": bboxes[:, 1],
+            "x2": bboxes[:, 2], "y2": bboxes[:, 3],
+        })
+
+    def consolidate(self):
+        """Merge appended frames into the column arrays and rebuild indexes.
+
+        Called automatically by the accessors below; call it yourself before
+        reading the column attributes directly after append_frame.
+        """
+        if self._chunks:
+            for name, (dtype, fill) in COLUMNS.items():
+                parts = [getattr(self, name)]
+                parts += [chunk.get(name, np.full(len(chunk["frame"]), fill, dtype=dtype))
+                          for chunk in self._chunks]
+                setattr(self, name, np.concatenate(parts).astype(dtype, copy=False))
+            self._chunks = []
+        if len(self._frame_offsets) != self.num_frames + 1 or self._frame_offsets[-1] != len(self.frame):
+            self._frame_offsets = np.searchsorted(self.frame, np.arange(self.num_frames + 1)).astype(np.int64)
+            self._track_index = None
+
+    @classmethod
+    def from_columns(cls, num_frames, **columns):
+        """Build a store from whole-video column arrays sorted by frame"""
+        store = cls()
+        store.num_frames = int(num_frames)
+        n = len(columns["frame"])
+        for name, (dtype, fill) in COLUMNS.items():
+            if name in columns:
+                setattr(store, name, np.asarray(columns[name], dtype=dtype))
+            else:
+                setattr(store, name, np.full(n, fill, dtype=dtype))
+        store.consolidate()
+        return store
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """Build a store from the legacy {"Player": [...], "ref": [...]} dicts"""
+        if isinstance(tracks, TrackStore):
+            return tracks
+        num_frames = max(len(tracks.get(name, [])) for name in CLASS_NAMES)
+        columns = {name: [] for name in COLUMNS}
+        for frame_num in range(num_frames):
+            for class_id, class_name in enumerate(CLASS_NAMES):
+                frames = tracks.get(class_name, [])
+                if frame_num >= len(frames):
+                    continue
+                for track_id, info in frames[frame_num].items():
+                    x1, y1, x2, y2 = info["bbox"]
+                    columns["frame"].append(frame_num)
+                    columns["track_id"].append(track_id)
+                    columns["class_id"].append(class_id)
+                    columns["x1"].append(x1)
+                    columns["y1"].append(y1)
+                    columns["x2"].append(x2)
+                    columns["y2"].append(y2)
+                    columns["team"].append(info.get("team", NO_TEAM))
+                    columns["velocity"].append(info.get("velocity", np.nan))
+                    columns["distance"].append(info.get("distance", np.nan))
+        return cls.from_columns(num_frames, **columns)
+
+    # Vectorized access
+
+    def __len__(self):
+        self.consolidate()
+        return len(self.frame)
+
+    @property
+    def frame_offsets(self):
+        self.consolidate()
+        return self._frame_offsets
+
+    @property
+    def bboxes(self):
+        """All boxes as an (N, 4) float32 array"""
+        self.consolidate()
+        return np.stack([self.x1, self.y1, self.x2, self.y2], axis=1)
+
+    def row_bboxes(self, rows):
+        """Boxes of the given rows as an (len(rows), 4) float32 array"""
+        return np.stack([self.x1[rows], self.y1[rows], self.x2[rows], self.y2[rows]], axis=1)
+
+    def foot_points(self):
+        """Bottom-centre point of every box as an (N, 2) float32 array"""
+        self.consolidate()
+        return np.stack([(self.x1 + self.x2) / 2, self.y2], axis=1)
+
+    def class_mask(self, class_name):
+        self.consolidate()
+        return self.class_id == CLASS_NAMES.index(class_name)
+
+    def frame_rows(self, frame_num, class_name=None):
+        """Row indices of one frame, optionally limited to one class"""
+        offsets = self.frame_offsets
+        rows = np.arange(offsets[frame_num], offsets[frame_num + 1])
+        if class_name is not None:
+            rows = rows[self.class_id[rows] == CLASS_NAMES.index(class_name)]
+        return rows
+
+    def track_index(self):
+        """Return (order, track_keys, offsets) grouping rows by track.
+
+        order[offsets[i]:offsets[i + 1]] are the rows of track track_keys[i]
+        (a (class, track_id) pair) sorted by frame.
+        """
+        self.consolidate()
+        if self._track_index is None:
+            order = np.lexsort((self.frame, self.track_id, self.class_id))
+            class_sorted = self.class_id[order]
+            ids_sorted = self.track_id[order]
+            starts = np.flatnonzero(
+                np.r_[True, (class_sorted[1:] != class_sorted[:-1]) | (ids_sorted[1:] != ids_sorted[:-1])]
+            ) if len(order) else np.empty(0, dtype=np.int64)
+            keys = np.stack([class_sorted[starts], ids_sorted[starts]], axis=1)
+            offsets = np.r_[starts, len(order)].astype(np.int64)
+            self._track_index = (order, keys, offsets)
+        return self._track_index
+
+    def track_rows(self, track_id, class_name="Player"):
+        """Row indices of one track in frame order"""
+        order, keys, offsets = self.track_index()
+        match = np.flatnonzero((keys[:, 0] == CLASS_NAMES.index(class_name)) & (keys[:, 1] == track_id))
+        if len(match) == 0:
+            return np.empty(0, dtype=np.int64)
+        i = match[0]
+        return order[offsets[i]:offsets[i + 1]]
+
+    def set_frame_values(self, column, frame_num, values_by_track, class_name="Player"):
+        """Write {track_id: value} into one column for the rows of a frame"""
+        rows = self.frame_rows(frame_num, class_name)
+        target = getattr(self, column)
+        for row in rows:
+            track_id = int(self.track_id[row])
+            if track_id in values_by_track:
+                target[row] = values_by_track[track_id]
+
+    def map_track_values(self, column, values_by_track, class_name="Player"):
+        """Write {track_id: value} into one column for every frame at once"""
+        if not values_by_track:
+            return
+        keys = np.array(list(values_by_track.keys()), dtype=np.int64)
+        values = np.array(list(values_by_track.values()))
+        sort = np.argsort(keys)
+        keys, values = keys[sort], values[sort]
+        rows = np.flatnonzero(self.class_mask(class_name))
+        pos = np.clip(np.searchsorted(keys, self.track_id[rows]), 0, len(keys) - 1)
+        hit = keys[pos] == self.track_id[rows]
+        getattr(self, column)[rows[hit]] = values[pos[hit]]
+
+    # Compatibility with the dict-based tracks structure
+
+    def row_dict(self, row):
+        info = {"bbox": [float(self.x1[row]), float(self.y1[row]), float(self.x2[row]), float(self.y2[row])]}
+        if self.team[row] != NO_TEAM:
+            info["team"] = int(self.team[row])
+        if not np.isnan(self.velocity[row]):
+            info["velocity"] = float(self.velocity[row])
+        if not np.isnan(self.distance[row]):
+            info["distance"] = float(self.distance[row])
+        return info
+
+    def frame_dict(self, frame_num, class_name="Player"):
+        return {int(self.track_id[row]): self.row_dict(row)
+                for row in self.frame_rows(frame_num, class_name)}
+
+    def __getitem__(self, class_name):
+        if class_name not in CLASS_NAMES:
+            raise KeyError(class_name)
+        return FrameListView(self, class_name)
+
+    def __contains__(self, class_name):
+        return class_name in CLASS_NAMES
+
+    def keys(self):
+        return list(CLASS_NAMES)
+
+    def get(self, class_name, default=None):
+        return self[class_name] if class_name in self else default
+
+    def to_tracks(self):
+        """Materialize the legacy dict-of-lists structure"""
+        return {class_name: list(self[class_name]) for class_name in CLASS_NAMES}
+
+
+class FrameListView:
+    """Read-only list-like view of one class: view[frame_num] -> {track_id: info}"""
+
+    def __init__(self, store, class_name):
+        self.store = store
+        self.class_name = class_name
+
+    def __len__(self):
+        return self.store.num_frames
+
+    def __getitem__(self, frame_num):
+        if isinstance(frame_num, slice):
+            return [self[i] for i in range(*frame_num.indices(len(self)))]
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        return self.store.frame_dict(frame_num, self.class_name)
+
+    def __iter__(self):
+        for frame_num in range(len(self)):
+            yield self[frame_num]
+
+    def __reversed__(self):
+        for frame_num in reversed(range(len(self))):
+            yield self[frame_num]
@@ -1,40 +1,70 @@
 # trackers/tracker.py
-from ultralytics import YOLO
 import supervision as sv
 import pickle
 import os
 import cv2
 import numpy as np
 import sys
-from coremltools.models import MLModel 
+from itertools import islice
 
 
 
 sys.path.append('../')
-from utils import get_center_of_bbox, get_bbox_width
-from trackers.team_assignment import extract_player_colors, assign_teams, get_team_colors
-from trackers.optical_flow import calculate_optical_flow
-from trackers.perspective_transform import PerspectiveTransformer
-from trackers.speed_distance import calculate_player_velocity, update_player_distances
+from utils import get_center_of_bbox, get_bbox_width, iter_batches
+from trackers.team_assignment import TeamClassifier
+from trackers.optical_flow import calculate_optical_flow, calculate_player_flow, camera_motion_per_frame, to_gray
+from trackers.parallel_flow import calculate_optical_flow_parallel
+from trackers.camera_motion import CameraMotionEstimator
+from trackers.perspective_transform import PerspectiveTransformer, default_field_corners
+from trackers.speed_distance import calculate_speed_and_distance
+from trackers.track_store import TrackStore, CLASS_NAMES
+from trackers.detectors import create_detector
+from trackers.detection_cache import DetectionCache
+from trackers.detection_scheduler import DetectionScheduler
+from trackers.pitch_region import PitchRegion
+from trackers.renderer import AnnotationRenderer
+from trackers.frame_cache import FrameCache
 
 class Tracker:
-    def __init__(self, model_path, scale_factor=0.5):
+    def __init__(self, model_path, scale_factor=0.5, backend='auto', detect_every=1, pitch_crop=False,
+                 **detector_options):
         """
         Initialize tracker with model and scale factor
 
         Args:
-            model_path: Path to CoreML model
+            model_path: Path to the detection model (.onnx, .pt or CoreML)
             scale_factor: Scale factor for frame resizing (0.5 = half size)
+            backend: Detector backend, 'onnx', 'ultralytics' or 'auto' (by file extension), or a Detector
+            detect_every: Run the detector at least every nth frame and propagate
+                boxes with optical flow in between (1 = detect every frame)
+            pitch_crop: Run the detector on the pitch region only (see PitchRegion);
+                True for the defaults, or a PitchRegion
+            detector_options: Passed to the backend, e.g. conf, num_threads, batch_size
         """
-        self.model = MLModel(model_path)  # Load Core ML model
+        self.model_path = model_path
+        self.detector = create_detector(model_path, backend, **detector_options)
+        self.detector_options = detector_options
+        self.detection_scheduler = DetectionScheduler(detect_every, batch_size=self.detector.batch_size)
+        self.pitch_region = PitchRegion() if pitch_crop is True else (pitch_crop or None)
         self.tracker = sv.ByteTrack()
         self.perspective_transformer = PerspectiveTransformer()
         self.team_colors = None
+        self.player_flow = None
+        self.camera_motion = None
+        self.renderer = None
+        self.camera_motion_estimator = CameraMotionEstimator()
+        self.team_classifier = TeamClassifier()
         self.scale_factor = scale_factor
+        # Downscaled and grayscale frames shared by the detector input and the flow when
+        # both come from one pass over the frames (RealtimeProcessor)
+        self.frame_cache = FrameCache()
         print(f"Using scale factor: {scale_factor} for  processing")
 
-    def downscale_frame(self, frame):
-        # Downscale a frame for processing
+    def downscale_frame(self, frame, frame_num=None):
+        # Downscale a frame for processing; with its frame number the result
+        # comes from (and is kept in) the shared frame cache
+        if frame_num is not None:
+            return self.frame_cache.small(frame, frame_num, self.scale_factor)
         return cv2.resize(frame, (0, 0), fx=self.scale_factor, fy=self.scale_factor)
     
     def downscale_frames(self, frames):
@@ -47,60 +77,106 @@ class Tracker:
 
     
 
-    def detect_frames(self, frames):
+    def iter_detections(self, frames, batch_size=None):
+        """Run detection lazily, holding at most one batch of frames in memory
 
-        small_frames = self.downscale_frames(frames)
+        Yields one sv.Detections per frame in small-frame coordinates.
+        """
+        for batch in iter_batches(frames, batch_size or self.detector.batch_size):
+            yield from self.predict(batch)
 
-        batch_size = 20
-        detections = []
-        for i in range(0, len(small_frames), batch_size):
-            batch = small_frames[i:i+batch_size]
-            detections_batch = self.model.predict(batch, conf=0.1)
-            detections += detections_batch
+    def predict(self, frames, small_frames=None):
+        """Run the detector on full-size frames; detections are in downscaled-frame pixels
 
+        Without pitch_crop the detector sees the frames downscaled by
+        scale_factor (small_frames, when the caller already has them). With
+        pitch_crop the pitch region is cut from the full-size frame and only
+        the crop is resized, by the detector's own input resize, so players
+        get more detector pixels than scale_factor alone would give them.
+        """
+        if self.pitch_region is None:
+            return self.detector.predict(small_frames if small_frames is not None else self.downscale_frames(frames))
+        detections = self.pitch_region.predict(frames, self.detector.predict)
+        for frame_detections in detections:
+            frame_detections.xyxy = frame_detections.xyxy * self.scale_factor
         return detections
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+    def detect_frames(self, frames):
+        return list(self.iter_detections(frames))
+
+    def detection_cache(self, video_path, **cache_options):
+        """DetectionCache keyed by this video, model, scale factor and detector settings"""
+        extra = {'backend': type(self.detector).__name__, 'detect_every': self.detection_scheduler.detect_every,
+                 'pitch_crop_input': 'full_size' if self.pitch_region else None,
+                 'pitch_region': ({k: v for k, v in vars(self.pitch_region).items() if k not in ('region', 'calls')}
+                                  if self.pitch_region else None),
+                 'options': {k: v for k, v in self.detector_options.items() if k not in ('num_threads', 'batch_size')}}
+        return DetectionCache(video_path, self.model_path, self.scale_factor,
+                              getattr(self.detector, 'conf', 0.1), extra=extra, **cache_options)
+
+    def class_codes(self):
+        """Array mapping model class ids onto the store's class codes (-1 = not tracked)"""
+        cls_names = self.detector.class_names
+        # Sized by the model's outputs, so unnamed class ids map to -1 rather than out of range
+        class_codes = np.full(max(self.detector.num_classes, 1), -1, dtype=np.int8)
+        for model_cls_id, name in cls_names.items():
+            if name in CLASS_NAMES:
+                class_codes[model_cls_id] = CLASS_NAMES.index(name)
+        return class_codes
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None, cache=None):
+        """Detect and track objects, returning a columnar TrackStore
+
+        With a DetectionCache (see detection_cache), finished videos are
+        loaded from the cache, and interrupted runs skip the frames already
+        cached and resume ByteTrack from its saved state.
+
+        With detect_every > 1 the detector only runs on keyframes (see
+        DetectionScheduler) and the detector call rate is reported.
+        """
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             with open(stub_path, 'rb') as f:
                 tracks = pickle.load(f)
-            return tracks
-
-        detections = self.detect_frames(frames)
-
-        tracks = {
-            "Player": [],
-            "ref": [],
-        }
-
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v: k for k, v in cls_names.items()}
-
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
+            # Older stubs hold the dict-of-lists structure
+            return TrackStore.from_tracks(tracks)
+
+        tracks = TrackStore()
+        if cache is not None:
+            tracks, tracker_state, complete = cache.load()
+            if complete:
+                return tracks
+            if tracker_state is not None:
+                self.tracker = sv.ByteTrack()
+                vars(self.tracker).update(tracker_state)
+            # Frames before the last completed chunk are decoded but not detected again
+            frames = islice(frames, tracks.num_frames, None)
+
+        class_codes = self.class_codes()
+        self.detection_scheduler.reset()
+        if self.pitch_region is not None:
+            self.pitch_region.reset()
+        for detection_supervision in self.detection_scheduler.iter_detections(frames, self.predict,
+                                                                              self.downscale_frame):
             # Track objects
             detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
 
-            tracks["Player"].append({})
-            tracks["ref"].append({})
-
-            for frame_detection in detection_with_tracks:
-                # Get bbox in small frame coordinates
-                small_box = frame_detection[0].tolist()
-
-                # Scale bbox to original frame size
-                bbox = self.upscale_bbox(small_box)
-
-                cls_id = frame_detection[3]
-                track_id = frame_detection[4]
+            codes = class_codes[detection_with_tracks.class_id]
+            keep = codes >= 0
 
+            # Scale bboxes from small frame to original frame size
+            tracks.append_frame(
+                bboxes=detection_with_tracks.xyxy[keep] / self.scale_factor,
+                track_ids=detection_with_tracks.tracker_id[keep],
+                class_ids=codes[keep],
+            )
 
-                if cls_id == cls_names_inv['Player']:
-                    tracks['Player'][frame_num][track_id] = {"bbox": bbox}
+            if cache is not None and tracks.num_frames - cache.next_frame >= cache.chunk_size:
+                cache.save_chunk(tracks, self.tracker)
 
-                if cls_id == cls_names_inv['ref']:
-                    tracks['ref'][frame_num][track_id] = {"bbox": bbox}
+        tracks.consolidate()
+        self.detection_scheduler.report()
+        if cache is not None:
+            cache.mark_complete(tracks, self.tracker)
 
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
@@ -108,92 +184,108 @@ class Tracker:
 
         return tracks
     
-    def process_video(self, frames, tracks, frame_skip=3):
-        """Process video frames to calculate player metrics"""
-
-        small_frames = self.downscale_frames(frames)
-
-
-        print("Calculating optical flow...")
-        flow_vectors = calculate_optical_flow(small_frames, frame_skip)
+    def process_video(self, frames, tracks, frame_skip=3, frame_rate=30.0, flow_mode='players', flow_workers=1,
+                      camera_motion_mode='keyframes'):
+        """Process video frames to calculate player metrics
+
+        frames is consumed in a single pass, so it can be a lazy iterator
+        such as utils.iter_video; only the first frame (field corners) is
+        kept and jersey colours are sampled as frames go by. tracks may be a TrackStore or
+        the legacy dict structure; a TrackStore is returned.
+
+        flow_mode 'players' runs Lucas-Kanade only at the tracked players and
+        a small background grid (cost scales with player count); 'frame'
+        detects corners over the whole frame. With flow_workers > 1 the flow
+        is computed in chunks across that many worker processes.
+
+        camera_motion_mode 'keyframes' tracks background features forward
+        with CameraMotionEstimator (corners detected on keyframes only, RANSAC
+        model per frame); 'flow' averages the sampled flow instead. Velocity
+        comes from the camera-compensated box movement, so the flow is only
+        computed (and flow_mode/flow_workers only matter) in 'flow' mode.
+        """
+        tracks = TrackStore.from_tracks(tracks)
+        num_frames = tracks.num_frames
+        sampled_frames = {}
+        if camera_motion_mode not in ('keyframes', 'flow'):
+            raise ValueError(f"Unknown camera_motion_mode: {camera_motion_mode}")
+        if flow_mode not in ('players', 'frame'):
+            raise ValueError(f"Unknown flow_mode: {flow_mode}")
+        self.player_flow = None
+        self.camera_motion_estimator.reset()
+        self.team_classifier.reset()
+
+        def small_frame_stream():
+            for frame_num, frame in enumerate(frames):
+                if frame_num == 0:
+                    sampled_frames['first'] = frame
+                # Sample jersey colours for team assignment from many frames
+                self.team_classifier.add_frame(frame, tracks, frame_num)
+                if camera_motion_mode == 'keyframes':
+                    gray = to_gray(self.downscale_frame(frame))
+                    boxes = None
+                    if frame_num < num_frames:
+                        boxes = tracks.row_bboxes(tracks.frame_rows(frame_num, 'Player')) * self.scale_factor
+                    self.camera_motion_estimator.update(gray, boxes)
+                    yield gray
+                else:
+                    yield self.downscale_frame(frame)
+
+        if camera_motion_mode == 'keyframes':
+            print("Estimating camera motion...")
+            # Nothing reads the flow in this mode, so frames only feed camera motion and team sampling
+            for _ in small_frame_stream():
+                pass
+        elif flow_mode == 'players':
+            print("Calculating optical flow...")
+            if flow_workers > 1:
+                self.player_flow = calculate_optical_flow_parallel(
+                    small_frame_stream(), frame_skip, tracks=tracks, scale=self.scale_factor, num_workers=flow_workers
+                )
+            else:
+                self.player_flow = calculate_player_flow(small_frame_stream(), tracks, frame_skip, scale=self.scale_factor)
+            # Background points are already in full-frame pixels
+            flow_vectors = [flow['background_flow'] for flow in self.player_flow]
+            flow_scale = 1.0
+        else:
+            print("Calculating optical flow...")
+            if flow_workers > 1:
+                flow_vectors = calculate_optical_flow_parallel(small_frame_stream(), frame_skip, num_workers=flow_workers)
+            else:
+                flow_vectors = calculate_optical_flow(small_frame_stream(), frame_skip)
+            flow_scale = self.scale_factor
         
         print("Setting up perspective transformation...")
         # For simplicity, we'll use predefined field corners
-        h, w = frames[0].shape[:2]
-        field_corners = [
-            (w * 0.1, h * 0.2),  # Top left
-            (w * 0.9, h * 0.2),  # Top right
-            (w * 0.1, h * 0.9),  # Bottom left
-            (w * 0.9, h * 0.9)   # Bottom right
-        ]
+        field_corners = default_field_corners(sampled_frames['first'])
 
         # Set up perspective trasnformer with small frame
-        self.perspective_transformer.set_field_corners(small_frames[0], field_corners)
+        self.perspective_transformer.set_field_corners(self.downscale_frame(sampled_frames['first']), field_corners)
         
         print("Extracting team information...")
-        # Use the middle frame for team assignment
-        mid_frame = len(frames) // 2
-
-        
-        player_colors = extract_player_colors(frames[mid_frame], tracks, mid_frame)
-        team_assignments = assign_teams(player_colors)
-        self.team_colors = get_team_colors(player_colors, team_assignments)
+        # Fit once on the sampled colours, then vote a team per track
+        team_assignments = self.team_classifier.fit()
+        self.team_colors = self.team_classifier.team_colors()
         
         # Assign teams to all frames
-        for frame_num in range(len(frames)):
-            for player_id in tracks['Player'][frame_num].keys():
-                if player_id in team_assignments:
-                    tracks['Player'][frame_num][player_id]['team'] = team_assignments[player_id]
-                else:
-                    # Assign team based on colors in current frame
-
-                    # Inside process_video method
-                    if tracks['Player'] and frame_num < len(tracks['Player']):
-                    # Make sure tracks['Player'][frame_num] exists and is not empty
-                        if tracks['Player'][frame_num]:
-                            frame_colors = extract_player_colors(frames[frame_num], {
-                                'Player': {0: tracks['Player'][frame_num]}
-                            }, 0)
-                        else:
-                            frame = self.draw_ellipse(frame, player["bbox"], team_color, track_id)
-                    else:
-    # Handle the case when there are no tracks for this frame
-                        frame_colors = {}
-
-                        
-                        if player_id in frame_colors:
-                            # Find closest team color
-                            min_dist = float('inf')
-                            assigned_team = 0
-                            
-                            for team_id, team_color in self.team_colors.items():
-                                dist = np.linalg.norm(frame_colors[player_id] - team_color)
-                                if dist < min_dist:
-                                    min_dist = dist
-                                    assigned_team = team_id
-                            
-                            
-                            tracks['Player'][frame_num][player_id]['team'] = assigned_team
+        tracks.map_track_values('team', team_assignments)
         
         print("Calculating player velocities and distances...")
         # Scale factor is automatically considered in velocity calculations
-        # because we are using the upscaled bounding boxes in tracks
-
-        for frame_num in range(len(frames) - 1):
-            # Calculate velocities for this frame
-            # flow_vectors already accounts for scaling
-            velocities = calculate_player_velocity(
-                tracks, flow_vectors, self.perspective_transformer, 
-                frame_num, frame_rate=30.0
-            )
-            
-            # Update player velocities
-            for player_id, velocity in velocities.items():
-                if player_id in tracks['Player'][frame_num]:
-                    tracks['Player'][frame_num][player_id]['velocity'] = velocity
-            
-            # Update cumulative distances
-            tracks = update_player_distances(tracks, velocities, frame_num)
+        # because we are using the upscaled bounding boxes in tracks;
+        # camera motion is measured on small frames, so it is upscaled here
+        if camera_motion_mode == 'keyframes':
+            camera_motion = self.camera_motion_estimator.camera_motion(num_frames) / self.scale_factor
+        else:
+            camera_motion = camera_motion_per_frame(flow_vectors, num_frames, frame_skip) / flow_scale
+        # Kept so it can be saved with the tracks (see TrackFile)
+        self.camera_motion = camera_motion
+
+        # Whole-video pass: project, difference and accumulate every track at once
+        calculate_speed_and_distance(
+            tracks, self.perspective_transformer,
+            frame_rate=frame_rate, camera_motion=camera_motion
+        )
         
         return tracks
 
@@ -218,146 +310,16 @@ class Tracker:
 
 
     def draw_annotations(self, video_frames, tracks):
-        output_video_frames = []
-    
-        # Define modern color schemes for teams
-        team_colors = [
-            {"primary": (59, 89, 152), "secondary": (223, 227, 238)},    # Blue
-            {"primary": (176, 58, 46), "secondary": (241, 221, 219)},    # Red
-            {"primary": (46, 134, 87), "secondary": (221, 236, 230)}     # Green
-        ]
-            
-        # Referee color
-        ref_color = {"primary": (255, 204, 0), "secondary": (30, 30, 30)}
-            
-        # Font settings
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.3
-        font_thickness = 1
-            
-        # 1. Render at lower resolution for speed
-        scale = 0.5  # Render at half resolution
-            
-        for frame_num, frame in enumerate(video_frames):
-            # Downscale for faster rendering
-            small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
-            h, w = small_frame.shape[:2]
-                
-            # 2. Create a single annotation layer
-            annotation_layer = np.zeros((h, w, 3), dtype=np.uint8)
-                
-            player_dict = tracks['Player'][frame_num]
-            referee_dict = tracks['ref'][frame_num]
-
-            # 3. Batch drawing - first do all shapes, then all text
-            for track_id, player in player_dict.items():
-                # Scale down original bbox
-                bbox = [int(coord * scale) for coord in player["bbox"]]
-                x1, y1, x2, y2 = bbox
-                    
-                team_id = player.get('team', 0) % len(team_colors)
-                colors = team_colors[team_id]
-                    
-                # Create center point
-                x_center = int((x1 + x2) / 2)
-                width = int(x2 - x1)
-                    
-                # Just draw team-colored ellipse (skip shadow)
-                cv2.ellipse(
-                    annotation_layer,
-                    center=(x_center, y2),
-                    axes=(width, int(0.35*width)),
-                    angle=0.0,
-                    startAngle=-45,
-                    endAngle=235,
-                    color=(255, 255, 255),            # colors["primary"],
-                    thickness=2,
-                    lineType=cv2.LINE_8  # Faster than LINE_AA
-                )
-                    
-                # Draw text background all at once
-                velocity = player.get('velocity', 0.0)
-                distance = player.get('distance', 0.0)
-                info_text = f"ID:{track_id} {velocity:.1f}m/s {distance:.0f}m"
-                    
-                (text_width, text_height), _ = cv2.getTextSize(
-                    info_text, font, font_scale, font_thickness
-                )
-                    
-                # Draw text background directly on annotation layer
-                cv2.rectangle(
-                    annotation_layer, 
-                    (x1, y1-text_height-5), 
-                    (x1+text_width+5, y1), 
-                    colors["secondary"], 
-                    -1
-                )
-                    
-                # Store text info for batch processing
-                cv2.putText(
-                    annotation_layer, 
-                    info_text, 
-                    (x1+5, y1-5), 
-                    font, 
-                    font_scale, 
-                    (255, 0, 0),              # colors["primary"], 
-                    font_thickness, 
-                    cv2.LINE_8
-                )
-
-            # 4. Process all referees together
-            for track_id, referee in referee_dict.items():
-                bbox = [int(coord * scale) for coord in referee["bbox"]]
-                x1, y1, x2, y2 = bbox
-                    
-                x_center = int((x1 + x2) / 2)
-                width = int(x2 - x1)
-                    
-                # Simplify: just draw a single distinctive ellipse
-                cv2.ellipse(
-                    annotation_layer,
-                    center=(x_center, y2),
-                    axes=(width, int(0.35*width)),
-                    angle=0.0,
-                    startAngle=-45,
-                    endAngle=235,
-                    color=ref_color["primary"],
-                    thickness=2,
-                    lineType=cv2.LINE_8
-                )
-                    
-                # Basic referee label
-                ref_text = f"REF:{track_id}"
-                cv2.rectangle(
-                    annotation_layer, 
-                    (x1, y1-15), 
-                    (x1+70, y1), 
-                    (240, 240, 200), 
-                    -1
-                )
-                    
-                cv2.putText(
-                    annotation_layer, 
-                    ref_text, 
-                    (x1+5, y1-5), 
-                    font, 
-                    font_scale, 
-                    (0, 0, 0), 
-                    font_thickness, 
-                    cv2.LINE_8
-                )
-
-            # 5. Blend annotation layer with frame just once
-            alpha = 0.7
-            small_result = cv2.addWeighted(small_frame, 1.0, annotation_layer, alpha, 0)
-                
-            # 6. Upscale back to original resolution
-            result = cv2.resize(small_result, (frame.shape[1], frame.shape[0]))
-                
-            output_video_frames.append(result)
-            
-            # 7. Hardware acceleration for video encoding
-            # This happens in save_video, make sure to use hardware-accelerated codec
-        return output_video_frames
+        return list(self.iter_annotations(video_frames, tracks))
 
+    def iter_annotations(self, video_frames, tracks, num_workers=None):
+        """Yield annotated frames one at a time as video_frames is consumed
 
+        tracks can be a TrackStore or a TrackFile; a TrackFile is read one
+        chunk at a time as the frames go by. Frames are drawn at native
+        resolution on a thread pool (see AnnotationRenderer) and yielded in
+        order.
+        """
+        if self.renderer is None or (num_workers and num_workers != self.renderer.num_workers):
+            self.renderer = AnnotationRenderer(num_workers)
+        yield from self.renderer.iter_render(video_frames, tracks)
@@ -1,2 +1,2 @@
-from .video_utils import read_video, save_video
+from .video_utils import read_video, save_video, iter_video, iter_batches, get_video_info, VideoEncoder
 from .bbox_utils import get_bbox_width, get_center_of_bbox
\ No newline at end of file
@@ -1,45 +1,243 @@
 import cv2
+import functools
+import numpy as np
+import queue
+import shutil
+import subprocess
+import threading
 from pathlib import Path
+from itertools import islice
 
-def read_video(video_path):
+def get_video_info(video_path):
+    """Return fps, frame size and frame count of a video without decoding it"""
     cap = cv2.VideoCapture(video_path)
-    frames = []
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    info = {
+        'fps': cap.get(cv2.CAP_PROP_FPS) or 24.0,
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+    }
     cap.release()
-    return frames
+    return info
+
+def iter_video(video_path, start=0, stop=None, exact=False):
+    """Lazily decode frames [start, stop) of a video, one at a time
+
+    Seeking to start with CAP_PROP_POS_FRAMES can land a few frames off
+    (variable frame rate, B-frames, a bad index). With exact=True the
+    landing is checked against the first frame's timestamp and, when it is
+    off, the video is decoded from the beginning up to start instead.
+    """
+    cap = cv2.VideoCapture(video_path)
+    grabbed = False
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if exact:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            grabbed = cap.grab()
+            if not (grabbed and fps and abs(cap.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000 - start) < 0.5):
+                cap.release()
+                cap = cv2.VideoCapture(video_path)
+                for _ in range(start):
+                    if not cap.grab():
+                        break
+                grabbed = False
+    frame_num = start
+    try:
+        while cap.isOpened() and (stop is None or frame_num < stop):
+            if grabbed:
+                ret, frame = cap.retrieve()
+                grabbed = False
+            else:
+                ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+            frame_num += 1
+    finally:
+        cap.release()
+
+def iter_batches(iterable, batch_size):
+    """Group an iterable into lists of at most batch_size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def read_video(video_path):
+    return list(iter_video(video_path))
 
-def save_video(output_video_frames, output_video_path):
-    if not output_video_frames:
+@functools.lru_cache(maxsize=None)
+def ffmpeg_has_encoder(encoder='libx264'):
+    """True when the ffmpeg on the PATH can encode with encoder (probed once per process)"""
+    if not shutil.which('ffmpeg'):
+        return False
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    # Encoder lines look like " V....D libx264   libx264 H.264 / AVC / MPEG-4 AVC ..."
+    return result.returncode == 0 and any(line.split()[1:2] == [encoder] for line in result.stdout.splitlines())
+
+def save_video(output_video_frames, output_video_path, fps=None, source_video_path=None, backend='auto'):
+    """Write frames to a video file as they are produced.
+
+    output_video_frames can be a list or any iterable (e.g. a generator),
+    so frames are encoded one at a time and never held in memory together.
+    Encoding runs on a background thread (see VideoEncoder), so it overlaps
+    with producing the next frames. fps defaults to the fps of
+    source_video_path, or 24 without a source.
+    """
+    if fps is None:
+        fps = get_video_info(source_video_path)['fps'] if source_video_path else 24
+
+    frames = iter(output_video_frames)
+    first_frame = next(frames, None)
+    if first_frame is None:
         raise ValueError("No frames to save")
-    
-    # Get video dimensions from first frame
-    height, width = output_video_frames[0].shape[:2]
-    
-    # Create output directory if it doesn't exist
-    output_dir = Path(output_video_path).parent
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Use H264 codec for better compatibility
-    fourcc = cv2.VideoWriter_fourcc(*'H264')
-    
-    # Create video writer
-    out = cv2.VideoWriter(
-        output_video_path,
-        fourcc,
-        24,  # frame rate
-        (width, height)
-    )
-    
-    # Write frames
-    for frame in output_video_frames:
-        # Ensure frame dimensions match
-        if frame.shape[:2] != (height, width):
-            raise ValueError(f"Frame dimensions don't match: {frame.shape[:2]} != {(height, width)}")
-        out.write(frame)
-    
-    out.release()
-    print(f"Video saved to: {output_video_path}")
+
+    with VideoEncoder(output_video_path, fps, backend=backend) as encoder:
+        encoder.write(first_frame)
+        for frame in frames:
+            encoder.write(frame)
+    print(f"Video saved to: {output_video_path} ({encoder.backend}, {encoder.frames_written} frames)")
+
+
+class VideoEncoder:
+    def __init__(self, output_video_path, fps, size=None, backend='auto', queue_size=32, crf=23, preset='veryfast'):
+        """
+        Encode frames on a background thread, fed through a bounded queue
+
+        With an ffmpeg that has libx264 on the PATH, raw BGR frames are piped
+        into an ffmpeg process; otherwise cv2.VideoWriter is used with the
+        H264 fourcc. write() only blocks when queue_size frames are waiting, so
+        the producer keeps working while earlier frames are encoded.
+
+        Args:
+            output_video_path: Output file
+            fps: Output frame rate (use the source video's fps)
+            size: (width, height); taken from the first frame if None
+            backend: 'ffmpeg', 'cv2' or 'auto' (ffmpeg if installed with libx264)
+            queue_size: Frames buffered between write() and the encoder
+            crf: x264 quality for the ffmpeg backend
+            preset: x264 preset for the ffmpeg backend
+        """
+        if backend == 'auto':
+            backend = 'ffmpeg' if ffmpeg_has_encoder('libx264') else 'cv2'
+        if backend not in ('ffmpeg', 'cv2'):
+            raise ValueError(f"Unknown encoder backend: {backend}")
+        self.output_video_path = str(output_video_path)
+        self.fps = fps
+        self.size = size
+        self.backend = backend
+        self.crf = crf
+        self.preset = preset
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.error = None
+        self.frames_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def write(self, frame):
+        """Queue one BGR frame for encoding"""
+        if self.thread is None:
+            if self.size is None:
+                self.size = (frame.shape[1], frame.shape[0])
+            self._start()
+        if frame.shape[:2] != (self.size[1], self.size[0]):
+            raise ValueError(f"Frame dimensions don't match: {frame.shape[:2]} != {(self.size[1], self.size[0])}")
+        while True:
+            self._check()
+            try:
+                self.queue.put(frame, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """Flush the queue, wait for the encoder and raise any encoding error"""
+        if self.thread is not None:
+            while self.thread.is_alive():
+                try:
+                    self.queue.put(None, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            self.thread.join()
+            self.thread = None
+        self._check()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"Encoding {self.output_video_path} failed") from self.error
+
+    def _start(self):
+        # Create output directory if it doesn't exist
+        Path(self.output_video_path).parent.mkdir(parents=True, exist_ok=True)
+        target = self._encode_ffmpeg if self.backend == 'ffmpeg' else self._encode_cv2
+        self.thread = threading.Thread(target=self._run, args=(target,), daemon=True)
+        self.thread.start()
+
+    def _run(self, target):
+        try:
+            target()
+        except BaseException as error:
+            self.error = error
+            # Drain so a blocked write() or close() can notice the error
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _frames(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+            yield frame
+
+    def _encode_ffmpeg(self):
+        width, height = self.size
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-',
+            '-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf), '-pix_fmt', 'yuv420p',
+            self.output_video_path,
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            for frame in self._frames():
+                process.stdin.write(np.ascontiguousarray(frame).data)
+                self.frames_written += 1
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+
+    def _encode_cv2(self):
+        # Use H264 codec for better compatibility, mp4v where OpenCV has no H264 encoder
+        for codec in ('H264', 'mp4v'):
+            out = cv2.VideoWriter(self.output_video_path, cv2.VideoWriter_fourcc(*codec), self.fps, self.size)
+            if out.isOpened():
+                break
+        else:
+            raise RuntimeError(f"cv2.VideoWriter could not open {self.output_video_path}")
+        try:
+            for frame in self._frames():
+                out.write(frame)
+                self.frames_written += 1
+        finally:
+            out.release()